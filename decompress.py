@@ -1,22 +1,23 @@
 #!/usr/bin/env python
-import zlib
 import sys
 import os.path
 
+#stream_decompress.py lives in the python/ directory next to this script.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "python"))
+import stream_decompress
+
 '''
 * This program decompresses *.dsor or *.dsox files generated by Microsoft Spectrum Observatory and outputs 
 * Google Protobuffer data files. The outputted file can be further processed by using python scripts rawIQ_process.py or psdFile_process.py.
 * 
 * Usage : decompress.py target_file output_file(optional)
 * *** If output path is not specified, it will simply append ".uncompressed" to the end of the file name.
+* The file is inflated chunk by chunk (see python/stream_decompress.py), so neither the compressed nor the
+* decompressed data is held in memory as a whole; the throughput is printed at the end.
 *
 *Last-modified: Mar 24, 2017 (Kyeong Su Shin)
 '''
 
-#Decompress function
-def decompress (dat):
-	return zlib.decompress(dat,-15)
-
 #Check Args length
 if len(sys.argv) < 2:
 	print "Usage : decompress.py target_path (required) output_path (optional). "
@@ -39,14 +40,9 @@ if os.path.isdir(out_path):
 
 #Try decompression.
 try:
-	#Open, Decompress
-	f = open(sys.argv[1],"rb")
-	decompress_out = decompress (f.read())
-	f.close()
-	#Write result.
-	f_out = open(out_path,"wb")
-	f_out.write(decompress_out)
-	f_out.close()
+	#Open, Decompress and write the result, one chunk at a time.
+	stats = stream_decompress.decompress_file(sys.argv[1], out_path)
+	print "Decompression : " + stats.summary()
 
 #Exception - most likely due to wrong file type.
 except Exception as res:
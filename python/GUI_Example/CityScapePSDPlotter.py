@@ -6,13 +6,20 @@ import tkFileDialog
 import tkMessageBox
 import sys
 import argparse
-import psdFile_pb2
 import os.path
 import time
 import matplotlib.pyplot as plt
 import numpy as np
 import scipy.io as sio
-import zlib
+
+#shared modules (stream_decompress.py, psdFile_pb2.py, ...) live in the parent "python" directory.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import itertools
+import psdFile_pb2
+import psd_convert
+import psd_stats
+import stream_decompress
+import wire_format
 
 #Store processed data.
 class ProcessedData:
@@ -23,15 +30,13 @@ class ProcessedData:
 		self.freq_s = -1
 		self.freq_e = -1
 		self.freq = []
-		self.psd_avg_sum = []
-		self.psd_avg_sum_cnt = 0
+		self.block_range = None		#(StartFrequencyHz, StopFrequencyHz, number of bins) of the first data block
+		self.skipped_blocks = 0		#data blocks of another frequency range than the first one (not plotted)
+		self.statistics = psd_stats.PsdStatistics()		#per-bin statistics of each Reading Kind
+		self.psd_avg = []
 		self.psd_max = []
 		self.psd_min = []
 
-#Decompress (before parsing)
-def decompress (dat):
-	return zlib.decompress(dat,-15)
-
 #Converts "Reading Kind" enum to String.
 #("Reading Kind" enums is an enumeratation type used by the PSD scan file to identify the 
 #type of the data, such as "average observed power", "minimum observed power", or "maximum observed power".)
@@ -60,19 +65,11 @@ def get_reading_kind(reading_kind):
 #Converts the data (Q format fixed floating point) to the proper floating point decibel representation.
 #See https://en.wikipedia.org/wiki/Q_(number_format) for Q format.
 #The output data will be an array of floating point numbers representing power spectral density (in dB).
+#(vectorized, see psd_convert.py; Short.Min_VALUE = NaN for this particular implementation.)
 #input : numpy int[] of PSD data
-#output : double[] data
+#output : float[] data (column vector)
 def data_to_float_decibel(ary):
-	result = np.zeros((len(ary),1),dtype=np.float32)
-
-	for i in range(0, len(ary)-1):
-		#Fortunately, the expression will be almost always true (therefore performance drop from the branch hazard is negligible).
-		if ary[i] != -32768:	#Short.Min_VALUE = NaN (for this particular implementation).
-			result[i] = ary[i] / float(1<<7) #expected equation..
-		else:
-			result[i] = np.nan
-
-	return result
+	return psd_convert.q7_to_decibel(ary, dtype=np.float32).reshape(-1,1)
 
 #Determines the time scale used by the timestamp.
 #Must be multiplied to the timestamp to get second-scale time.
@@ -99,39 +96,36 @@ def determine_timescale(scale):
 	return time_scale
 
 #Stage 1
-#Calculate FFT size, start - end freq, etc.
-def process_stage1(data,pdinst):
+#Calculate FFT size, start - end freq, etc. (from the first data block, or None if the file has none)
+def process_stage1(data,first_block,pdinst):
 	pd.station_config = str(data.Config).replace("\\n","\n\t").replace("\\r","").replace("\\t","\t")
-	if len(data.SpectralPsdData) < 1:
+	if first_block is None:
 		raise Exception('0 Length Data')
 	else:
-		pd.data_length = len(data.SpectralPsdData[0].OutputDataPoints)
-		pd.freq_s = (data.SpectralPsdData[0].StartFrequencyHz)/1e6
-		pd.freq_e = (data.SpectralPsdData[0].StopFrequencyHz)/1e6
+		pd.data_length = len(first_block.OutputDataPoints)
+		pd.freq_s = (first_block.StartFrequencyHz)/1e6
+		pd.freq_e = (first_block.StopFrequencyHz)/1e6
 		pd.freq = np.transpose(np.linspace(pd.freq_s,pd.freq_e,pd.data_length))
-		pd.psd_avg_sum = np.zeros((pd.data_length,1),dtype=np.float32)
-		pd.psd_max = np.subtract (np.zeros((pd.data_length,1),dtype=np.float32) , float('inf'))
-		pd.psd_min = np.add (np.zeros((pd.data_length,1),dtype=np.float32) , float('inf'))
+		pd.block_range = (first_block.StartFrequencyHz,first_block.StopFrequencyHz,pd.data_length)
 		
 #Process the data points.
-def process_stage2(data,pd):
+#input : data blocks (iterated once, one block at a time), ProcessedData
+def process_stage2(data_blocks,pd):
 
 	#for each data block
-	for data_block in data.SpectralPsdData:				
+	for data_block in data_blocks:				
+		
+		#The first block sets the frequency axis (see process_stage1) : blocks of another frequency range or number of bins
+		#cannot share its bins, so they are counted and left out.
+		if (data_block.StartFrequencyHz,data_block.StopFrequencyHz,len(data_block.OutputDataPoints)) != pd.block_range:
+			pd.skipped_blocks += 1
+			continue
 		
 		#Convert data points from Q format to IEEE754 floating point.
-		#!!!!!slow part!!!!!
 		db_data = data_to_float_decibel(data_block.OutputDataPoints)
 				
-		#Assign data
-		reading_kind = data_block.Reading_Kind
-		if reading_kind == 0:	#Data is for Average
-			pd.psd_avg_sum_cnt = pd.psd_avg_sum_cnt  + 1
-			pd.psd_avg_sum = np.add(pd.psd_avg_sum,db_data)
-		elif reading_kind == 1:	#Data is for min hold
-			pd.psd_min = np.minimum(pd.psd_min,db_data)
-		elif reading_kind == 2:	#Data is for max hold
-			pd.psd_max = np.maximum(pd.psd_max,db_data)
+		#Accumulate the per-bin statistics of the block's Reading Kind (mean / variance / min / max, see psd_stats.py).
+		pd.statistics.add_block(data_block,db_data.ravel())
 		
 		#plot the result (if requested).
 		#if plot_psd == cnt or plot_psd == 0:
@@ -142,6 +136,13 @@ def process_stage2(data,pd):
 		#	plt.ylabel('PSD (dB)')
 		#	plt.show()
 
+	#Average of the Average blocks, min hold of the Minimum blocks, max hold of the Maximum blocks (column vectors).
+	pd.psd_avg = pd.statistics.get(0,pd.data_length).average().reshape(-1,1)
+	pd.psd_min = pd.statistics.get(1,pd.data_length).min.reshape(-1,1)
+	pd.psd_max = pd.statistics.get(2,pd.data_length).max.reshape(-1,1)
+	if pd.skipped_blocks > 0:
+		print "Skipped " + str(pd.skipped_blocks) + " data blocks of another frequency range than " + str(pd.freq_s) + " - " + str(pd.freq_e) + " MHz (" + str(pd.data_length) + " bins)."
+
 #Plots PSD (tk button callback)
 def plot_psd(pd,start,end,ymin,ymax,plot_min,plot_avg,plot_max):
 	try:		
@@ -160,7 +161,7 @@ def plot_psd(pd,start,end,ymin,ymax,plot_min,plot_avg,plot_max):
 		
 		plt.figure()
 		if(plot_avg):
-			plt.plot(pd.freq[array_pos_start:array_pos_end+1],pd.psd_avg_sum[array_pos_start:array_pos_end+1] / pd.psd_avg_sum_cnt, 'b', label="Average")
+			plt.plot(pd.freq[array_pos_start:array_pos_end+1],pd.psd_avg[array_pos_start:array_pos_end+1], 'b', label="Average")
 		if(plot_max):
 			plt.plot(pd.freq[array_pos_start:array_pos_end+1],pd.psd_max[array_pos_start:array_pos_end+1] , 'r', label="Max Hold")
 		if(plot_min):
@@ -198,7 +199,7 @@ def export_mat(pd,start,end,ymin,ymax):
 		afn['filetypes'] = [('Matlab Data File','.mat')]
 		fpath = tkFileDialog.asksaveasfilename(**afn)
 		
-		sio.savemat(fpath,{'Freq':pd.freq[array_pos_start:array_pos_end+1],'Avg':pd.psd_avg_sum[array_pos_start:array_pos_end+1] / pd.psd_avg_sum_cnt , 'Max_Hold':pd.psd_max[array_pos_start:array_pos_end+1] ,'Min_Hold':pd.psd_min[array_pos_start:array_pos_end+1]})	
+		sio.savemat(fpath,{'Freq':pd.freq[array_pos_start:array_pos_end+1],'Avg':pd.psd_avg[array_pos_start:array_pos_end+1] , 'Max_Hold':pd.psd_max[array_pos_start:array_pos_end+1] ,'Min_Hold':pd.psd_min[array_pos_start:array_pos_end+1]})	
 		
 	except Exception as a:
 		tkMessageBox.showinfo(message="Export failed (Check your inputs arguments). Exception Message : " + str(a))
@@ -229,26 +230,19 @@ afn['filetypes'] = [('Cityscape Aggregated PSD File','.dsox')]
 fpath = tkFileDialog.askopenfilename(**afn)
 
 
-#open file.
-f = open(fpath,"rb");
+#Open the file. The format (compressed or not) is detected from the leading bytes; compressed files are inflated chunk by chunk while reading.
+f_stream, input_format = stream_decompress.open_data_stream(fpath)
 
-#Attempt decompression. If fails, assume decompressed data and just push that into the Protobuf decoder.
-f_str = f.read()
-f.close()
-try:
-	decompress_out = decompress (f_str)
-	f_str = decompress_out
-except Exception:
-	pass
-	
-#Parse.
-scan_file_read = psdFile_pb2.ScanFile()
-scan_file_read.ParseFromString(f_str)
+#Parse, one data block at a time (the file is never held in memory as a whole).
+scan_file_read = wire_format.ScanFileReader(f_stream)
+data_blocks = scan_file_read.SpectralPsdData
+first_block = next(data_blocks, None)
 
 #process.
 pd = ProcessedData()
-process_stage1(scan_file_read,pd)
-process_stage2(scan_file_read,pd)
+process_stage1(scan_file_read,first_block,pd)
+process_stage2(itertools.chain([first_block],data_blocks),pd)
+f_stream.close()
 
 #display config string
 config_text = Text(tab2)
@@ -306,6 +300,8 @@ butt.grid(row=5,column=1)
 #Display some properties
 Label(tab1, text = "Start Freq (MHz):"+str(pd.freq_s)+"   ").grid(row=6,column=0,sticky="W")
 Label(tab1, text = "End Freq (MHz):"+str(pd.freq_e)+"   ").grid(row=6,column=1,sticky="W")
+Label(tab1, text = "Input format counts:"+stream_decompress.format_counts_summary()+"   ").grid(row=6,column=2,sticky="W")
+Label(tab1, text = "Skipped blocks (other frequency range):"+str(pd.skipped_blocks)+"   ").grid(row=6,column=3,sticky="W")
 
 sensor_cnt = 1
 
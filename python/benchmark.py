@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+
+#Micro-benchmarks of the decoding / conversion paths used by psdFile_process.py and rawIQ_process.py.
+#Each benchmark checks that the compared paths produce the same values before reporting their speed.
+
+#Usage : python benchmark.py psd-decode target_file
+#         (PSD scan file, compressed or not; compares the psdFile_pb2 path with the NumPy zigzag-varint decoder)
+#        python benchmark.py psd-backends target_file / python benchmark.py iq-backends target_file
+#         (PSD scan file / RAW IQ file; checks that every available decoding backend (decode_backends.py) decodes
+#          the file bit-for-bit identically, and reports their speed)
+#        python benchmark.py iq-csv target_file
+#         (RAW IQ file; writes a snapshot of at least IQ_CSV_SAMPLES samples, made of the file's samples, to CSV with
+#          the per-sample write loop, with csv_export.IqCsvWriter in exact mode (checks that the outputs match) and with
+#          its default precision (checks the values against the exact ones), and reports samples/s)
+#        python benchmark.py iq-complex target_file
+#         (RAW IQ file; builds the complex samples of every snapshot with the list comprehension rawIQ_process.py used
+#          to use, as a complex128 view and as complex64, checks the values and reports speed and memory per snapshot)
+#Requirements: Python 2.7 with Protoc Python bindings and NumPy.
+
+import argparse
+import os
+import tempfile
+import timeit
+import numpy as np
+import csv_export
+import decode_backends
+import psdFile_pb2
+import stream_decompress
+import wire_format
+
+#Number of samples of the snapshot written by the iq-csv benchmark.
+IQ_CSV_SAMPLES = 4000000
+
+#Read every serialized data block of a file into memory (so that only decoding is timed).
+#input : path of the input file, reader class (wire_format.ScanFileReader / wire_format.RawIqFileReader)
+#output : list of serialized data blocks
+def load_block_payloads(path, reader_class):
+	f_stream, input_format = stream_decompress.open_data_stream(path)
+	payloads = [payload for offset, payload in reader_class(f_stream).iter_block_payloads()]
+	f_stream.close()
+	return payloads
+
+#Time a function over every payload, "repeat" times, and keep the best run.
+#output : (best time in seconds, result of the last run)
+def time_over_payloads(fn, payloads, repeat):
+	best = float("inf")
+	result = None
+	for i in range(repeat):
+		start = timeit.default_timer()
+		result = [fn(payload) for payload in payloads]
+		best = min(best, timeit.default_timer() - start)
+	return best, result
+
+#Print one result line.
+def report(name, elapsed, blocks, points):
+	print "%-28s %8.3fs %12.1f blocks/s %14.1f points/s" % (name, elapsed, blocks / elapsed, points / elapsed)
+
+#OutputDataPoints decoding : psdFile_pb2 (list of Python ints) vs. vectorized zigzag-varint decoder (int16 ndarray).
+def bench_psd_decode(path, repeat):
+	payloads = load_block_payloads(path, wire_format.ScanFileReader)
+
+	def decode_pb2(payload):
+		data_block = psdFile_pb2.SpectralPsdDataBlock()
+		data_block.ParseFromString(payload)
+		return np.array(data_block.OutputDataPoints, dtype=wire_format.PSD_DTYPE)
+
+	def decode_numpy(payload):
+		return wire_format.parse_psd_block(payload).OutputDataPoints
+
+	t_pb2, ref = time_over_payloads(decode_pb2, payloads, repeat)
+	t_numpy, out = time_over_payloads(decode_numpy, payloads, repeat)
+	for a, b in zip(ref, out):
+		if not np.array_equal(a, b):
+			raise Exception("Decoded values differ between the psdFile_pb2 path and the NumPy decoder.")
+
+	points = sum(len(a) for a in ref)
+	report("psdFile_pb2", t_pb2, len(payloads), points)
+	report("numpy zigzag decoder", t_numpy, len(payloads), points)
+	print "speed-up : %.1fx" % (t_pb2 / t_numpy)
+
+#Decoding backends (decode_backends.py) : conformance (same metadata and same data point bytes for every block) and speed.
+#input : path, reader class, name of the backend parse method ("parse_psd" / "parse_iq"), name of the data points attribute, repeat
+def compare_backends(path, reader_class, parse_name, points_name, repeat):
+	payloads = load_block_payloads(path, reader_class)
+	print "protobuf runtime : " + decode_backends.PROTOBUF_RUNTIME
+
+	results = []
+	for backend in decode_backends.available_backends():
+		elapsed, blocks = time_over_payloads(getattr(backend, parse_name), payloads, repeat)
+		results.append((backend, elapsed, [(b.meta.SerializeToString(), getattr(b, points_name).tostring()) for b in blocks]))
+
+	reference_backend, reference = results[0][0], results[0][2]
+	for backend, elapsed, decoded in results[1:]:
+		for block_number, (a, b) in enumerate(zip(reference, decoded), 1):
+			if a[0] != b[0]:
+				raise Exception("Block %d : metadata differs between the %s and %s backends." % (block_number, reference_backend.name, backend.name))
+			if a[1] != b[1]:
+				raise Exception("Block %d : data points differ between the %s and %s backends." % (block_number, reference_backend.name, backend.name))
+	print "%d blocks decoded identically by : %s" % (len(payloads), ", ".join(backend.name for backend, elapsed, decoded in results))
+
+	points = sum(len(getattr(b, points_name)) for b in time_over_payloads(getattr(reference_backend, parse_name), payloads, 1)[1])
+	for backend, elapsed, decoded in sorted(results, key=lambda result: result[1]):
+		report(backend.name, elapsed, len(payloads), points)
+
+def bench_psd_backends(path, repeat):
+	compare_backends(path, wire_format.ScanFileReader, "parse_psd", "OutputDataPoints", repeat)
+
+def bench_iq_backends(path, repeat):
+	compare_backends(path, wire_format.RawIqFileReader, "parse_iq", "DataPoints", repeat)
+
+#RAW IQ CSV dump : per-sample write loop (as rawIQ_process.py used to do) vs. csv_export.IqCsvWriter.
+def bench_iq_csv(path, repeat):
+	payloads = load_block_payloads(path, wire_format.RawIqFileReader)
+	data_points = np.concatenate([wire_format.parse_iq_block(payload).DataPoints for payload in payloads])
+	data_points = np.tile(data_points, -(-2 * IQ_CSV_SAMPLES // len(data_points)))
+	samples = len(data_points) // 2
+	handle, csv_path = tempfile.mkstemp(suffix=".csv")
+	os.close(handle)
+
+	def write_loop():
+		f_write_csv = open(csv_path, "w")
+		re = data_points[0::2]
+		im = data_points[1::2]
+		for i in xrange(0, samples):
+			f_write_csv.write(str(re[i])+","+str(im[i])+"\n")
+		f_write_csv.close()
+
+	def write_bulk(precision):
+		iq_writer = csv_export.IqCsvWriter(csv_path, precision)
+		iq_writer.write_samples(data_points)
+		iq_writer.close()
+
+	try:
+		t_loop = min(timeit.repeat(write_loop, number=1, repeat=repeat))
+		with open(csv_path) as f:
+			reference = f.read()
+		t_exact = min(timeit.repeat(lambda: write_bulk(None), number=1, repeat=repeat))
+		with open(csv_path) as f:
+			if f.read() != reference:
+				raise Exception("The CSV written by csv_export.IqCsvWriter (exact) differs from the per-sample write loop.")
+		t_default = min(timeit.repeat(lambda: write_bulk(csv_export.DEFAULT_IQ_PRECISION), number=1, repeat=repeat))
+		values = np.loadtxt(csv_path, delimiter=",").ravel()
+		tolerance = 10.0 ** (1 - csv_export.DEFAULT_IQ_PRECISION)
+		if not np.allclose(values, data_points[:len(values)], rtol=tolerance, atol=0) or len(values) != 2 * samples:
+			raise Exception("The CSV written by csv_export.IqCsvWriter (default precision) does not match the samples.")
+	finally:
+		os.remove(csv_path)
+
+	print "snapshot of %d samples" % samples
+	for name, elapsed in (("per-sample write loop", t_loop), ("IqCsvWriter (exact)", t_exact), ("IqCsvWriter (%d digits)" % csv_export.DEFAULT_IQ_PRECISION, t_default)):
+		print "%-28s %8.3fs %14.1f samples/s" % (name, elapsed, samples / elapsed)
+	print "speed-up of the default export : %.1fx over the per-sample write loop, %.1fx over the exact values" % (t_loop / t_default, t_exact / t_default)
+
+#Complex samples of the snapshots : slices + [x*1j for x in ...] + map(add, ...) (as rawIQ_process.py used to do)
+#vs. IqDataBlock.complex_samples() (complex128 view, complex64 conversion).
+def bench_iq_complex(path, repeat):
+	payloads = load_block_payloads(path, wire_format.RawIqFileReader)
+	data_blocks = [wire_format.parse_iq_block(payload) for payload in payloads]
+	points = sum(len(data_block.DataPoints) // 2 for data_block in data_blocks)
+
+	def build_lists(data_block):
+		data_block_i = data_block.DataPoints[0::2]
+		data_block_q = [x*1j for x in data_block.DataPoints[1::2]]
+		return np.array(map(lambda i, q: i + q, data_block_i, data_block_q))
+
+	t_lists, reference = time_over_payloads(build_lists, data_blocks, repeat)
+	t_view, view_samples = time_over_payloads(lambda data_block: data_block.complex_samples(), data_blocks, repeat)
+	t_single, single_samples = time_over_payloads(lambda data_block: data_block.complex_samples(wire_format.IQ_COMPLEX64_DTYPE), data_blocks, repeat)
+	for samples, single in zip(reference, zip(view_samples, single_samples)):
+		if not np.array_equal(samples, single[0]) or not np.array_equal(samples.astype(np.complex64), single[1]):
+			raise Exception("The complex samples differ from the list comprehension.")
+
+	report("list comprehension", t_lists, len(data_blocks), points)
+	report("complex128 view", t_view, len(data_blocks), points)
+	report("complex64", t_single, len(data_blocks), points)
+	print "memory per snapshot : complex128 %d bytes (view of DataPoints), complex64 %d bytes" % (view_samples[0].nbytes, single_samples[0].nbytes)
+
+#--------------------------------------------------
+# Main routine (int main() equivalent)
+#--------------------------------------------------
+
+BENCHMARKS = {"psd-decode" : bench_psd_decode, "psd-backends" : bench_psd_backends, "iq-backends" : bench_iq_backends, "iq-csv" : bench_iq_csv, "iq-complex" : bench_iq_complex}
+
+parser = argparse.ArgumentParser()
+parser.add_argument("benchmark", choices=sorted(BENCHMARKS.keys()), help="benchmark to run")
+parser.add_argument("path", help="input file path")
+parser.add_argument("-n", "--repeat", type=int, default=3, help="number of runs (the best run is reported)")
+args = parser.parse_args()
+
+BENCHMARKS[args.benchmark](args.path, args.repeat)
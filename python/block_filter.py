@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+
+#Block filters (time range, frequency range, ReadingKind) for CityScape PSD scan files and RAW IQ files.
+#The filters are checked against the block metadata before the data points are decoded : the streaming readers
+#(wire_format.py) read the fields written before the data points (Time_stamp, StartFrequencyHz, StopFrequencyHz,
+#Reading_Kind) and skip the rest of a block that does not match using its length; with a block index
+#(block_index.py), non-matching blocks are not read at all.
+
+#Usage (library) :
+#	maximum_tv_band = block_filter.BlockFilter(since=1420070400, freq_min=470e6, freq_max=698e6, reading_kinds=[2])
+#	for data_block in block_filter.read_filtered_blocks(path, wire_format.ScanFileReader, maximum_tv_band): ...
+#Requirements: Python 2.7 with Protoc Python bindings and NumPy.
+
+import calendar
+import time
+import numpy as np
+import file_summary
+import stream_decompress
+import wire_format
+
+#Field numbers of the metadata checked by the filters (same in SpectralPsdDataBlock and SpectralIqDataBlock).
+FIELD_TIME_STAMP = 1
+FIELD_START_FREQUENCY = 2
+FIELD_STOP_FREQUENCY = 3
+FIELD_READING_KIND = 4		#SpectralPsdDataBlock only
+
+#Accepted formats of --since / --until (UTC), besides POSIX timestamps.
+TIME_FORMATS = ["%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"]
+
+#Time range [since, until] (POSIX timestamps, seconds), frequency range [freq_min, freq_max] (Hz; a block matches if
+#its StartFrequencyHz..StopFrequencyHz overlaps the range) and set of ReadingKind values. None : no constraint.
+class BlockFilter:
+
+	def __init__(self, since=None, until=None, freq_min=None, freq_max=None, reading_kinds=None):
+		self.since = since
+		self.until = until
+		self.freq_min = freq_min
+		self.freq_max = freq_max
+		self.reading_kinds = None
+		if reading_kinds is not None:
+			self.reading_kinds = set(reading_kinds)
+
+		#block fields the filter looks at.
+		self.fields = set()
+		if since is not None or until is not None:
+			self.fields.add(FIELD_TIME_STAMP)
+		if freq_max is not None:
+			self.fields.add(FIELD_START_FREQUENCY)
+		if freq_min is not None:
+			self.fields.add(FIELD_STOP_FREQUENCY)
+		if self.reading_kinds is not None:
+			self.fields.add(FIELD_READING_KIND)
+
+	#Check the metadata of one block.
+	#input : SpectralPsdDataBlock / SpectralIqDataBlock (or PsdDataBlock / IqDataBlock)
+	#output : True if the block matches.
+	def match(self, meta):
+		if FIELD_TIME_STAMP in self.fields:
+			timestamp = wire_format.timestamp_seconds(meta.Time_stamp)
+			if self.since is not None and timestamp < self.since:
+				return False
+			if self.until is not None and timestamp > self.until:
+				return False
+		if self.freq_max is not None and meta.StartFrequencyHz > self.freq_max:
+			return False
+		if self.freq_min is not None and meta.StopFrequencyHz < self.freq_min:
+			return False
+		if self.reading_kinds is not None and getattr(meta, "Reading_Kind", None) not in self.reading_kinds:
+			return False
+		return True
+
+	#Select the matching blocks of a block index, without reading the data file.
+	#input : numpy array of block_index.INDEX_DTYPE records
+	#output : list of matching block numbers (1-based)
+	def select(self, records):
+		mask = np.ones(len(records), np.bool_)
+		if self.since is not None:
+			mask &= records["timestamp"] >= self.since
+		if self.until is not None:
+			mask &= records["timestamp"] <= self.until
+		if self.freq_max is not None:
+			mask &= records["start_freq"] <= self.freq_max
+		if self.freq_min is not None:
+			mask &= records["stop_freq"] >= self.freq_min
+		if self.reading_kinds is not None:
+			mask &= np.in1d(records["reading_kind"], list(self.reading_kinds))
+		return [int(n) + 1 for n in np.flatnonzero(mask)]
+
+#Read the data blocks of a file that match a filter.
+#input : path, reader class (wire_format.ScanFileReader / wire_format.RawIqFileReader), BlockFilter, use_mmap (memory-map uncompressed files).
+#output : generator of PsdDataBlock / IqDataBlock (with their 1-based block_number).
+def read_filtered_blocks(path, reader_class, block_filter, use_mmap=False):
+	f_stream, input_format = stream_decompress.open_data_stream(path, use_mmap=use_mmap)
+	try:
+		for data_block in reader_class(f_stream, block_filter).iter_blocks():
+			yield data_block
+	finally:
+		f_stream.close()
+
+#Parse a --since / --until argument : POSIX timestamp, or UTC date and time (see TIME_FORMATS).
+#output : POSIX timestamp (seconds)
+def parse_time(text):
+	try:
+		return float(text)
+	except ValueError:
+		pass
+	for time_format in TIME_FORMATS:
+		try:
+			return calendar.timegm(time.strptime(text, time_format))
+		except ValueError:
+			continue
+	raise ValueError("Unrecognized time : " + text + " (expected a POSIX timestamp or YYYY-MM-DD[ HH:MM[:SS]], UTC)")
+
+#Parse a --reading-kind argument : ReadingKind number or name (case and spaces ignored, e.g. "maximum", "StdDevOfAverage").
+#output : ReadingKind enum value
+def parse_reading_kind(text):
+	key = text.replace(" ", "").lower()
+	for reading_kind, name in file_summary.READING_KIND_NAMES.items():
+		if str(reading_kind) == key or name.replace(" ", "").lower() == key:
+			return reading_kind
+	raise ValueError("Unrecognized ReadingKind : " + text)
+
+#Add the filter options to an argument parser.
+#input : argparse.ArgumentParser, reading_kind (add --reading-kind; PSD files only)
+def add_filter_arguments(parser, reading_kind=True):
+	parser.add_argument("--since", help="Only process blocks with a timestamp at or after SINCE (POSIX timestamp or YYYY-MM-DD[ HH:MM[:SS]], UTC).")
+	parser.add_argument("--until", help="Only process blocks with a timestamp at or before UNTIL (POSIX timestamp or YYYY-MM-DD[ HH:MM[:SS]], UTC).")
+	parser.add_argument("--freq-min", type=float, help="Only process blocks whose frequency range reaches FREQ_MIN (MHz) or above.")
+	parser.add_argument("--freq-max", type=float, help="Only process blocks whose frequency range reaches FREQ_MAX (MHz) or below.")
+	if reading_kind:
+		parser.add_argument("--reading-kind", nargs="+", help="Only process blocks of these ReadingKinds (names, e.g. Maximum, or enum values).")
+
+#Build the filter given on the command line (see add_filter_arguments()).
+#output : BlockFilter, or None if no filter option was given.
+def filter_from_args(args):
+	since = until = freq_min = freq_max = reading_kinds = None
+	if args.since is not None:
+		since = parse_time(args.since)
+	if args.until is not None:
+		until = parse_time(args.until)
+	if args.freq_min is not None:
+		freq_min = args.freq_min * 1e6
+	if args.freq_max is not None:
+		freq_max = args.freq_max * 1e6
+	if getattr(args, "reading_kind", None) is not None:
+		reading_kinds = [parse_reading_kind(text) for text in args.reading_kind]
+	block_filter = BlockFilter(since, until, freq_min, freq_max, reading_kinds)
+	if len(block_filter.fields) == 0:
+		return None
+	return block_filter
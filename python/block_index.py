@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+
+#Sidecar block-offset index for CityScape PSD scan files and RAW IQ files.
+#The index records, for every SpectralPsdData / SpectralIqData entry, where its serialized block starts
+#in the (decompressed) file together with its timestamp, frequencies, ReadingKind and point count.
+#It is stored next to the data file (<file>.idx), or in a cache directory if the data file's directory cannot be
+#written (or only kept in memory if neither can), and lets the readers seek straight to the requested blocks
+#instead of parsing every block before them.
+
+#Index file layout (little-endian) :
+#	header : magic "CSBIDX01", file kind (0 = PSD, 1 = RAW IQ), size and mtime of the indexed file,
+#	         offset and length of the serialized Config, number of records.
+#	records : INDEX_DTYPE, one per data block, in file order.
+#Offsets are positions in the decompressed protobuf stream. Uncompressed files are read with a seek;
+#compressed files still have to be inflated up to the block (but nothing before it is parsed), unless a
+#deflate checkpoint index (deflate_index.py) is given, in which case inflating resumes at the closest checkpoint.
+
+#Usage (library) :
+#	index = block_index.load_or_build_index(path, block_index.KIND_PSD)
+#	for block_number, data_block in block_index.read_blocks(path, index, [10, 250]): ...
+#Requirements: Python 2.7 with Protoc Python bindings and NumPy.
+
+import os.path
+import struct
+import numpy as np
+import deflate_index
+import stream_decompress
+import wire_format
+
+#File kinds.
+KIND_PSD = 0
+KIND_IQ = 1
+
+#Suffix of the sidecar index file.
+INDEX_SUFFIX = ".idx"
+
+INDEX_MAGIC = b"CSBIDX01"
+
+#magic, kind, indexed file size, indexed file mtime, Config offset, Config length, number of records.
+_HEADER = struct.Struct("<8sB7xQdqQQ")
+
+#One record per data block.
+INDEX_DTYPE = np.dtype([
+	("offset", "<u8"),			#offset of the serialized block in the decompressed stream
+	("length", "<u4"),			#length of the serialized block (bytes)
+	("timestamp", "<f8"),		#POSIX timestamp (seconds)
+	("start_freq", "<f8"),		#StartFrequencyHz
+	("stop_freq", "<f8"),		#StopFrequencyHz
+	("center_freq", "<f8"),		#CenterFrequencyHz (RAW IQ), (start + stop) / 2 (PSD)
+	("reading_kind", "i1"),		#Reading_Kind (PSD), -1 (RAW IQ)
+	("point_count", "<u4"),		#number of PSD values / IQ samples
+])
+
+#Per-kind reader class, block parser, number of wire values per data point and Config class.
+_READERS = {
+	KIND_PSD : (wire_format.ScanFileReader, wire_format.parse_psd_block, 1, wire_format.psdFile_pb2.ConfigDataBlock),
+	KIND_IQ : (wire_format.RawIqFileReader, wire_format.parse_iq_block, 2, wire_format.rawIQ_pb2.ConfigDataBlock),
+}
+
+#Block-offset index of one data file.
+class BlockIndex:
+
+	def __init__(self, kind, records, source_size, source_mtime, config_offset, config_length):
+		self.kind = kind
+		self.records = records				#numpy array of INDEX_DTYPE
+		self.source_size = source_size
+		self.source_mtime = source_mtime
+		self.config_offset = config_offset	#-1 if the file has no Config
+		self.config_length = config_length
+		self.path = None					#sidecar file it was loaded from / saved to (None : in memory only)
+
+	def __len__(self):
+		return len(self.records)
+
+#Path of the sidecar index of a data file (next to it, or in a cache directory, see stream_decompress.sidecar_path()).
+def index_path(path, cache_dir=None):
+	return stream_decompress.sidecar_path(path, INDEX_SUFFIX, cache_dir)
+
+#Build the index of a data file in one pass. Data points are skipped (RAW IQ) or only counted (PSD), never decoded.
+#input : path of the data file, KIND_PSD / KIND_IQ
+#output : BlockIndex
+def build_index(path, kind):
+	reader_class, values_per_point = _READERS[kind][0], _READERS[kind][2]
+	f_stream, input_format = stream_decompress.open_data_stream(path)
+	try:
+		reader = reader_class(f_stream)
+		rows = []
+		for m in reader.iter_block_metadata():
+			meta = m.meta
+			if kind == KIND_PSD:
+				center_freq = (meta.StartFrequencyHz + meta.StopFrequencyHz) / 2
+				reading_kind = meta.Reading_Kind
+			else:
+				center_freq = meta.CenterFrequencyHz
+				reading_kind = -1
+			rows.append((m.offset, m.length, wire_format.timestamp_seconds(meta.Time_stamp), meta.StartFrequencyHz, meta.StopFrequencyHz, center_freq, reading_kind, m.value_count // values_per_point))
+	finally:
+		f_stream.close()
+
+	config_offset = reader.config_offset
+	if config_offset is None:
+		config_offset = -1
+	return BlockIndex(kind, np.array(rows, INDEX_DTYPE), os.path.getsize(path), os.path.getmtime(path), config_offset, reader.config_length)
+
+#Write an index to a sidecar file.
+def save_index(index, idx_path):
+	f = open(idx_path, "wb")
+	try:
+		f.write(_HEADER.pack(INDEX_MAGIC, index.kind, index.source_size, index.source_mtime, index.config_offset, index.config_length, len(index.records)))
+		f.write(index.records.astype(INDEX_DTYPE, copy=False).tostring())
+	finally:
+		f.close()
+
+#Read an index from a sidecar file.
+def load_index(idx_path):
+	f = open(idx_path, "rb")
+	try:
+		header = f.read(_HEADER.size)
+		if len(header) != _HEADER.size:
+			raise ValueError("Truncated block index : " + idx_path)
+		magic, kind, source_size, source_mtime, config_offset, config_length, count = _HEADER.unpack(header)
+		if magic != INDEX_MAGIC:
+			raise ValueError("Not a block index : " + idx_path)
+		records = np.fromfile(f, INDEX_DTYPE, count)
+		if len(records) != count:
+			raise ValueError("Truncated block index : " + idx_path)
+	finally:
+		f.close()
+	return BlockIndex(kind, records, source_size, source_mtime, config_offset, config_length)
+
+#Check whether an index still matches its data file (same size and modification time).
+def is_current(index, path):
+	return index.source_size == os.path.getsize(path) and index.source_mtime == os.path.getmtime(path)
+
+#Load the sidecar index of a data file, or build (and save) it if it is missing or out of date.
+#It is saved next to the data file, or in cache_dir if that directory cannot be written; if neither can be written,
+#the index is built for this run only (its "path" is then None).
+#input : path of the data file, KIND_PSD / KIND_IQ, cache directory (optional).
+#output : BlockIndex
+def load_or_build_index(path, kind, cache_dir=None):
+	return stream_decompress.load_or_build_sidecar(path, INDEX_SUFFIX, cache_dir, load_index,
+		lambda index: index.kind == kind and is_current(index, path), lambda: build_index(path, kind), save_index)
+
+#Describe where an index was loaded from / saved to, for the CLIs.
+#input : BlockIndex (or deflate_index.CheckpointIndex), path of the data file.
+#output : string
+def describe_location(index, path):
+	if index.path is None:
+		return "in memory only : neither " + os.path.dirname(os.path.abspath(path)) + " nor the index directory (--index-dir) can be written"
+	return index.path
+
+#Open a data file positioned at a decompressed offset, through the checkpoint index if there is one.
+#output : reader (see stream_decompress.open_data_stream)
+def _open_at(path, offset, checkpoints=None, use_mmap=False):
+	if checkpoints is not None:
+		return deflate_index.open_at(path, checkpoints, offset)
+	f_stream, input_format = stream_decompress.open_data_stream(path, use_mmap=use_mmap)
+	f_stream.seek(offset)
+	return f_stream
+
+#Read the Config of a data file, using the offset recorded in its index.
+#input : path of the data file, BlockIndex, deflate_index.CheckpointIndex (raw deflate files only, optional)
+#output : ConfigDataBlock (empty if the file has none)
+def read_config(path, index, checkpoints=None):
+	config = _READERS[index.kind][3]()
+	if index.config_offset < 0:
+		return config
+	f_stream = _open_at(path, index.config_offset, checkpoints)
+	try:
+		config.ParseFromString(wire_format.read_exact(f_stream, index.config_length))
+	finally:
+		f_stream.close()
+	return config
+
+#Read selected data blocks of a data file, seeking straight to them with the index.
+#With a checkpoint index, a compressed file is reopened at the closest checkpoint whenever that is closer to the next
+#block than the current position.
+#input : path of the data file, BlockIndex, block numbers (1-based, as printed by the CLIs), use_mmap (memory-map uncompressed files),
+#        deflate_index.CheckpointIndex (raw deflate files only, optional), block parser (optional, e.g. a decode_backends.py backend's
+#        parse_psd / parse_iq; wire_format.parse_psd_block / parse_iq_block by default).
+#output : generator of (block number, PsdDataBlock / IqDataBlock), in block number order.
+def read_blocks(path, index, block_numbers, use_mmap=False, checkpoints=None, parse_block=None):
+	if parse_block is None:
+		parse_block = _READERS[index.kind][1]
+	block_numbers = sorted(set(block_numbers))
+	for block_number in block_numbers:
+		if block_number < 1 or block_number > len(index.records):
+			raise ValueError("Block %d not found (the file has %d blocks)." % (block_number, len(index.records)))
+
+	f_stream = None
+	try:
+		for block_number in block_numbers:
+			record = index.records[block_number - 1]
+			offset = int(record["offset"])
+			if f_stream is None or checkpoints is not None and checkpoints.find(offset).out > f_stream.tell():
+				if f_stream is not None:
+					f_stream.close()
+				f_stream = _open_at(path, offset, checkpoints, use_mmap)
+			f_stream.seek(offset)
+			if hasattr(f_stream, "read_view"):
+				payload = f_stream.read_view(int(record["length"]))
+			else:
+				payload = wire_format.read_exact(f_stream, int(record["length"]))
+			yield block_number, parse_block(payload)
+	finally:
+		if f_stream is not None:
+			f_stream.close()
+
+#Streaming-reader look-alike (Config + data blocks) over selected blocks of a data file, read through the index.
+#Each data block carries its 1-based "block_number".
+class IndexedFile(object):
+
+	def __init__(self, path, index, block_numbers, use_mmap=False, checkpoints=None, parse_block=None):
+		self.path = path
+		self.index = index
+		self.block_numbers = block_numbers
+		self.use_mmap = use_mmap
+		self.checkpoints = checkpoints
+		self.parse_block = parse_block
+		self.Config = read_config(path, index, checkpoints)
+
+	def iter_blocks(self):
+		for block_number, data_block in read_blocks(self.path, self.index, self.block_numbers, self.use_mmap, self.checkpoints, self.parse_block):
+			data_block.block_number = block_number
+			yield data_block
+
+	def __iter__(self):
+		return self.iter_blocks()
+
+	@property
+	def SpectralPsdData(self):
+		return self.iter_blocks()
+
+	@property
+	def SpectralIqData(self):
+		return self.iter_blocks()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+
+#Streaming export of RAW IQ samples to GNU Radio-compatible files (rawIQ_process.py -g).
+#The interleaved float64 I/Q values of a snapshot (DataPoints, read straight from the packed payload) are converted
+#in fixed-size chunks into a reused output buffer, and each converted chunk is written with one sequential write :
+#	fc32 : interleaved float32 (GNU Radio "cfile", gr_complex).
+#	sc16 : interleaved int16 (GNU Radio "short" interleaved complex), values multiplied by a scale factor and
+#	       rounded; a quarter of the size of the float64 payload. The scale factor is given, or computed from the
+#	       first snapshot so that its largest value is at 1 / SC16_HEADROOM of full scale; values beyond full scale
+#	       are clipped (and counted). Divide by the scale factor to get the original values back.
+#	       A later snapshot louder than the first one may be clipped : warning() then reports it, with the scale
+#	       factor computed from the largest value written (to give explicitly on the next run).
+
+#Usage (library) :
+#	cfile_writer = cfile_export.CfileWriter(path + ".cfile", cfile_export.FORMAT_SC16)
+#	cfile_writer.write(data_block.DataPoints)
+#	cfile_writer.close()
+#	print cfile_writer.describe()
+#	if cfile_writer.warning() is not None:
+#		print "Warning : " + cfile_writer.warning()
+#Requirements: Python 2.7 with NumPy.
+
+import numpy as np
+
+#Output formats.
+FORMAT_FC32 = "fc32"
+FORMAT_SC16 = "sc16"
+FORMATS = [FORMAT_FC32, FORMAT_SC16]
+
+#Number of values (I and Q counted separately) converted at a time.
+DEFAULT_CHUNK_VALUES = 1 << 20
+
+#Ratio of full scale to the largest value of the first snapshot, when the sc16 scale factor is computed.
+SC16_HEADROOM = 2.0
+
+#Full scale of sc16 values (symmetric).
+SC16_FULL_SCALE = 32767
+
+#Writes interleaved I/Q values (float64, as DataPoints) to a fc32 / sc16 file.
+class CfileWriter:
+
+	#input : path of the output file, format (FORMATS), sc16 scale factor (None : computed from the first snapshot),
+	#        number of values converted at a time.
+	def __init__(self, path, sample_format=FORMAT_FC32, scale=None, chunk_values=DEFAULT_CHUNK_VALUES):
+		if sample_format not in FORMATS:
+			raise ValueError("Unknown cfile format : " + sample_format + " (expected one of " + ", ".join(FORMATS) + ")")
+		self.f = open(path, "wb")
+		self.sample_format = sample_format
+		self.scale = scale
+		self.samples = 0
+		self.clipped = 0			#sc16 values clipped to full scale
+		self.peak = 0.0				#largest absolute value written (sc16)
+		if sample_format == FORMAT_FC32:
+			self._buffer = np.empty(chunk_values, np.float32)
+		else:
+			self._buffer = np.empty(chunk_values, np.int16)
+			self._scaled = np.empty(chunk_values, np.float64)
+
+	#Compute the sc16 scale factor from the first values written.
+	def _set_scale(self, data_points):
+		peak = np.abs(data_points).max() if len(data_points) > 0 else 0
+		self.scale = scale_for_peak(peak)
+
+	#Write the samples of a snapshot.
+	#input : float array of interleaved I/Q values (I0, Q0, I1, Q1, ...) : DataPoints (float64), or
+	#        wire_format.iq_values() of complex samples (float64 / float32).
+	def write(self, data_points):
+		data_points = np.asarray(data_points)
+		if self.sample_format == FORMAT_SC16 and self.scale is None:
+			self._set_scale(data_points)
+		step = len(self._buffer)
+		for start in range(0, len(data_points), step):
+			chunk = data_points[start:start + step]
+			out = self._buffer[:len(chunk)]
+			if self.sample_format == FORMAT_FC32:
+				out[...] = chunk
+			else:
+				scaled = self._scaled[:len(chunk)]
+				np.multiply(chunk, self.scale, out=scaled)
+				np.rint(scaled, out=scaled)
+				high = scaled.max()
+				low = scaled.min()
+				if high > SC16_FULL_SCALE or low < -SC16_FULL_SCALE:
+					self.clipped += np.count_nonzero(scaled > SC16_FULL_SCALE) + np.count_nonzero(scaled < -SC16_FULL_SCALE)
+				if np.isfinite(high) and np.isfinite(low):
+					self.peak = max(self.peak, high / self.scale, -low / self.scale)
+				np.clip(scaled, -SC16_FULL_SCALE, SC16_FULL_SCALE, out=scaled)
+				out[...] = scaled
+			out.tofile(self.f)
+		self.samples += len(data_points) // 2
+
+	def close(self):
+		self.f.close()
+
+	#One-line description of the output (format, samples, scale factor).
+	def describe(self):
+		text = self.sample_format + ", " + str(self.samples) + " samples"
+		if self.sample_format == FORMAT_SC16:
+			text += ", scale factor " + repr(self.scale) + " (" + str(self.clipped) + " values clipped)"
+		return text
+
+	#Warning about clipped sc16 values (None if no value was clipped).
+	def warning(self):
+		if self.clipped == 0:
+			return None
+		return (str(self.clipped) + " sc16 values clipped to full scale with the scale factor " + repr(self.scale) +
+			" (largest value " + repr(self.peak) + "); a scale factor of " + repr(scale_for_peak(self.peak)) + " keeps every value")
+
+#sc16 scale factor putting a largest absolute value at 1 / SC16_HEADROOM of full scale.
+#input : largest absolute value
+#output : scale factor (1.0 if the value is 0, or not finite)
+def scale_for_peak(peak):
+	if peak > 0 and np.isfinite(peak):
+		return SC16_FULL_SCALE / (peak * SC16_HEADROOM)
+	return 1.0
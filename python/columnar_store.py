@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+
+#Chunked on-disk columnar store of CityScape PSD scan files and RAW IQ files.
+#A file is converted once into a directory :
+#	manifest.json           : kind, station config (text and serialized ConfigDataBlock), source file, shapes,
+#	                          list of chunks (written last : a store without manifest is incomplete).
+#	values.00000.npy, ...   : data points, in chunks of consecutive blocks (PSD : raw Q7 int16, blocks x bins;
+#	                          RAW IQ : complex64, snapshots x samples).
+#	<column>.npy            : one metadata value per block (timestamp, start_freq, stop_freq, center_freq,
+#	                          reading_kind, block_number, location).
+#Readers open the .npy files memory-mapped : opening a store only reads the manifest, and reading a range of
+#blocks only touches the chunks that hold them.
+
+#Usage (library) :
+#	columnar_store.write_store("file.dsox", "file.store", block_index.KIND_PSD)
+#	store = columnar_store.ColumnarStore("file.store")
+#	cube = store.cube(1000, 2000)					#psd_cube.PsdCube of blocks 1000..1999 (0-based rows)
+#	timestamps = store.column("timestamp")
+#Usage (CLI) : python columnar_store.py file.dsox file.store [-k psd|iq] [--chunk-size MB]
+#Requirements: Python 2.7 with Protoc Python bindings and NumPy.
+
+import argparse
+import base64
+import json
+import os
+import os.path
+import time
+import numpy as np
+import block_filter
+import block_index
+import psd_cube
+import stream_decompress
+import wire_format
+
+MANIFEST_NAME = "manifest.json"
+STORE_FORMAT = "cityscape-columnar"
+STORE_VERSION = 1
+
+#Target size of a chunk of data points (bytes).
+DEFAULT_CHUNK_SIZE = 16 << 20
+
+#Per-kind name, reader class, Config class and stored dtype of the data points.
+_KINDS = {
+	block_index.KIND_PSD : ("psd", wire_format.ScanFileReader, wire_format.psdFile_pb2.ConfigDataBlock, wire_format.PSD_DTYPE),
+	block_index.KIND_IQ : ("iq", wire_format.RawIqFileReader, wire_format.rawIQ_pb2.ConfigDataBlock, np.dtype(np.complex64)),
+}
+
+#Metadata columns and their dtypes (location : NmeaGpggaLocation, fixed-width bytes).
+COLUMNS = [
+	("timestamp", np.float64),			#POSIX timestamp (seconds)
+	("start_freq", np.float64),			#StartFrequencyHz
+	("stop_freq", np.float64),			#StopFrequencyHz
+	("center_freq", np.float64),		#CenterFrequencyHz (RAW IQ), (start + stop) / 2 (PSD)
+	("reading_kind", np.int8),			#Reading_Kind (PSD), -1 (RAW IQ)
+	("block_number", np.int64),			#1-based, in the source file
+	("location", np.bytes_),
+]
+
+def _chunk_name(n):
+	return "values.%05d.npy" % n
+
+#Writes the blocks of one file into a store directory.
+class _StoreWriter:
+
+	#input : store directory (created if needed), KIND_PSD / KIND_IQ, target chunk size (bytes).
+	def __init__(self, directory, kind, chunk_size=DEFAULT_CHUNK_SIZE):
+		if not os.path.isdir(directory):
+			os.makedirs(directory)
+		if os.path.exists(os.path.join(directory, MANIFEST_NAME)):
+			os.remove(os.path.join(directory, MANIFEST_NAME))
+		self.directory = directory
+		self.kind = kind
+		self.dtype = _KINDS[kind][3]
+		self.chunk_size = chunk_size
+		self.buffer = None				#values of the current chunk
+		self.used = 0					#rows of the buffer in use
+		self.chunks = []				#number of blocks of each written chunk
+		self.columns = dict((name, []) for name, dtype in COLUMNS)
+
+	def append(self, data_block):
+		if self.kind == block_index.KIND_PSD:
+			points = data_block.OutputDataPoints
+			center_freq = (data_block.StartFrequencyHz + data_block.StopFrequencyHz) / 2
+			reading_kind = data_block.Reading_Kind
+		else:
+			points = data_block.complex_samples()
+			center_freq = data_block.CenterFrequencyHz
+			reading_kind = -1
+		if self.buffer is None:
+			rows = max(1, self.chunk_size // max(1, len(points) * self.dtype.itemsize))
+			self.buffer = np.empty((rows, len(points)), self.dtype)
+		elif len(points) != self.buffer.shape[1]:
+			raise ValueError("Block %d has %d data points instead of %d; a store needs the same number of data points in every block." % (len(self.columns["timestamp"]) + 1, len(points), self.buffer.shape[1]))
+		self.buffer[self.used] = points
+		self.used += 1
+		if self.used == len(self.buffer):
+			self._flush()
+
+		for name, value in (("timestamp", wire_format.timestamp_seconds(data_block.Time_stamp)), ("start_freq", data_block.StartFrequencyHz), ("stop_freq", data_block.StopFrequencyHz), ("center_freq", center_freq), ("reading_kind", reading_kind), ("block_number", getattr(data_block, "block_number", len(self.columns["timestamp"]) + 1)), ("location", data_block.NmeaGpggaLocation)):
+			self.columns[name].append(value)
+
+	def _flush(self):
+		if self.used > 0:
+			np.save(os.path.join(self.directory, _chunk_name(len(self.chunks))), self.buffer[:self.used])
+			self.chunks.append(self.used)
+			self.used = 0
+
+	#Write the last chunk, the metadata columns and the manifest.
+	#input : Config (ConfigDataBlock or None), path of the source file.
+	#output : manifest (dict)
+	def finish(self, config, source):
+		self._flush()
+		for name, dtype in COLUMNS:
+			np.save(os.path.join(self.directory, name + ".npy"), np.array(self.columns[name], dtype))
+		manifest = {
+			"format" : STORE_FORMAT,
+			"version" : STORE_VERSION,
+			"kind" : _KINDS[self.kind][0],
+			"dtype" : self.dtype.str,
+			"blocks" : sum(self.chunks),
+			"points_per_block" : 0 if self.buffer is None else self.buffer.shape[1],
+			"chunks" : [{"file" : _chunk_name(n), "blocks" : blocks} for n, blocks in enumerate(self.chunks)],
+			"columns" : [name for name, dtype in COLUMNS],
+			"source" : {"name" : os.path.basename(source), "size" : os.path.getsize(source), "mtime" : os.path.getmtime(source)},
+			"config_text" : "" if config is None else str(config),
+			"config" : "" if config is None else base64.b64encode(config.SerializeToString()),
+			"created" : time.time(),
+		}
+		temp_path = os.path.join(self.directory, MANIFEST_NAME + ".tmp")
+		with open(temp_path, "w") as f:
+			json.dump(manifest, f, indent=1, sort_keys=True)
+		os.rename(temp_path, os.path.join(self.directory, MANIFEST_NAME))
+		return manifest
+
+#Convert a PSD scan file or RAW IQ file (compressed or not) into a store.
+#input : path of the data file, store directory, KIND_PSD / KIND_IQ, target chunk size (bytes), block filter (optional).
+#output : ColumnarStore
+def write_store(path, directory, kind, chunk_size=DEFAULT_CHUNK_SIZE, data_filter=None):
+	f_stream, input_format = stream_decompress.open_data_stream(path)
+	try:
+		reader = _KINDS[kind][1](f_stream, data_filter)
+		writer = _StoreWriter(directory, kind, chunk_size)
+		for data_block in reader.iter_blocks():
+			writer.append(data_block)
+		writer.finish(reader.Config, path)
+	finally:
+		f_stream.close()
+	return ColumnarStore(directory)
+
+#Read access to a store (memory-mapped).
+class ColumnarStore:
+
+	def __init__(self, directory):
+		manifest_path = os.path.join(directory, MANIFEST_NAME)
+		if not os.path.exists(manifest_path):
+			raise Exception("Not a store (or an incomplete one) : " + directory)
+		with open(manifest_path) as f:
+			self.manifest = json.load(f)
+		if self.manifest.get("format") != STORE_FORMAT or self.manifest.get("version") != STORE_VERSION:
+			raise Exception("Unsupported store format : " + directory)
+		self.directory = directory
+		self.kind = [kind for kind, properties in _KINDS.items() if properties[0] == self.manifest["kind"]][0]
+		self.points_per_block = self.manifest["points_per_block"]
+		#first block of each chunk, and the end of the last one.
+		self.chunk_starts = np.cumsum([0] + [chunk["blocks"] for chunk in self.manifest["chunks"]])
+		self._chunks = {}
+		self._columns = {}
+		self._config = None
+
+	def __len__(self):
+		return self.manifest["blocks"]
+
+	#Station config text (as printed by the scripts).
+	@property
+	def config_text(self):
+		return self.manifest["config_text"]
+
+	#Config (ConfigDataBlock), parsed on first use.
+	@property
+	def Config(self):
+		if self._config is None and self.manifest["config"]:
+			self._config = _KINDS[self.kind][2]()
+			self._config.ParseFromString(base64.b64decode(self.manifest["config"]))
+		return self._config
+
+	#Metadata column (memory-mapped; "location" is read into memory).
+	def column(self, name):
+		if name not in self._columns:
+			path = os.path.join(self.directory, name + ".npy")
+			self._columns[name] = np.load(path) if name == "location" else np.load(path, mmap_mode="r")
+		return self._columns[name]
+
+	#Data points of a chunk (memory-mapped, blocks x points).
+	def chunk(self, n):
+		if n not in self._chunks:
+			self._chunks[n] = np.load(os.path.join(self.directory, self.manifest["chunks"][n]["file"]), mmap_mode="r")
+		return self._chunks[n]
+
+	#Data points of blocks [start, stop) (0-based rows). A view of the memory-mapped chunk if the blocks are in one
+	#chunk; otherwise the touched chunks are copied into one array.
+	def values(self, start=0, stop=None):
+		start, stop, step = slice(start, stop).indices(len(self))
+		if stop <= start:
+			return np.empty((0, self.points_per_block), _KINDS[self.kind][3])
+		first = np.searchsorted(self.chunk_starts, start, "right") - 1
+		last = np.searchsorted(self.chunk_starts, stop, "left") - 1
+		parts = [self.chunk(n)[max(start - self.chunk_starts[n], 0):stop - self.chunk_starts[n]] for n in range(first, last + 1)]
+		if len(parts) == 1:
+			return parts[0]
+		return np.concatenate(parts)
+
+	#PsdCube (psd_cube.py) of blocks [start, stop) of a PSD store.
+	def cube(self, start=0, stop=None, cache_size=0):
+		if self.kind != block_index.KIND_PSD:
+			raise ValueError("cube() needs a PSD store.")
+		rows = slice(start, stop)
+		return psd_cube.PsdCube(self.values(start, stop), psd_cube.to_datetime64(self.column("timestamp")[rows]), self.column("start_freq")[rows], self.column("stop_freq")[rows], self.column("reading_kind")[rows], self.column("block_number")[rows], self.Config, psd_cube.DecibelCache(cache_size))
+
+#--------------------------------------------------
+# Main routine (int main() equivalent)
+#--------------------------------------------------
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser()
+	parser.add_argument("path", help="input file path (PSD scan file or RAW IQ file, compressed or not)")
+	parser.add_argument("store", help="output store directory")
+	parser.add_argument("-k", "--kind", choices=["psd", "iq"], default="psd", help="kind of the input file (default : psd)")
+	parser.add_argument("--chunk-size", type=float, default=DEFAULT_CHUNK_SIZE / float(1 << 20), help="target size of a chunk of data points (MiB)")
+	block_filter.add_filter_arguments(parser)
+	args = parser.parse_args()
+
+	kind = block_index.KIND_PSD if args.kind == "psd" else block_index.KIND_IQ
+	start = time.time()
+	store = write_store(args.path, args.store, kind, int(args.chunk_size * (1 << 20)), block_filter.filter_from_args(args))
+	print "%d blocks of %d data points in %d chunks, written to %s in %.2fs" % (len(store), store.points_per_block, len(store.manifest["chunks"]), args.store, time.time() - start)
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+
+#Bulk CSV export of CityScape PSD data blocks (psdFile_process.py -d) and RAW IQ snapshots (rawIQ_process.py -d).
+#PSD values are Q7 fixed-point int16, so there are only 65536 possible dB values : their text (the same as str() of
+#the dB value) is computed once, and a whole block is formatted with one table lookup and one join instead of one
+#str() call per value. RAW IQ samples are formatted IQ_CHUNK_SAMPLES rows at a time, with one "%" operation over
+#the interleaved I/Q values, with DEFAULT_IQ_PRECISION (9) significant digits by default : a relative error below
+#5e-9, and the 9 digits that identify a float32 value (see rawIQ_process.py --complex64). Exact float64 values
+#(precision None : the shortest text that reads the value back, as str() prints it) are about 3 times slower to
+#format : Python has to find the shortest digits of every value.
+#Formatted blocks are gathered and written to the file in large chunks.
+#PSD layouts :
+#	block : per-block header lines (Block, timestamp, frequencies, Data Type, ...) followed by one value per line
+#	        (the format of psdFile_process.py -d).
+#	wide  : one header row, then one row per block : block metadata followed by one column per bin
+#	        (every block must then have the same number of bins as the first one; ValueError otherwise).
+
+#Usage (library) :
+#	csv_writer = csv_export.PsdCsvWriter(path + ".csv", "wide")
+#	for data_block in reader.SpectralPsdData : csv_writer.write_block(block_number, timestamp_text, data_block)
+#	csv_writer.close()
+#	iq_writer = csv_export.IqCsvWriter(path + ".csv")				#precision=None : exact values
+#	iq_writer.write_block(block_number, timestamp_text, data_block)
+#Requirements: Python 2.7 with NumPy.
+
+import numpy as np
+import file_summary
+import psd_convert
+import wire_format
+
+#Available layouts.
+LAYOUT_BLOCK = "block"
+LAYOUT_WIDE = "wide"
+LAYOUTS = [LAYOUT_BLOCK, LAYOUT_WIDE]
+
+#Amount of formatted text gathered before writing it to the file (bytes).
+DEFAULT_CHUNK_SIZE = 4 << 20
+
+#Number of RAW IQ rows (samples) formatted at a time.
+IQ_CHUNK_SAMPLES = 1 << 16
+
+#Significant digits that read a float32 value back exactly.
+FLOAT32_DIGITS = 9
+
+#Default number of significant digits of the RAW IQ values.
+DEFAULT_IQ_PRECISION = FLOAT32_DIGITS
+
+#Text of every Q7 value, indexed by the raw value seen as uint16 (built on first use).
+_q7_text = []
+
+#Text of the dB values of Q7 data, as str() prints them ("nan" for the NaN sentinel).
+#input : int array of PSD data (OutputDataPoints)
+#output : numpy array of str (object), same length
+def q7_text(points):
+	if not _q7_text:
+		raw = np.arange(1 << 16, dtype=np.uint16).view(np.int16)
+		table = np.array([repr(value) for value in psd_convert.q7_to_decibel(raw).tolist()], dtype=object)
+		_q7_text.append(table)
+	return _q7_text[0].take(np.asarray(points, np.int16).view(np.uint16))
+
+#Quote a CSV field if needed (e.g. NMEA sentences, which contain commas).
+def _csv_field(text):
+	if "," in text or "\"" in text or "\n" in text:
+		return "\"" + text.replace("\"", "\"\"") + "\""
+	return text
+
+#Writes text to a file in large chunks.
+class ChunkedWriter:
+
+	#input : path of the output file, chunk size (bytes).
+	def __init__(self, path, chunk_size=DEFAULT_CHUNK_SIZE):
+		self.f = open(path, "w")
+		self.chunk_size = chunk_size
+		self.parts = []
+		self.size = 0
+
+	def write(self, text):
+		self.parts.append(text)
+		self.size += len(text)
+		if self.size >= self.chunk_size:
+			self.flush()
+
+	def flush(self):
+		self.f.write("".join(self.parts))
+		del self.parts[:]
+		self.size = 0
+
+	def close(self):
+		self.flush()
+		self.f.close()
+
+#CSV export of PSD data blocks.
+class PsdCsvWriter(ChunkedWriter):
+
+	#input : path of the output file, layout (LAYOUTS), chunk size (bytes).
+	def __init__(self, path, layout=LAYOUT_BLOCK, chunk_size=DEFAULT_CHUNK_SIZE):
+		if layout not in LAYOUTS:
+			raise ValueError("Unknown CSV layout : " + layout + " (expected one of " + ", ".join(LAYOUTS) + ")")
+		ChunkedWriter.__init__(self, path, chunk_size)
+		self.layout = layout
+		self.bins = None			#number of bin columns of the wide layout header (None : header not written yet)
+
+	#Write one data block.
+	#input : block number, timestamp (text), PsdDataBlock (or SpectralPsdDataBlock).
+	def write_block(self, block_number, timestamp_text, data_block):
+		points = data_block.OutputDataPoints
+		reading_kind = file_summary.READING_KIND_NAMES.get(data_block.Reading_Kind, "?????????")
+		if self.layout == LAYOUT_BLOCK:
+			self.write("Block," + str(block_number) + "\n" +
+				"timestamp," + timestamp_text + "\n" +
+				"Start Freq," + str((data_block.StartFrequencyHz)/1e6) + "Mhz" + "\n" +
+				"Stop Freq," + str((data_block.StopFrequencyHz)/1e6) + "Mhz" + "\n" +
+				"Data Type," + reading_kind + "\n" +
+				"NmeaGpggaLocation," + data_block.NmeaGpggaLocation + "\n" +
+				"Data count," + str(len(points)) + "\n" +
+				"------DATA STARTS HERE------ \n")
+			self.write("\n".join(q7_text(points)))
+			self.write("\n")
+		else:
+			if self.bins is None:
+				self.write("Block,timestamp,Start Freq (MHz),Stop Freq (MHz),Data Type,NmeaGpggaLocation,Data count," + ",".join("Bin " + str(n) for n in range(1, len(points) + 1)) + "\n")
+				self.bins = len(points)
+			elif len(points) != self.bins:
+				raise ValueError("Block %d has %d bins instead of %d; the wide CSV layout needs the same number of bins in every block (use the block layout)." % (block_number, len(points), self.bins))
+			self.write(",".join([str(block_number), _csv_field(timestamp_text), str((data_block.StartFrequencyHz)/1e6), str((data_block.StopFrequencyHz)/1e6), reading_kind, _csv_field(data_block.NmeaGpggaLocation), str(len(points))] + q7_text(points).tolist()) + "\n")
+
+#CSV export of RAW IQ snapshots : per-snapshot header lines, then one "I,Q" row per sample.
+class IqCsvWriter(ChunkedWriter):
+
+	#input : path of the output file, number of significant digits (None : as many as needed to read the exact
+	#        values back : the same text as str() for float64 values, FLOAT32_DIGITS for float32 values), chunk size (bytes).
+	def __init__(self, path, precision=DEFAULT_IQ_PRECISION, chunk_size=DEFAULT_CHUNK_SIZE):
+		ChunkedWriter.__init__(self, path, chunk_size)
+		self.value_format = None
+		if precision is not None:
+			self.value_format = "%." + str(precision) + "g"
+		self.row_formats = {}		#(number of rows, value format) -> format string of that many rows
+
+	#Write the rows of interleaved I/Q values.
+	#input : float array (I0, Q0, I1, Q1, ...), as DataPoints (float64) or wire_format.iq_values() (float64 / float32).
+	def write_samples(self, data_points):
+		data_points = np.asarray(data_points)
+		value_format = self.value_format
+		if value_format is None:
+			value_format = "%r"
+			if data_points.dtype == np.float32:
+				value_format = "%." + str(FLOAT32_DIGITS) + "g"
+		step = 2 * IQ_CHUNK_SAMPLES
+		for start in range(0, len(data_points) - len(data_points) % 2, step):
+			chunk = data_points[start:start + step]
+			rows = len(chunk) // 2
+			row_format = self.row_formats.get((rows, value_format))
+			if row_format is None:
+				row_format = self.row_formats[(rows, value_format)] = (value_format + "," + value_format + "\n") * rows
+			self.write(row_format % tuple(chunk[:2 * rows].tolist()))
+
+	#Write one snapshot.
+	#input : block number, timestamp (text), IqDataBlock (or SpectralIqDataBlock),
+	#        complex samples of the snapshot (optional, IqDataBlock.complex_samples(); DataPoints by default).
+	def write_block(self, block_number, timestamp_text, data_block, samples=None):
+		self.write("Block," + str(block_number) + "\n" +
+			"timestamp," + timestamp_text + "\n" +
+			"Start Freq," + str((data_block.StartFrequencyHz)/1e6) + "MHz" + "\n" +
+			"Stop Freq," + str((data_block.StopFrequencyHz)/1e6) + "MHz" + "\n" +
+			"Center Freq," + str((data_block.CenterFrequencyHz)/1e6) + "MHz" + "\n" +
+			"NmeaGpggaLocation," + data_block.NmeaGpggaLocation + "\n" +
+			"Data count," + str(len(data_block.DataPoints)/2) + "\n" +
+			"I,Q \n")
+		if samples is None:
+			self.write_samples(data_block.DataPoints)
+		else:
+			self.write_samples(wire_format.iq_values(samples))
+		#add an extra line at the end of the block.
+		self.write("\n")
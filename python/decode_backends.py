@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+
+#Interchangeable decoders of the serialized data blocks (SpectralPsdDataBlock / SpectralIqDataBlock).
+#All backends return the same objects (wire_format.PsdDataBlock / IqDataBlock : metadata message without the data
+#points, and the data points as a numpy array), so they can be swapped without changing the callers :
+#	numpy       : NumPy wire decoder of wire_format.py (packed zigzag varints / little-endian doubles).
+#	pb2         : psdFile_pb2 / rawIQ_pb2 generated classes, on whichever protobuf runtime is loaded
+#	              (the pure-Python runtime is much slower than the others).
+#	accelerated : the generated classes on an accelerated protobuf runtime (C++ extension or upb); only available
+#	              when such a runtime is loaded (see PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION).
+#	auto        : times the available backends on the first blocks of the file (each block is decoded once, by the
+#	              candidates in turn), then keeps the fastest one; describe() always names the backend in use.
+#benchmark.py psd-backends / iq-backends checks that every backend decodes a file identically and reports their speed.
+
+#Usage (library) :
+#	backend = decode_backends.get_backend("auto")
+#	reader = wire_format.ScanFileReader(f_stream, parse_block=backend.parse_psd)
+#	...
+#	print backend.describe()
+#Requirements: Python 2.7 with Protoc Python bindings and NumPy.
+
+import collections
+import timeit
+import numpy as np
+import psdFile_pb2
+import rawIQ_pb2
+import wire_format
+
+try:
+	from google.protobuf.internal import api_implementation
+	PROTOBUF_RUNTIME = api_implementation.Type()
+except ImportError:
+	PROTOBUF_RUNTIME = "python"
+
+#Protobuf runtimes that count as accelerated.
+ACCELERATED_RUNTIMES = ("cpp", "upb")
+
+#Number of blocks each candidate of the "auto" backend decodes while they are timed.
+AUTO_CALIBRATION_BLOCKS = 8
+
+#Copy of a payload as bytes (the generated classes do not accept buffer / memoryview objects).
+def _payload_bytes(payload):
+	if isinstance(payload, bytes):
+		return payload
+	return bytes(payload)
+
+#NumPy wire decoder (wire_format.py).
+class NumpyBackend:
+
+	name = "numpy"
+
+	def available(self):
+		return True
+
+	def describe(self):
+		return "numpy (NumPy wire decoder)"
+
+	def parse_psd(self, payload):
+		return wire_format.parse_psd_block(payload)
+
+	def parse_iq(self, payload):
+		return wire_format.parse_iq_block(payload)
+
+#psdFile_pb2 / rawIQ_pb2 generated classes. The data points are moved out of the message into a numpy array.
+class ProtobufBackend:
+
+	#input : backend name, runtimes it can run on (None : any).
+	def __init__(self, name, runtimes=None):
+		self.name = name
+		self.runtimes = runtimes
+
+	def available(self):
+		return self.runtimes is None or PROTOBUF_RUNTIME in self.runtimes
+
+	def describe(self):
+		return self.name + " (psdFile_pb2 / rawIQ_pb2, protobuf " + PROTOBUF_RUNTIME + " runtime)"
+
+	def parse_psd(self, payload):
+		meta = psdFile_pb2.SpectralPsdDataBlock()
+		meta.ParseFromString(_payload_bytes(payload))
+		data_points = np.fromiter(meta.OutputDataPoints, wire_format.PSD_DTYPE, len(meta.OutputDataPoints))
+		meta.ClearField("OutputDataPoints")
+		return wire_format.PsdDataBlock(meta, data_points)
+
+	def parse_iq(self, payload):
+		meta = rawIQ_pb2.SpectralIqDataBlock()
+		meta.ParseFromString(_payload_bytes(payload))
+		data_points = np.fromiter(meta.DataPoints, np.float64, len(meta.DataPoints))
+		meta.ClearField("DataPoints")
+		return wire_format.IqDataBlock(meta, data_points)
+
+#Times the candidate backends on the first blocks of each kind, then uses the fastest.
+#While calibrating, the candidates decode the blocks in turn (each block is decoded once) and the fastest is the one
+#with the lowest time per payload byte; it is chosen after AUTO_CALIBRATION_BLOCKS blocks per candidate, or, on
+#shorter inputs, when describe() is called at the end of the input.
+class AutoBackend:
+
+	name = "auto"
+
+	#input : candidate backends, backend reported when no block has been decoded (see get_backend()).
+	def __init__(self, candidates, default):
+		self.candidates = candidates
+		self.default = default
+		self.timings = {"psd" : collections.defaultdict(float), "iq" : collections.defaultdict(float)}
+		self.sizes = {"psd" : collections.defaultdict(int), "iq" : collections.defaultdict(int)}
+		self.calibrated = {"psd" : 0, "iq" : 0}
+		self.chosen = {"psd" : None, "iq" : None}
+
+	def available(self):
+		return True
+
+	#Fastest candidate on the blocks timed so far (None if no block of that kind was decoded).
+	def _fastest(self, kind):
+		timed = [backend for backend in self.candidates if self.sizes[kind][backend.name] > 0]
+		if len(timed) == 0:
+			return None
+		return min(timed, key=lambda backend: self.timings[kind][backend.name] / self.sizes[kind][backend.name])
+
+	#Backend in use (the fastest so far for a kind that is still calibrating; the default if nothing was decoded).
+	def describe(self):
+		chosen = []
+		for kind in ("psd", "iq"):
+			backend = self.chosen[kind] or self._fastest(kind)
+			if backend is not None and backend not in chosen:
+				chosen.append(backend)
+		if len(chosen) == 0:
+			return "auto -> " + self.default.describe() + " (no blocks decoded)"
+		return "auto -> " + ", ".join(backend.describe() for backend in chosen)
+
+	#Decode with the next candidate while calibrating, then with the fastest.
+	def _parse(self, kind, payload):
+		if self.chosen[kind] is not None:
+			return getattr(self.chosen[kind], "parse_" + kind)(payload)
+		backend = self.candidates[self.calibrated[kind] % len(self.candidates)]
+		start = timeit.default_timer()
+		data_block = getattr(backend, "parse_" + kind)(payload)
+		self.timings[kind][backend.name] += timeit.default_timer() - start
+		self.sizes[kind][backend.name] += len(payload)
+		self.calibrated[kind] += 1
+		if self.calibrated[kind] >= AUTO_CALIBRATION_BLOCKS * len(self.candidates):
+			self.chosen[kind] = self._fastest(kind)
+		return data_block
+
+	def parse_psd(self, payload):
+		return self._parse("psd", payload)
+
+	def parse_iq(self, payload):
+		return self._parse("iq", payload)
+
+#Backends by name (in order of preference when several are equally fast).
+BACKENDS = collections.OrderedDict([
+	("numpy", NumpyBackend()),
+	("accelerated", ProtobufBackend("accelerated", ACCELERATED_RUNTIMES)),
+	("pb2", ProtobufBackend("pb2")),
+])
+
+#Names accepted by get_backend().
+BACKEND_CHOICES = ["auto"] + list(BACKENDS.keys())
+
+#Backends that can run here.
+#output : list of backends
+def available_backends():
+	return [backend for backend in BACKENDS.values() if backend.available()]
+
+#Get a backend by name.
+#input : "auto" or one of BACKENDS
+#output : backend (with parse_psd(), parse_iq() and describe())
+def get_backend(name="auto"):
+	if name == "auto":
+		#pb2 runs the same code as "accelerated" when the runtime is accelerated; no need to time it twice.
+		candidates = available_backends()
+		if BACKENDS["accelerated"].available():
+			candidates.remove(BACKENDS["pb2"])
+		#(the candidates are in order of preference : the first one is reported until a block is decoded.)
+		return AutoBackend(candidates, candidates[0])
+	if name not in BACKENDS:
+		raise ValueError("Unknown decoding backend : " + name + " (expected one of " + ", ".join(BACKEND_CHOICES) + ")")
+	backend = BACKENDS[name]
+	if not backend.available():
+		raise ValueError("Decoding backend " + name + " is not available (protobuf runtime : " + PROTOBUF_RUNTIME + ")")
+	return backend
@@ -0,0 +1,306 @@
+#!/usr/bin/env python
+
+#Random access into raw deflate (.dsox / .dsor) files through a checkpoint index, in the style of zlib's
+#examples/zran.c.
+#While the file is inflated once, the inflater state is saved every SPAN bytes of decompressed output, at deflate
+#block boundaries : compressed byte offset, bit offset, and the last 32KB of output (the deflate window).
+#Decompression can then resume at the checkpoint closest to (before) a requested decompressed offset, e.g. the
+#offset of a protobuf data block recorded by block_index.py, instead of inflating the file from its start.
+#Nothing is ever written to disk except the index itself (<file>.zidx, windows stored zlib-compressed; in a cache
+#directory if the data file's directory cannot be written, or nowhere if neither can).
+
+#Building the index needs libz through ctypes (inflate() with Z_BLOCK, which the zlib module does not expose).
+#Resuming only needs the zlib module : the saved window is fed to the inflater as a stored block (which primes
+#its history like inflateSetDictionary()), followed by an empty block padding up to the checkpoint bit and the
+#compressed data from there on (which replaces inflatePrime()).
+
+#Usage (library) :
+#	checkpoints = deflate_index.load_or_build_checkpoints(path)
+#	f_stream = deflate_index.open_at(path, checkpoints, offset)	#reader positioned at a decompressed offset
+#Requirements: Python 2.7; libz shared library to build the index.
+
+import bisect
+import ctypes
+import ctypes.util
+import os.path
+import struct
+import zlib
+import stream_decompress
+
+#Deflate window size (bytes).
+WINDOW_SIZE = 32768
+
+#Default distance between checkpoints (bytes of decompressed output).
+DEFAULT_SPAN = 4 << 20
+
+#Size of the compressed chunks read while building the index / resuming (bytes).
+CHUNK_SIZE = 1 << 18
+
+#Suffix of the checkpoint index file.
+CHECKPOINT_SUFFIX = ".zidx"
+
+CHECKPOINT_MAGIC = b"CSZIDX01"
+
+#magic, indexed file size, indexed file mtime, span, number of checkpoints.
+_HEADER = struct.Struct("<8sQdQQ")
+
+#decompressed offset, compressed offset, bit offset, length of the compressed window.
+_POINT = struct.Struct("<QQBI")
+
+#zlib constants (zlib.h).
+_Z_OK = 0
+_Z_STREAM_END = 1
+_Z_NEED_DICT = 2
+_Z_BLOCK = 5
+
+#z_stream (zlib.h).
+class _ZStream(ctypes.Structure):
+	_fields_ = [
+		("next_in", ctypes.c_void_p),
+		("avail_in", ctypes.c_uint),
+		("total_in", ctypes.c_ulong),
+		("next_out", ctypes.c_void_p),
+		("avail_out", ctypes.c_uint),
+		("total_out", ctypes.c_ulong),
+		("msg", ctypes.c_char_p),
+		("state", ctypes.c_void_p),
+		("zalloc", ctypes.c_void_p),
+		("zfree", ctypes.c_void_p),
+		("opaque", ctypes.c_void_p),
+		("data_type", ctypes.c_int),
+		("adler", ctypes.c_ulong),
+		("reserved", ctypes.c_ulong),
+	]
+
+_libz = None
+
+#Load libz through ctypes (once).
+#output : ctypes library, or None if libz cannot be found.
+def _load_libz():
+	global _libz
+	if _libz is None:
+		for name in (ctypes.util.find_library("z"), "libz.so.1", "libz.dylib", "zlib1.dll"):
+			if name is None:
+				continue
+			try:
+				lib = ctypes.CDLL(name)
+				lib.zlibVersion.restype = ctypes.c_char_p
+				lib.inflateInit2_.argtypes = [ctypes.POINTER(_ZStream), ctypes.c_int, ctypes.c_char_p, ctypes.c_int]
+				lib.inflate.argtypes = [ctypes.POINTER(_ZStream), ctypes.c_int]
+				lib.inflateEnd.argtypes = [ctypes.POINTER(_ZStream)]
+				_libz = lib
+				break
+			except (OSError, AttributeError):
+				continue
+	return _libz
+
+#Check whether checkpoint indexes can be built on this host (libz available through ctypes).
+def libz_available():
+	return _load_libz() is not None
+
+#One checkpoint : decompression can resume at decompressed offset "out" from compressed offset "inp"
+#(minus one byte if "bits" is not zero; the top "bits" bits of that byte belong to the next deflate block),
+#with "window" (up to 32KB of preceding output) as history.
+class Checkpoint:
+
+	def __init__(self, out, inp, bits, window):
+		self.out = out
+		self.inp = inp
+		self.bits = bits
+		self.window = window
+
+#Checkpoints of one raw deflate file, sorted by decompressed offset.
+class CheckpointIndex:
+
+	def __init__(self, points, span, source_size, source_mtime):
+		self.points = points
+		self.span = span
+		self.source_size = source_size
+		self.source_mtime = source_mtime
+		self.path = None					#index file it was loaded from / saved to (None : in memory only)
+		self._outs = [point.out for point in points]
+
+	def __len__(self):
+		return len(self.points)
+
+	#Checkpoint closest to (at or before) a decompressed offset.
+	def find(self, offset):
+		return self.points[max(bisect.bisect_right(self._outs, offset) - 1, 0)]
+
+#Path of the checkpoint index of a data file (next to it, or in a cache directory, see stream_decompress.sidecar_path()).
+def checkpoint_path(path, cache_dir=None):
+	return stream_decompress.sidecar_path(path, CHECKPOINT_SUFFIX, cache_dir)
+
+#Build the checkpoint index of a raw deflate file in one inflating pass (zran.c, deflate_index_build()).
+#input : path of the raw deflate file, distance between checkpoints (bytes of decompressed output).
+#output : CheckpointIndex
+def build_checkpoints(path, span=DEFAULT_SPAN):
+	lib = _load_libz()
+	if lib is None:
+		raise Exception("Building a checkpoint index needs the libz shared library (not found).")
+
+	strm = _ZStream()
+	ret = lib.inflateInit2_(ctypes.byref(strm), -15, lib.zlibVersion(), ctypes.sizeof(_ZStream))
+	if ret != _Z_OK:
+		raise Exception("inflateInit2 failed : " + str(ret))
+
+	in_buf = ctypes.create_string_buffer(CHUNK_SIZE)
+	window = ctypes.create_string_buffer(WINDOW_SIZE)
+	points = [Checkpoint(0, 0, 0, b"")]		#start of the stream
+	total_in = 0
+	total_out = 0
+	last = 0
+	ret = _Z_OK
+	f = open(path, "rb")
+	try:
+		while ret != _Z_STREAM_END:
+			chunk = f.read(CHUNK_SIZE)
+			if not chunk:
+				raise Exception("Truncated deflate stream.")
+			ctypes.memmove(in_buf, chunk, len(chunk))
+			strm.next_in = ctypes.addressof(in_buf)
+			strm.avail_in = len(chunk)
+
+			#inflate until the chunk is used up, stopping at each deflate block boundary.
+			while True:
+				if strm.avail_out == 0:
+					strm.next_out = ctypes.addressof(window)
+					strm.avail_out = WINDOW_SIZE
+				total_in += strm.avail_in
+				total_out += strm.avail_out
+				ret = lib.inflate(ctypes.byref(strm), _Z_BLOCK)
+				total_in -= strm.avail_in
+				total_out -= strm.avail_out
+				if ret == _Z_NEED_DICT or ret < 0 and strm.avail_in != 0:
+					raise Exception("Invalid deflate stream (inflate returned " + str(ret) + ").")
+				#end of the last block : raw deflate has no trailer, so Z_STREAM_END may not be returned before the input runs out.
+				if ret == _Z_STREAM_END or strm.data_type & 192 == 192:
+					ret = _Z_STREAM_END
+					break
+
+				#block boundary (bit 7 of data_type), not after the last block (bit 6) : add a checkpoint every "span" bytes.
+				if (strm.data_type & 128) and not (strm.data_type & 64) and total_out - last > span:
+					raw = window.raw
+					left = strm.avail_out
+					history = raw[WINDOW_SIZE - left:] + raw[:WINDOW_SIZE - left]
+					if total_out < WINDOW_SIZE:
+						history = history[WINDOW_SIZE - total_out:]
+					points.append(Checkpoint(total_out, total_in, strm.data_type & 7, history))
+					last = total_out
+
+				if strm.avail_in == 0:
+					break
+	finally:
+		lib.inflateEnd(ctypes.byref(strm))
+		f.close()
+
+	return CheckpointIndex(points, span, os.path.getsize(path), os.path.getmtime(path))
+
+#Write a checkpoint index file.
+def save_checkpoints(index, zidx_path):
+	f = open(zidx_path, "wb")
+	try:
+		f.write(_HEADER.pack(CHECKPOINT_MAGIC, index.source_size, index.source_mtime, index.span, len(index.points)))
+		for point in index.points:
+			window = zlib.compress(point.window)
+			f.write(_POINT.pack(point.out, point.inp, point.bits, len(window)))
+			f.write(window)
+	finally:
+		f.close()
+
+#Read a checkpoint index file.
+def load_checkpoints(zidx_path):
+	f = open(zidx_path, "rb")
+	try:
+		header = f.read(_HEADER.size)
+		if len(header) != _HEADER.size:
+			raise ValueError("Truncated checkpoint index : " + zidx_path)
+		magic, source_size, source_mtime, span, count = _HEADER.unpack(header)
+		if magic != CHECKPOINT_MAGIC:
+			raise ValueError("Not a checkpoint index : " + zidx_path)
+		points = []
+		for i in range(count):
+			record = f.read(_POINT.size)
+			if len(record) != _POINT.size:
+				raise ValueError("Truncated checkpoint index : " + zidx_path)
+			out, inp, bits, window_length = _POINT.unpack(record)
+			points.append(Checkpoint(out, inp, bits, zlib.decompress(f.read(window_length))))
+	finally:
+		f.close()
+	return CheckpointIndex(points, span, source_size, source_mtime)
+
+#Load the checkpoint index of a raw deflate file, or build (and save) it if it is missing or out of date.
+#It is saved next to the data file, or in cache_dir if that directory cannot be written (see block_index.load_or_build_index()).
+def load_or_build_checkpoints(path, span=DEFAULT_SPAN, cache_dir=None):
+	return stream_decompress.load_or_build_sidecar(path, CHECKPOINT_SUFFIX, cache_dir, load_checkpoints,
+		lambda index: index.source_size == os.path.getsize(path) and index.source_mtime == os.path.getmtime(path),
+		lambda: build_checkpoints(path, span), save_checkpoints)
+
+#Order of the code length code lengths in a dynamic block header (RFC 1951, 3.2.7).
+_CODE_LENGTH_ORDER = [16, 17, 18, 0, 8, 7, 9, 6, 10, 5, 11, 4, 12, 3, 13, 2, 14, 1, 15]
+
+#Bits of an empty, non-final dynamic Huffman deflate block whose length in bits is congruent to "residue" modulo 8.
+#The block only defines an end-of-block code and emits nothing; it is used to make the data that precedes a
+#checkpoint end on the same bit of a byte as in the original stream, so that the padding of later stored blocks
+#stays where it was.
+#output : (value, number of bits), bits packed LSB first as in a deflate stream.
+def _empty_block_bits(residue):
+	#code length code : 18 -> "0", 0 -> "10", 1 -> "11" (codes are sent MSB first, hence reversed below).
+	#the block is 38 + 3 * clen_count + 2 * single_zeros bits long (clen_count >= 18 so that symbol 1 has a length).
+	clen_count = 18 + (residue % 2)
+	single_zeros = ((residue - 38 - 3 * clen_count) % 8) // 2
+	fields = [(0, 1), (2, 2), (0, 5), (0, 5), (clen_count - 4, 4)]		#BFINAL, BTYPE, HLIT (257), HDIST (1), HCLEN
+	lengths = {18 : 1, 0 : 2, 1 : 2}
+	for symbol in _CODE_LENGTH_ORDER[:clen_count]:
+		fields.append((lengths.get(symbol, 0), 3))
+	zero_runs = [138, 256 - single_zeros - 138]
+	fields += [(1, 2)] * single_zeros										#literals 0..(single_zeros - 1) : length 0
+	for run in zero_runs:													#other literals : length 0 (symbol 18, runs of 11..138)
+		fields += [(0, 1), (run - 11, 7)]
+	fields += [(3, 2), (1, 2), (0, 1)]										#end-of-block : length 1, distance 0 : length 0, end-of-block
+	value = 0
+	nbits = 0
+	for field, width in fields:
+		value |= field << nbits
+		nbits += width
+	return value, nbits
+
+#File-like view of a compressed file that starts at a checkpoint : a stored deflate block holding the checkpoint
+#window (which primes the inflater history), an empty block ending on the checkpoint bit, then the original
+#compressed data.
+class _ResumeFile:
+
+	def __init__(self, f, point):
+		self.f = f
+		#non-final stored block (BFINAL = 0, BTYPE = 00), LEN, NLEN, window.
+		head = b"\x00" + struct.pack("<HH", len(point.window), 0xffff ^ len(point.window)) + point.window
+		if point.bits:
+			#the top "bits" bits of the byte before "inp" start the next block : merge them with the empty block tail.
+			f.seek(point.inp - 1)
+			value, nbits = _empty_block_bits(8 - point.bits)
+			value |= (ord(f.read(1)) >> (8 - point.bits)) << nbits
+			nbits += point.bits
+			head += bytearray((value >> i) & 0xff for i in range(0, nbits, 8))
+		else:
+			f.seek(point.inp)
+		self._head = bytes(head)
+
+	def read(self, size):
+		if self._head:
+			head = self._head
+			self._head = b""
+			return head
+		return self.f.read(size)
+
+	def close(self):
+		self.f.close()
+
+#Open a raw deflate file for reading at a decompressed offset, resuming at the closest checkpoint.
+#input : path of the raw deflate file, CheckpointIndex, decompressed offset.
+#output : stream_decompress.InflateReader positioned at "offset" (tell() returns offsets in the decompressed file).
+def open_at(path, index, offset):
+	point = index.find(offset)
+	reader = stream_decompress.InflateReader(_ResumeFile(open(path, "rb"), point), CHUNK_SIZE, start_offset=point.out - len(point.window))
+	reader.skip(len(point.window))
+	reader.seek(offset)
+	return reader
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+
+#Metadata-only summary of CityScape PSD scan files and RAW IQ files.
+#Only the block metadata (timestamp, frequencies, ReadingKind, location) is parsed; the data point fields
+#(field 5 of SpectralPsdDataBlock, field 4 of SpectralIqDataBlock) are skipped at the wire level using their
+#length prefix. RAW IQ point counts follow from the length prefix; PSD point counts (packed varints) are
+#obtained by counting the terminating bytes of the field, which reads it but never decodes it.
+
+#Usage (library) :
+#	config, summary = file_summary.summarize_file(path, wire_format.ScanFileReader)
+#	for line in file_summary.format_summary(summary) : print line
+#Requirements: Python 2.7 with Protoc Python bindings and NumPy.
+
+import collections
+import time
+import stream_decompress
+import wire_format
+
+#Reading Kind enum -> name (as printed by psdFile_process.py).
+READING_KIND_NAMES = {0 : "Average", 1 : "Minimum", 2 : "Maximum", 3 : "StdDev of Average", 4 : "StdDev of Minimum", 5 : "StdDev of Maximum", 6 : "Avg of Minimum", 7 : "Avg of Maximum"}
+
+#Summary of the data blocks of a file.
+class FileSummary:
+
+	def __init__(self):
+		self.block_count = 0
+		self.min_time = float("inf")			#POSIX timestamps (seconds)
+		self.max_time = -float("inf")
+		self.min_freq = float("inf")			#minimum StartFrequencyHz
+		self.max_freq = -float("inf")			#maximum StopFrequencyHz
+		self.total_points = 0					#PSD values / IQ samples (None if not counted)
+		self.data_bytes = 0						#size of the packed data point fields
+		self.reading_kinds = collections.Counter()	#Reading_Kind -> number of blocks (PSD only)
+		self.locations = collections.Counter()		#NmeaGpggaLocation -> number of blocks
+
+	#Account for one block.
+	#input : wire_format.BlockMetadata, number of wire values per data point (1 for PSD, 2 for IQ), None if the values were not counted.
+	def add(self, block_metadata, values_per_point):
+		meta = block_metadata.meta
+		self.block_count += 1
+		timestamp = wire_format.timestamp_seconds(meta.Time_stamp)
+		self.min_time = min(self.min_time, timestamp)
+		self.max_time = max(self.max_time, timestamp)
+		self.min_freq = min(self.min_freq, meta.StartFrequencyHz)
+		self.max_freq = max(self.max_freq, meta.StopFrequencyHz)
+		self.data_bytes += block_metadata.data_length
+		if values_per_point is None:
+			self.total_points = None
+		elif self.total_points is not None:
+			self.total_points += block_metadata.value_count // values_per_point
+		if hasattr(meta, "Reading_Kind"):
+			self.reading_kinds[meta.Reading_Kind] += 1
+		self.locations[meta.NmeaGpggaLocation] += 1
+
+#Summarize the data blocks of a reader without decoding their data points.
+#input : wire_format.ScanFileReader / RawIqFileReader, count_points (False : skip the PSD data points without counting them;
+#        total_points is then None. RAW IQ points are always counted, from the length prefix).
+#output : FileSummary
+def summarize(reader, count_points=True):
+	summary = FileSummary()
+	values_per_point = 1
+	if isinstance(reader, wire_format.RawIqFileReader):
+		values_per_point = 2
+		count_values = wire_format.count_packed_doubles
+	elif count_points:
+		count_values = wire_format.count_packed_varints
+	else:
+		count_values = wire_format.skip_packed_values
+		values_per_point = None
+
+	for block_metadata in reader.iter_block_metadata(count_values):
+		summary.add(block_metadata, values_per_point)
+	return summary
+
+#Summarize a data file (compressed or not).
+#input : path, reader class (wire_format.ScanFileReader / wire_format.RawIqFileReader), count_points (see summarize())
+#output : (Config, FileSummary)
+def summarize_file(path, reader_class, count_points=True):
+	f_stream, input_format = stream_decompress.open_data_stream(path)
+	try:
+		reader = reader_class(f_stream)
+		summary = summarize(reader, count_points)
+	finally:
+		f_stream.close()
+	return reader.Config, summary
+
+#Format a summary as text lines (same units as the per-block summaries of the CLIs).
+#input : FileSummary
+#output : list of strings
+def format_summary(summary):
+	lines = ["blocks # : " + str(summary.block_count)]
+	if summary.block_count > 0:
+		#Python automatically adjusts the timezone, but that is not desirable. So, roll-back by adding back the time offset "time.altzone".
+		lines.append("min_time : " + time.ctime(summary.min_time + time.altzone))
+		lines.append("max_time : " + time.ctime(summary.max_time + time.altzone))
+		lines.append("min starting freq : " + str(summary.min_freq / 1e6) + "MHz")
+		lines.append("max stoping freq : " + str(summary.max_freq / 1e6) + "MHz")
+	if summary.total_points is not None:
+		lines.append("Total Data points #: " + str(summary.total_points))
+	lines.append("Data point field size : " + str(summary.data_bytes) + "Bytes (" + str(summary.data_bytes / (1024.0 * 1024)) + "MiB)")
+	if len(summary.reading_kinds) > 0:
+		lines.append("ReadingKind histogram :")
+		for reading_kind in sorted(summary.reading_kinds):
+			lines.append("\t" + READING_KIND_NAMES.get(reading_kind, "?????????") + " : " + str(summary.reading_kinds[reading_kind]))
+	lines.append("distinct NmeaGpggaLocation # : " + str(len(summary.locations)))
+	if len(summary.locations) > 0:
+		location, count = summary.locations.most_common(1)[0]
+		lines.append("most common NmeaGpggaLocation : " + location + " (" + str(count) + " blocks)")
+	return lines
@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+
+#Consolidated MAT-file export : all the data blocks of an input file in one MATLAB (level 5) .mat file,
+#instead of one .mat file per block (psdFile_process.py / rawIQ_process.py -m 0 --mat-consolidated).
+#Each block adds one column to the data matrix (MATLAB stores matrices column by column, so a column is a
+#contiguous run of values) and one element to each per-block vector (timestamp, frequencies, ...).
+#While the input is read, the columns are appended to temporary spool files in the output directory (the data is
+#never held in memory); close() then streams the spool files into the .mat file in chunks, through zlib if
+#compression is requested (a "compressed" variable must start with its final size and dimensions, which are only
+#known once every block has been read).
+#Note : level 5 MAT files limit each variable to 4 GB (before compression). The limit is checked as each block is
+#added (ValueError as soon as a block would exceed it), not once every block has been spooled.
+
+#Usage (library) :
+#	mat_writer = mat_export.PsdMatWriter(path + ".mat", compress=True)
+#	mat_writer.add_block(block_number, timestamp, data_block, db_data)
+#	mat_writer.close()
+#	(MATLAB : load('file.mat'); plot(data(:, 10)))
+#Requirements: Python 2.7 with NumPy.
+
+import os.path
+import struct
+import tempfile
+import time
+import zlib
+import numpy as np
+
+#Amount of data copied from the spool files at a time (bytes).
+CHUNK_SIZE = 4 << 20
+
+#Level 5 MAT-file data types and array classes (see the MAT-file format documentation).
+_MI_INT8 = 1
+_MI_INT32 = 5
+_MI_UINT32 = 6
+_MI_SINGLE = 7
+_MI_DOUBLE = 9
+_MI_MATRIX = 14
+_MI_COMPRESSED = 15
+_MX_DOUBLE_CLASS = 6
+_MX_SINGLE_CLASS = 7
+_MX_COMPLEX_FLAG = 0x800
+
+#numpy dtype -> (data type, array class)
+_TYPES = {
+	np.dtype(np.float32) : (_MI_SINGLE, _MX_SINGLE_CLASS),
+	np.dtype(np.float64) : (_MI_DOUBLE, _MX_DOUBLE_CLASS),
+}
+
+#Largest variable of a level 5 MAT file (the size field of a data element is 32 bits).
+_MAX_ELEMENT_SIZE = (1 << 32) - 1
+
+def _padding(size):
+	return "\0" * (-size % 8)
+
+#Data element (tag + data + padding to 8 bytes) holding a small amount of data.
+def _element(data_type, data):
+	return struct.pack("<II", data_type, len(data)) + data + _padding(len(data))
+
+#Header (array flags, dimensions, name) of a miMATRIX element.
+def _matrix_header(name, dtype, rows, columns, part_count):
+	flags = _TYPES[dtype][1]
+	if part_count == 2:
+		flags |= _MX_COMPLEX_FLAG
+	return _element(_MI_UINT32, struct.pack("<II", flags, 0)) + _element(_MI_INT32, struct.pack("<ii", rows, columns)) + _element(_MI_INT8, name)
+
+#Size of a miMATRIX element (without its tag); ValueError if it is larger than a level 5 MAT file allows.
+#input : variable name, numpy dtype of the values, dimensions, number of parts (real, imaginary).
+#output : size (bytes)
+def _matrix_size(name, dtype, rows, columns, part_count):
+	part_size = rows * columns * dtype.itemsize
+	size = len(_matrix_header(name, dtype, rows, columns, part_count)) + part_count * (8 + part_size + len(_padding(part_size)))
+	if size > _MAX_ELEMENT_SIZE:
+		raise ValueError("Variable %s would take %d bytes with %d columns, more than the 4 GB a level 5 MAT file allows for a variable; write one .mat file per block instead (-m N, or -m 0 without --mat-consolidated), or select fewer blocks (--since / --until)." % (name, size, columns))
+	return size
+
+#Write a matrix as a miMATRIX element.
+#input : output (with a write() method), variable name, numpy dtype of the values (float32 / float64), dimensions,
+#        parts (real, and imaginary for complex values) : bytes, or files read from their start.
+def _write_matrix(out, name, dtype, rows, columns, parts):
+	data_type = _TYPES[dtype][0]
+	part_size = rows * columns * dtype.itemsize
+	size = _matrix_size(name, dtype, rows, columns, len(parts))
+	out.write(struct.pack("<II", _MI_MATRIX, size) + _matrix_header(name, dtype, rows, columns, len(parts)))
+	for part in parts:
+		out.write(struct.pack("<II", data_type, part_size))
+		if isinstance(part, bytes):
+			out.write(part)
+		else:
+			part.seek(0)
+			while True:
+				chunk = part.read(CHUNK_SIZE)
+				if not chunk:
+					break
+				out.write(chunk)
+		out.write(_padding(part_size))
+
+#Column-major matrix, filled one column at a time through spool files (one per part : real, imaginary).
+class _SpooledMatrix:
+
+	#input : numpy dtype of the stored values (float32 / float64), complex (two parts), directory of the spool files.
+	def __init__(self, dtype, is_complex, directory):
+		self.dtype = np.dtype(dtype)
+		self.is_complex = is_complex
+		self.rows = None
+		self.columns = 0
+		self.parts = [tempfile.TemporaryFile(dir=directory)]
+		if is_complex:
+			self.parts.append(tempfile.TemporaryFile(dir=directory))
+
+	def append(self, name, column):
+		column = np.asarray(column)
+		if self.rows is None:
+			self.rows = len(column)
+		elif len(column) != self.rows:
+			raise ValueError("Column %d of %s has %d values instead of %d; a consolidated MAT file needs the same number of values in every block." % (self.columns + 1, name, len(column), self.rows))
+		#fail before spooling a column that the MAT file could not hold.
+		_matrix_size(name, self.dtype, self.rows, self.columns + 1, len(self.parts))
+		if self.is_complex:
+			np.ascontiguousarray(column.real, self.dtype).tofile(self.parts[0])
+			np.ascontiguousarray(column.imag, self.dtype).tofile(self.parts[1])
+		else:
+			np.ascontiguousarray(column, self.dtype).tofile(self.parts[0])
+		self.columns += 1
+
+	def write(self, name, out):
+		_write_matrix(out, name, self.dtype, self.rows or 0, self.columns, self.parts)
+
+	def close(self):
+		for part in self.parts:
+			part.close()
+
+#Compresses what is written to it into a file (zlib stream), counting the compressed bytes.
+class _CompressedOutput:
+
+	def __init__(self, f):
+		self.f = f
+		self.compressor = zlib.compressobj()
+		self.size = 0
+
+	def write(self, data):
+		self._emit(self.compressor.compress(data))
+
+	def finish(self):
+		self._emit(self.compressor.flush())
+
+	def _emit(self, data):
+		self.f.write(data)
+		self.size += len(data)
+
+#MAT file made of column-major matrices filled one column per block, and 1 x N per-block vectors (double).
+class ConsolidatedMatWriter:
+
+	#input : path of the .mat file, compress (zlib-compressed variables), description (header text).
+	def __init__(self, path, compress=False, description="CityScape data export"):
+		self.path = path
+		self.compress = compress
+		self.description = description
+		self.directory = os.path.dirname(os.path.abspath(path))
+		self.matrices = {}			#name -> _SpooledMatrix
+		self.vectors = {}			#name -> list of values
+		self.names = []				#variable names, in order of first use
+
+	#Append a column to a matrix.
+	#input : variable name, column (1-D array), stored dtype (float32 / float64), complex values.
+	def append_column(self, name, column, dtype=np.float64, is_complex=False):
+		matrix = self.matrices.get(name)
+		if matrix is None:
+			matrix = self.matrices[name] = _SpooledMatrix(dtype, is_complex, self.directory)
+			self.names.append(name)
+		matrix.append(name, column)
+
+	#Append a value to a per-block vector.
+	def append_value(self, name, value):
+		values = self.vectors.get(name)
+		if values is None:
+			values = self.vectors[name] = []
+			self.names.append(name)
+		values.append(value)
+
+	#Write the .mat file and remove the spool files.
+	def close(self):
+		try:
+			with open(self.path, "wb") as f:
+				text = "MATLAB 5.0 MAT-file, Platform: " + os.name + ", Created on: " + time.ctime() + ", " + self.description
+				f.write(text[:116].ljust(116) + struct.pack("<8sH2s", "\0" * 8, 0x0100, "IM"))
+				for name in self.names:
+					self._write_variable(f, name)
+		finally:
+			for matrix in self.matrices.values():
+				matrix.close()
+
+	def _write_variable(self, f, name):
+		if not self.compress:
+			self._write_matrix(f, name)
+			return
+		#miCOMPRESSED element : its size is known once the data is compressed; write the tag again then.
+		tag_position = f.tell()
+		f.write(struct.pack("<II", _MI_COMPRESSED, 0))
+		out = _CompressedOutput(f)
+		self._write_matrix(out, name)
+		out.finish()
+		end = f.tell()
+		f.seek(tag_position)
+		f.write(struct.pack("<II", _MI_COMPRESSED, out.size))
+		f.seek(end)
+
+	def _write_matrix(self, out, name):
+		if name in self.matrices:
+			self.matrices[name].write(name, out)
+		else:
+			vector = np.array(self.vectors[name], np.float64)
+			_write_matrix(out, name, vector.dtype, 1, len(vector), [vector.tostring()])
+
+#Consolidated MAT export of PSD data blocks.
+#Variables : data (bins x blocks, single; data(:, k) is the PSD of block k in dB, exact since Q7 values fit in single),
+#cnt (block numbers), timestamp, start_freq, end_freq, reading_kind (ReadingKind enum values).
+class PsdMatWriter(ConsolidatedMatWriter):
+
+	def __init__(self, path, compress=False):
+		ConsolidatedMatWriter.__init__(self, path, compress, "CityScape PSD scan file export")
+
+	#input : block number, timestamp (as in the per-block .mat files), PsdDataBlock, PSD data in dB.
+	def add_block(self, block_number, timestamp, data_block, db_data):
+		self.append_value("cnt", block_number)
+		self.append_value("timestamp", timestamp)
+		self.append_value("start_freq", data_block.StartFrequencyHz)
+		self.append_value("end_freq", data_block.StopFrequencyHz)
+		self.append_value("reading_kind", data_block.Reading_Kind)
+		self.append_column("data", db_data, np.float32)
+
+#Consolidated MAT export of RAW IQ snapshots.
+#Variables : data (samples x snapshots, complex double, or complex single for complex64 samples; data(:, k) is
+#snapshot k), cnt (snapshot numbers), timestamp, freq (CenterFrequencyHz).
+class IqMatWriter(ConsolidatedMatWriter):
+
+	def __init__(self, path, compress=False):
+		ConsolidatedMatWriter.__init__(self, path, compress, "CityScape RAW IQ file export")
+
+	#input : snapshot number, timestamp (as in the per-snapshot .mat files), IqDataBlock, complex samples
+	#        (complex128 / complex64).
+	def add_block(self, block_number, timestamp, data_block, samples):
+		self.append_value("cnt", block_number)
+		self.append_value("timestamp", timestamp)
+		self.append_value("freq", data_block.CenterFrequencyHz)
+		self.append_column("data", samples, np.float32 if samples.dtype == np.complex64 else np.float64, True)
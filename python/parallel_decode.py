@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+
+#Parallel decoding of the data blocks of CityScape PSD scan files and RAW IQ files over a pool of worker processes.
+#The parent process does the framing pass only : it reads the serialized data blocks one after another (length
+#prefixes, see wire_format.py) and copies them into a shared input buffer. The workers decode the blocks of a batch
+#(PSD : zigzag varints -> int16 and Q7 -> dB; RAW IQ : DataPoints -> float64) straight into shared output buffers,
+#so the converted arrays are never pickled; only the block metadata (a few hundred bytes per block) is sent back.
+#The shared buffers are split in two halves : the workers decode one batch while the parent fills the other half
+#with the next one. Blocks are handed out in file order.
+
+#Usage (library) :
+#	f_stream, input_format = stream_decompress.open_data_stream(path)
+#	for data_block in parallel_decode.ParallelFileReader(wire_format.ScanFileReader(f_stream), workers=4).SpectralPsdData: ...
+#Note : the arrays of a data block are views of the shared buffers, overwritten two batches later (copy them to keep them).
+#Requirements: Python 2.7 with Protoc Python bindings and NumPy.
+
+import ctypes
+import multiprocessing
+import numpy as np
+import block_index
+import decode_backends
+import psd_convert
+import stream_decompress
+import wire_format
+
+#Size of the shared input buffer (both halves, bytes of serialized blocks). The output buffers are sized from it :
+#10 bytes per input byte for PSD (int16 + float64 per varint), 1 byte per input byte for RAW IQ.
+DEFAULT_BUFFER_SIZE = 8 << 20
+
+#Per-kind block parser (method of the decoding backends, see decode_backends.py) and metadata class.
+_KINDS = {
+	block_index.KIND_PSD : ("parse_psd", wire_format.psdFile_pb2.SpectralPsdDataBlock),
+	block_index.KIND_IQ : ("parse_iq", wire_format.rawIQ_pb2.SpectralIqDataBlock),
+}
+
+#Shared buffers of a worker process (set by _init_worker).
+_shared = {}
+
+#Pool initializer : keep the shared buffers (inherited from the parent) as numpy views, and pick the decoding backend.
+def _init_worker(kind, backend_name, shared_input, shared_values, shared_decibel):
+	_shared["kind"] = kind
+	_shared["parse_block"] = getattr(decode_backends.get_backend(backend_name), _KINDS[kind][0])
+	_shared["input"] = shared_input
+	if kind == block_index.KIND_PSD:
+		_shared["values"] = np.frombuffer(shared_values, wire_format.PSD_DTYPE)
+		_shared["decibel"] = np.frombuffer(shared_decibel, np.float64)
+	else:
+		_shared["values"] = np.frombuffer(shared_values, np.float64)
+
+#Position of the output values of a block in the shared output buffer.
+#A block of n bytes decodes to at most n PSD values (one byte per varint at least) and n / 8 IQ values,
+#so placing the output at the block's input offset (in values) never overlaps the next block.
+#input : KIND_PSD / KIND_IQ, offset of the serialized block in the shared input buffer.
+def _output_start(kind, start):
+	if kind == block_index.KIND_PSD:
+		return start
+	return (start + 7) // 8
+
+#Worker task : decode a contiguous run of blocks of the shared input buffer.
+#input : list of (offset, length) of the serialized blocks in the shared input buffer.
+#output : list of (serialized block metadata, number of output values), in the same order.
+def _decode_blocks(blocks):
+	kind = _shared["kind"]
+	parse_block = _shared["parse_block"]
+	values = _shared["values"]
+	results = []
+	for start, length in blocks:
+		data_block = parse_block(stream_decompress.buffer_view(_shared["input"], start, length))
+		out = _output_start(kind, start)
+		if kind == block_index.KIND_PSD:
+			points = data_block.OutputDataPoints
+			values[out:out + len(points)] = points
+			psd_convert.q7_to_decibel(points, out=_shared["decibel"][out:out + len(points)])
+		else:
+			points = data_block.DataPoints
+			values[out:out + len(points)] = points
+		results.append((data_block.meta.SerializeToString(), len(points)))
+	return results
+
+#Streaming-reader look-alike (Config + data blocks) that decodes the data blocks with a pool of worker processes.
+#PSD data blocks carry the converted values as "db_data" (float64 dB) besides OutputDataPoints (int16);
+#every data block carries its 1-based "block_number".
+class ParallelFileReader(object):
+
+	#input : wire_format.ScanFileReader / RawIqFileReader (framing pass), number of worker processes (CPU count by default),
+	#        block numbers to decode (all by default), size of the shared input buffer, decoding backend name
+	#        (see decode_backends.py; with "auto", each worker times the backends on its first blocks).
+	def __init__(self, reader, workers=None, block_numbers=None, buffer_size=DEFAULT_BUFFER_SIZE, backend="numpy"):
+		self.kind = block_index.KIND_PSD
+		if isinstance(reader, wire_format.RawIqFileReader):
+			self.kind = block_index.KIND_IQ
+		self.workers = workers or multiprocessing.cpu_count()
+		self.block_numbers = None
+		if block_numbers is not None:
+			self.block_numbers = set(block_numbers)
+		self.reader = reader
+		self.backend = backend
+		self.parse_block = getattr(decode_backends.get_backend(backend), _KINDS[self.kind][0])
+		self.half_size = buffer_size // 2
+
+	@property
+	def Config(self):
+		return self.reader.Config
+
+	#Split a batch into one contiguous run of blocks per worker.
+	def _tasks(self, batch):
+		size = max(1, -(-len(batch) // self.workers))
+		return [[(start, length) for block_number, start, length in batch[i:i + size]] for i in range(0, len(batch), size)]
+
+	#Build the data blocks of a finished batch (views of the shared output buffers).
+	def _collect(self, batch, async_result):
+		meta_class = _KINDS[self.kind][1]
+		results = [result for task_results in async_result.get() for result in task_results]
+		for (block_number, start, length), (meta_bytes, count) in zip(batch, results):
+			meta = meta_class()
+			meta.ParseFromString(meta_bytes)
+			out = _output_start(self.kind, start)
+			if self.kind == block_index.KIND_PSD:
+				data_block = wire_format.PsdDataBlock(meta, self._values[out:out + count])
+				data_block.db_data = self._decibel[out:out + count]
+			else:
+				data_block = wire_format.IqDataBlock(meta, self._values[out:out + count])
+			data_block.block_number = block_number
+			yield data_block
+
+	#Decode a block that does not fit in half of the shared buffer, in the parent process.
+	def _decode_here(self, block_number, payload):
+		data_block = self.parse_block(payload)
+		if self.kind == block_index.KIND_PSD:
+			data_block.db_data = psd_convert.q7_to_decibel(data_block.OutputDataPoints)
+		data_block.block_number = block_number
+		return data_block
+
+	def iter_blocks(self):
+		shared_input = multiprocessing.RawArray(ctypes.c_char, 2 * self.half_size)
+		input_bytes = np.frombuffer(shared_input, np.uint8)
+		shared_decibel = None
+		if self.kind == block_index.KIND_PSD:
+			shared_values = multiprocessing.RawArray(ctypes.c_int16, 2 * self.half_size)
+			shared_decibel = multiprocessing.RawArray(ctypes.c_double, 2 * self.half_size)
+			self._values = np.frombuffer(shared_values, wire_format.PSD_DTYPE)
+			self._decibel = np.frombuffer(shared_decibel, np.float64)
+		else:
+			shared_values = multiprocessing.RawArray(ctypes.c_double, 2 * self.half_size // 8 + 1)
+			self._values = np.frombuffer(shared_values, np.float64)
+		pool = multiprocessing.Pool(self.workers, _init_worker, (self.kind, self.backend, shared_input, shared_values, shared_decibel))
+
+		pending = []		#submitted batches (batch, async result), oldest first; at most one per half.
+		half = 0
+		batch = []
+		used = 0
+		try:
+			for offset, payload in self.reader.iter_block_payloads():
+				block_number = self.reader.blocks_seen
+				if self.block_numbers is not None and block_number not in self.block_numbers:
+					continue
+				length = len(payload)
+
+				#the current half is full (or the block is too large for it) : hand it to the workers and switch
+				#to the other half, once the batch decoded there has been consumed.
+				if batch and (used + length > self.half_size or length > self.half_size):
+					pending.append((batch, pool.map_async(_decode_blocks, self._tasks(batch))))
+					half = 1 - half
+					batch = []
+					used = 0
+					if len(pending) == 2:
+						for data_block in self._collect(*pending.pop(0)):
+							yield data_block
+
+				if length > self.half_size:
+					while pending:
+						for data_block in self._collect(*pending.pop(0)):
+							yield data_block
+					yield self._decode_here(block_number, payload)
+					continue
+
+				start = half * self.half_size + used
+				input_bytes[start:start + length] = np.frombuffer(payload, np.uint8)
+				batch.append((block_number, start, length))
+				used += length
+
+			if batch:
+				pending.append((batch, pool.map_async(_decode_blocks, self._tasks(batch))))
+			while pending:
+				for data_block in self._collect(*pending.pop(0)):
+					yield data_block
+			pool.close()
+		except:
+			pool.terminate()
+			raise
+		finally:
+			pool.join()
+
+	def __iter__(self):
+		return self.iter_blocks()
+
+	@property
+	def SpectralPsdData(self):
+		return self.iter_blocks()
+
+	@property
+	def SpectralIqData(self):
+		return self.iter_blocks()
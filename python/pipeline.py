@@ -0,0 +1,351 @@
+#!/usr/bin/env python
+
+#Staged read / decode / process / write pipeline for psdFile_process.py and rawIQ_process.py (--pipeline).
+#Without it, each data block is read (and inflated), decoded, converted and written before the next one is read, so the
+#CPU is idle during disk writes and the disk is idle during conversion. With it, the stages run on separate threads :
+#	read    : one thread : framing pass over the (decompressed) stream, see wire_format.iter_block_payloads().
+#	decode  : one or more threads : block parser of the decoding backend (and Q7 -> dB for PSD blocks, as "db_data").
+#	process : the CLI loop, on the main thread (printing, plotting : matplotlib wants the main thread).
+#	write   : one thread per output file (CSV, mat, cfile, SigMF) : the writer calls are queued (AsyncWriter).
+#Stages are connected by bounded queues : at most "depth" blocks are read and not yet processed, and at most "depth"
+#calls are waiting in front of each writer. A full queue blocks the stage before it (backpressure), so memory stays
+#capped whatever the relative speed of the stages. Blocks are handed to the processing loop in file order.
+#Decompression, NumPy decoding, zlib and file writes release the GIL, which is what the stages overlap; the Python
+#parts of the stages still run one at a time (use -j for decoding on several processes instead).
+#The time of each stage is split into busy, waiting for input (empty queue) and blocked on output (full queue);
+#report() gives them as a percentage of the time the pipeline ran.
+
+#Usage (library) :
+#	stages = pipeline.Pipeline(depth=16)
+#	reader = stages.reader(wire_format.ScanFileReader(f_stream, parse_block=backend.parse_psd), backend.parse_psd)
+#	csv_writer = stages.writer(csv_export.PsdCsvWriter(path + ".csv"), "csv")
+#	for data_block in reader.SpectralPsdData : csv_writer.write_block(...)
+#	stages.drain()			#before closing the input stream : queued writes may hold views of it.
+#	csv_writer.close()
+#	for line in stages.report() : print line
+#Requirements: Python 2.7 with NumPy.
+
+import Queue
+import sys
+import threading
+import timeit
+import psd_convert
+import wire_format
+
+#Default number of blocks in flight between the reader and the processing loop (and of calls queued per writer).
+DEFAULT_DEPTH = 16
+
+#Interval at which a blocked stage checks whether the pipeline was stopped (seconds).
+_POLL_INTERVAL = 0.1
+
+#Writer methods that are queued to the writer thread (every other attribute is read from the writer directly).
+QUEUED_METHODS = ("write", "write_block", "write_samples", "add_block")
+
+#End of stream marker.
+_END = object()
+
+#Raised in a stage thread when the pipeline is stopped.
+class _Stopped(Exception):
+	pass
+
+#Time spent by one stage (seconds), and number of items it handled.
+class StageStats:
+
+	def __init__(self, name):
+		self.name = name
+		self.items = 0
+		self.busy = 0.0
+		self.waiting = 0.0			#waiting for input (empty queue)
+		self.blocked = 0.0			#blocked on output (full queue)
+
+	#input : wall-clock time of the pipeline (seconds)
+	#output : one-line summary
+	def summary(self, elapsed):
+		elapsed = max(elapsed, 1e-9)
+		return "%s : %d items, busy %.1f%%, waiting for input %.1f%%, blocked on output %.1f%%" % (self.name, self.items, 100 * self.busy / elapsed, 100 * self.waiting / elapsed, 100 * self.blocked / elapsed)
+
+#Put an item in a bounded queue, giving up if the pipeline is stopped.
+#input : queue, item, threading.Event set when the pipeline stops, StageStats (time blocked is added to it).
+def _put(queue, item, stopped, stats):
+	start = timeit.default_timer()
+	try:
+		while True:
+			try:
+				queue.put(item, True, _POLL_INTERVAL)
+				return
+			except Queue.Full:
+				if stopped.is_set():
+					raise _Stopped()
+	finally:
+		stats.blocked += timeit.default_timer() - start
+
+#Get an item from a queue, giving up if the pipeline is stopped.
+def _get(queue, stopped, stats):
+	start = timeit.default_timer()
+	try:
+		while True:
+			try:
+				return queue.get(True, _POLL_INTERVAL)
+			except Queue.Empty:
+				if stopped.is_set():
+					raise _Stopped()
+	finally:
+		stats.waiting += timeit.default_timer() - start
+
+def _start_thread(name, target, *args):
+	thread = threading.Thread(target=target, name=name, args=args)
+	thread.daemon = True
+	thread.start()
+	return thread
+
+#Streaming-reader look-alike (Config + data blocks) whose blocks are read and decoded on pipeline threads.
+#PSD data blocks carry their dB values as "db_data" (a new array for every block, like the -j reader);
+#every data block carries its 1-based "block_number".
+class PipelinedReader(object):
+
+	#input : wire_format.ScanFileReader / RawIqFileReader (read stage), block parser (decode stage, e.g. a
+	#        decode_backends.py backend's parse_psd / parse_iq), Pipeline, number of decode threads.
+	def __init__(self, reader, parse_block, stages, decoders=1):
+		self.reader = reader
+		self.parse_block = parse_block
+		self.is_psd = isinstance(reader, wire_format.ScanFileReader)
+		self.stages = stages
+		self.decoders = max(1, decoders)
+		self.read_stats = stages.add_stage("read")
+		self.decode_stats = [stages.add_stage("decode" if self.decoders == 1 else "decode " + str(n + 1)) for n in range(self.decoders)]
+
+	@property
+	def Config(self):
+		return self.reader.Config
+
+	#Read stage : serialized blocks, numbered in file order.
+	def _read(self, payloads, slots):
+		stats = self.read_stats
+		sequence = 0
+		try:
+			start = timeit.default_timer()
+			for offset, payload in self.reader.iter_block_payloads():
+				stats.busy += timeit.default_timer() - start
+				_put(slots, None, self.stages.stopped, stats)
+				_put(payloads, (sequence, self.reader.blocks_seen, payload), self.stages.stopped, stats)
+				stats.items += 1
+				sequence += 1
+				start = timeit.default_timer()
+			stats.busy += timeit.default_timer() - start
+			for n in range(self.decoders):
+				_put(payloads, _END, self.stages.stopped, stats)
+		except _Stopped:
+			pass
+		except:
+			self.stages.fail(sys.exc_info())
+
+	#Decode stage : parsed (and, for PSD, converted) blocks, in the order they are finished.
+	def _decode(self, payloads, blocks, stats):
+		try:
+			while True:
+				item = _get(payloads, self.stages.stopped, stats)
+				if item is _END:
+					_put(blocks, _END, self.stages.stopped, stats)
+					return
+				start = timeit.default_timer()
+				sequence, block_number, payload = item
+				data_block = self.parse_block(payload)
+				data_block.block_number = block_number
+				if self.is_psd:
+					data_block.db_data = psd_convert.q7_to_decibel(data_block.OutputDataPoints)
+				stats.busy += timeit.default_timer() - start
+				stats.items += 1
+				_put(blocks, (sequence, data_block), self.stages.stopped, stats)
+		except _Stopped:
+			pass
+		except:
+			self.stages.fail(sys.exc_info())
+
+	#Process stage (the caller's loop) : blocks in file order.
+	def iter_blocks(self):
+		depth = self.stages.depth
+		slots = Queue.Queue(depth)		#one entry per block in flight : caps the blocks read and not yet processed.
+		payloads = Queue.Queue(depth)
+		blocks = Queue.Queue(depth)
+		stats = self.stages.process_stats
+		self.stages.start()
+		_start_thread("pipeline read", self._read, payloads, slots)
+		for decode_stats in self.decode_stats:
+			_start_thread("pipeline " + decode_stats.name, self._decode, payloads, blocks, decode_stats)
+
+		finished = {}			#decoded blocks waiting for an earlier one (several decode threads)
+		next_sequence = 0
+		running = self.decoders
+		try:
+			#busy : time spent in the caller's loop, except blocked on the writer queues (counted by AsyncWriter).
+			start = timeit.default_timer()
+			blocked = stats.blocked
+			while running > 0 or finished:
+				stats.busy += timeit.default_timer() - start - (stats.blocked - blocked)
+				while next_sequence not in finished and running > 0:
+					item = self.stages.get(blocks)
+					if item is _END:
+						running -= 1
+					else:
+						finished[item[0]] = item[1]
+				start = timeit.default_timer()
+				blocked = stats.blocked
+				if next_sequence not in finished:
+					break
+				data_block = finished.pop(next_sequence)
+				next_sequence += 1
+				slots.get_nowait()
+				stats.items += 1
+				yield data_block
+			stats.busy += timeit.default_timer() - start - (stats.blocked - blocked)
+		finally:
+			self.stages.stop()
+
+	def __iter__(self):
+		return self.iter_blocks()
+
+	@property
+	def SpectralPsdData(self):
+		return self.iter_blocks()
+
+	@property
+	def SpectralIqData(self):
+		return self.iter_blocks()
+
+#Writer proxy : the QUEUED_METHODS calls are run in order on a writer thread; the caller only waits when "depth"
+#calls are already queued. Arrays passed to the writer must not be modified afterwards (the blocks of PipelinedReader
+#and of the plain readers are new for every block).
+class AsyncWriter(object):
+
+	#input : writer (csv_export / mat_export / cfile_export / sigmf_export object), stage name, Pipeline.
+	def __init__(self, writer, name, stages):
+		self.writer = writer
+		self.stages = stages
+		self.stats = StageStats("write " + name)
+		self.calls = Queue.Queue(stages.depth)
+		self.error = None
+		self.thread = _start_thread("pipeline write " + name, self._run)
+
+	def _run(self):
+		stats = self.stats
+		while True:
+			start = timeit.default_timer()
+			call = self.calls.get()
+			stats.waiting += timeit.default_timer() - start
+			try:
+				if call is _END:
+					return
+				if self.error is None:
+					start = timeit.default_timer()
+					getattr(self.writer, call[0])(*call[1])
+					stats.busy += timeit.default_timer() - start
+					stats.items += 1
+			except:
+				self.error = sys.exc_info()
+				self.stages.fail(self.error)
+			finally:
+				self.calls.task_done()
+
+	def _check(self):
+		if self.error is not None:
+			raise self.error[0], self.error[1], self.error[2]
+
+	def __getattr__(self, name):
+		if name not in QUEUED_METHODS:
+			return getattr(self.writer, name)
+		#(the writer thread keeps taking calls after an error, so a full queue never blocks for good.)
+		def queue_call(*args):
+			self._check()
+			start = timeit.default_timer()
+			self.calls.put((name, args))
+			self.stages.process_stats.blocked += timeit.default_timer() - start
+		return queue_call
+
+	#Wait until every queued call has been run.
+	def drain(self):
+		if self.thread.is_alive():
+			self.calls.join()
+		self._check()
+
+	#Run the queued calls, stop the writer thread and close the writer.
+	def close(self):
+		if self.thread.is_alive():
+			self.calls.put(_END)
+			self.thread.join()
+		self._check()
+		self.writer.close()
+
+#Threads, queues and statistics of one pipeline run.
+class Pipeline:
+
+	#input : maximum number of blocks in flight between the reader and the processing loop (and of calls queued per writer).
+	def __init__(self, depth=DEFAULT_DEPTH):
+		self.depth = max(1, depth)
+		self.stages = []			#StageStats of the read and decode threads
+		self.writers = []
+		self.process_stats = StageStats("process")
+		self.stopped = threading.Event()
+		self.errors = Queue.Queue()
+		self.started = None
+		self.elapsed = None
+
+	def add_stage(self, name):
+		stats = StageStats(name)
+		self.stages.append(stats)
+		return stats
+
+	#PipelinedReader over a reader (see PipelinedReader).
+	def reader(self, reader, parse_block, decoders=1):
+		return PipelinedReader(reader, parse_block, self, decoders)
+
+	#AsyncWriter over a writer (see AsyncWriter).
+	def writer(self, writer, name):
+		async_writer = AsyncWriter(writer, name, self)
+		self.writers.append(async_writer)
+		return async_writer
+
+	def start(self):
+		if self.started is None:
+			self.started = timeit.default_timer()
+
+	#Stop the read and decode threads (end of the processing loop, or error).
+	def stop(self):
+		self.stopped.set()
+
+	#Record an error of a stage thread and stop the pipeline; it is raised again in the processing loop.
+	def fail(self, exc_info):
+		self.errors.put(exc_info)
+		self.stop()
+
+	def _check(self):
+		if not self.errors.empty():
+			exc_info = self.errors.get()
+			raise exc_info[0], exc_info[1], exc_info[2]
+
+	#Get an item from a stage queue in the processing loop (errors of the stage threads are raised here).
+	def get(self, queue):
+		start = timeit.default_timer()
+		try:
+			while True:
+				self._check()
+				try:
+					return queue.get(True, _POLL_INTERVAL)
+				except Queue.Empty:
+					pass
+		finally:
+			self.process_stats.waiting += timeit.default_timer() - start
+
+	#Wait until every writer has run its queued calls.
+	def drain(self):
+		for async_writer in self.writers:
+			async_writer.drain()
+		if self.started is not None and self.elapsed is None:
+			self.elapsed = timeit.default_timer() - self.started
+		self._check()
+
+	#Per-stage utilization (after drain()).
+	#output : list of lines
+	def report(self):
+		elapsed = self.elapsed or 0.0
+		stages = self.stages + [self.process_stats] + [async_writer.stats for async_writer in self.writers]
+		return ["%d stages over %.2fs (queue depth %d)" % (len(stages), elapsed, self.depth)] + [stats.summary(elapsed) for stats in stages]
@@ -13,17 +13,24 @@
 
 import sys
 import argparse
+import block_filter
+import block_index
+import csv_export
+import decode_backends
+import deflate_index
+import file_summary
+import mat_export
+import parallel_decode
+import pipeline
 import psdFile_pb2
 import os.path
 import time
 import matplotlib.pyplot as plt
 import numpy as np
 import scipy.io as sio
-import zlib
-
-#Decompress (before parsing)
-def decompress (dat):
-	return zlib.decompress(dat,-15)
+import psd_convert
+import stream_decompress
+import wire_format
 
 #Converts "Reading Kind" enum to String.
 #("Reading Kind" enums is an enumeratation type used by the PSD scan file to identify the 
@@ -53,19 +60,11 @@ def get_reading_kind(reading_kind):
 #Converts the data (Q format fixed floating point) to the proper floating point decibel representation.
 #See https://en.wikipedia.org/wiki/Q_(number_format) for Q format.
 #The output data will be an array of floating point numbers representing power spectral density (in dB).
+#(vectorized, see psd_convert.py; Short.Min_VALUE = NaN for this particular implementation.)
 #input : numpy int[] of PSD data
 #output : double[] data
 def data_to_float_decibel(ary):
-	result = np.zeros(len(ary))
-
-	for i in range(0, len(ary)-1):
-		#Fortunately, the expression will be almost always true (therefore performance drop from the branch hazard is negligible).
-		if ary[i] != -32768:	#Short.Min_VALUE = NaN (for this particular implementation).
-			result[i] = ary[i] / float(1<<7) #expected equation..
-		else:
-			result[i] = np.nan
-
-	return result
+	return psd_convert.q7_to_decibel(ary)
 
 #Determines the time scale used by the timestamp.
 #Must be multiplied to the timestamp to get second-scale time.
@@ -93,9 +92,9 @@ def determine_timescale(scale):
 	
 #Print out the "config" section of the data file and call "print_data_block_summary"
 #to print out the summarized version of the data blocks.
-#input: psdFile_pb2.ScanFile()
+#input: psdFile_pb2.ScanFile() or wire_format.ScanFileReader(), block index records to summarize (-x, see print_data_block_summary)
 #output: none (directly prints out to stdout)
-def print_file_summary(data,plot_psd,dump_csv,dump_mat):
+def print_file_summary(data,plot_psd,dump_csv,dump_mat,summary_records=None):
 	
 	#Print out station configurations
 	print "\n \n \n \n -----------------CONFIG BLOCK-----------------"
@@ -106,22 +105,25 @@ def print_file_summary(data,plot_psd,dump_csv,dump_mat):
 
 	#Print out summary of the data blocks.
 	print "--------------DATA BLOCK SUMMARY--------------"
-	print_data_block_summary(data,plot_psd,dump_csv,dump_mat)
+	print_data_block_summary(data,plot_psd,dump_csv,dump_mat,summary_records)
 	print "------------DATA BLOCK SUMMARY END------------ \n "
 
 #Print out summary of the data blocks.
-#input: psdFile_pb2.ScanFile()
+#input: psdFile_pb2.ScanFile() or wire_format.ScanFileReader(),
+#       block index records to summarize (with -x, only the selected blocks are read : the final summary is then computed
+#       from the index records of every block matching the filters instead of from the blocks read).
 #output: none (directly prints out to stdout)
-def print_data_block_summary(data,plot_psd,dump_csv,dump_mat):
+def print_data_block_summary(data,plot_psd,dump_csv,dump_mat,summary_records=None):
 	cnt = 0						#total number of data blocks present in a file.
 	data_cnt_sum = 0			#total number of data points (=blocks * points per each block).
 	min_freq = float("inf")	#minimum frequency observed.
 	max_freq = -1				#maximum frequency observed.
+	converter = psd_convert.Q7Converter()	#Q7 -> dB converter (re-uses its output buffer from block to block).
 	
 	#for each data block
 	for data_block in data.SpectralPsdData:
-		#increment block counter.
-		cnt = cnt + 1
+		#increment block counter. (the readers number the blocks as they appear in the file, so skipped blocks keep their numbers.)
+		cnt = getattr(data_block, "block_number", cnt + 1)
 		
 		#determine timestamp scale. (I think both minute-scale and hour-scale timestamps are used for these files, I don't know why.)
 		time_scale = determine_timescale(data_block.Time_stamp.scale)
@@ -135,9 +137,11 @@ def print_data_block_summary(data,plot_psd,dump_csv,dump_mat):
 		print "\t NmeaGpggaLocation : " + data_block.NmeaGpggaLocation
 		print "\t Data count : " + str(len(data_block.OutputDataPoints))	#note : data_block.OutputDataPoints is not the true decibel representation of the PSD data! Please see below.
 
-		#Convert data points from Q format to IEEE754 floating point.
-		#!!!!!slow part!!!!!
-		db_data = data_to_float_decibel(data_block.OutputDataPoints)
+		#Convert data points from Q format to IEEE754 floating point (vectorized, no per-block allocation).
+		#(blocks decoded by worker processes, see -j, are already converted.)
+		db_data = getattr(data_block, "db_data", None)
+		if db_data is None:
+			db_data = converter.convert(data_block.OutputDataPoints)
 		
 		#plot the result (if requested).
 		if plot_psd == cnt or plot_psd == 0:
@@ -148,25 +152,14 @@ def print_data_block_summary(data,plot_psd,dump_csv,dump_mat):
 			plt.ylabel('PSD (dBm/Bin if Calibrated Sensor, dBFS/Bin if Not Calibrated)')
 			plt.show()
 
-		#dump to a CSV file (if requested).
+		#dump to a CSV file (if requested). The values are formatted a whole block at a time, see csv_export.py.
 		if dump_csv == cnt or dump_csv == 0:
-			f_write.write("Block," + str(cnt) + "\n")
-			f_write.write("timestamp," + time.ctime(data_block.Time_stamp.value*time_scale  + time.altzone) + "\n")	#Python automatically adjusts the timezone, but that is not desirable. So, roll-back by adding back the time offset  "time.altzone". 
-			f_write.write("Start Freq," + str((data_block.StartFrequencyHz)/1e6) + "Mhz" + "\n")
-			f_write.write("Stop Freq," + str((data_block.StopFrequencyHz)/1e6) + "Mhz" + "\n")
-			f_write.write("Data Type," + get_reading_kind(data_block.Reading_Kind) + "\n")
-			f_write.write("NmeaGpggaLocation," + data_block.NmeaGpggaLocation + "\n")
-			f_write.write("Data count," + str(len(data_block.OutputDataPoints)) + "\n")
-			
-			#dump the main IQ data
-			f_write.write("------DATA STARTS HERE------ \n")
-			f_write.write("\n".join(str(x) for x in db_data))				
-
-			#add an extra line at the end of the block.
-			f_write.write("\n")
-
-		#dump to a mat file (if requested).
-		if dump_mat == cnt or dump_mat == 0:
+			f_write.write_block(cnt, time.ctime(data_block.Time_stamp.value*time_scale  + time.altzone), data_block)	#Python automatically adjusts the timezone, but that is not desirable. So, roll-back by adding back the time offset  "time.altzone". 
+
+		#dump to a mat file (if requested) : one file for every block (--mat-consolidated), or one file per block.
+		if dump_mat == 0 and mat_writer:
+			mat_writer.add_block(cnt, data_block.Time_stamp.value*time_scale  + time.altzone, data_block, db_data)
+		elif dump_mat == cnt or dump_mat == 0:
 			sio.savemat(str(cnt)+'.mat',{'cnt':cnt,'timestamp':data_block.Time_stamp.value*time_scale  + time.altzone,'start_freq':data_block.StartFrequencyHz,'end_freq':data_block.StopFrequencyHz,'data_type':get_reading_kind(data_block.Reading_Kind), 'data':db_data})
 
 		#update minimum frequency and the maximum frequency observed so far (if necessary).
@@ -178,12 +171,37 @@ def print_data_block_summary(data,plot_psd,dump_csv,dump_mat):
 	
 	#For loop finished; print out the final summary.
 	print "\n---------SUMMARY---------------\n"
+	if summary_records is not None:
+		print "(from the block index : " + str(len(summary_records)) + " blocks matching the filters, not only the blocks read)"
+		min_freq = float("inf")
+		max_freq = -1
+		if len(summary_records) > 0:
+			min_freq = summary_records["start_freq"].min()
+			max_freq = summary_records["stop_freq"].max()
+		data_cnt_sum = int(summary_records["point_count"].sum())
 	print "min starting freq : " +  str((min_freq)/1e6) + "Mhz"
 	print "max stoping freq : " +  str((max_freq)/1e6) + "Mhz"
 	print "Total Data points #: " + str(data_cnt_sum)
 	print "Data point size (upper bound): " + str(data_cnt_sum * 3) + "Bytes (" + str((data_cnt_sum * 3)/(1024.0*1024)) + "MiB)"
 	print "\n-------------------------------\n"
 
+#Print out the "config" section of the data file and a metadata-only summary of the data blocks
+#(data points are skipped at the wire level, see file_summary.py).
+#input: wire_format reader (ScanFileReader / RawIqFileReader)
+#output: none (directly prints out to stdout)
+def print_summary_only(data):
+
+	#Print out station configurations
+	print "\n \n \n \n -----------------CONFIG BLOCK-----------------"
+	print str(data.Config).replace("\\n","\n\t").replace("\\r","").replace("\\t","\t")
+	print "---------------CONFIG BLOCK END---------------\n \n \n \n"
+
+	#Print out the summary.
+	print "\n---------SUMMARY---------------\n"
+	for line in file_summary.format_summary(file_summary.summarize(data)):
+		print line
+	print "\n-------------------------------\n"
+
 #--------------------------------------------------
 # Main routine (int main() equivalent)
 #--------------------------------------------------
@@ -194,33 +212,101 @@ parser.add_argument("path", help="input file path")
 parser.add_argument("-p", "--plot-psd", type=int, nargs='?', const=-1, help="Plot PSD Data at (PLOT_PSD)th block. Prints out every snapshots if setted zero.")
 parser.add_argument("-d", "--dump-csv", type=int, nargs='?', const=-1, help="Dumps (DUMP_CSV)th data block to a CSV file. Name of the generated snapshot file is equal to the name of the input file with .csv appended at the end. Dumps out every snapshots if setted zero.")
 parser.add_argument("-m", "--dump-mat", type=int, nargs='?', const=-1, help="Dumps (DUMP_CSV)th data block to a mat file. Dumps out every snapshots if setted zero.")
+parser.add_argument("-s", "--summary-only", action="store_true", help="Only print the config block and a summary (time / frequency range, data point count, ReadingKind histogram). Data points are skipped, not decoded.")
+parser.add_argument("-x", "--index", action="store_true", help="Use a block offset index (PATH.idx, built on first use) to read only the blocks selected by -p/-d/-m, instead of every block before them.")
+parser.add_argument("--index-dir", help="With -x (and -z), directory where the index files are written when the directory of the input file cannot be written (by default, the indexes are then only kept in memory for this run).")
+parser.add_argument("-z", "--checkpoints", action="store_true", help="With -x, on raw deflate input : also use a deflate checkpoint index (PATH.zidx, built on first use) to start inflating close to the selected blocks instead of at the start of the file.")
+parser.add_argument("-j", "--jobs", type=int, help="Decode the data blocks (and convert them to dB) with JOBS worker processes. The blocks are still processed in file order.")
+parser.add_argument("-b", "--backend", choices=decode_backends.BACKEND_CHOICES, default="auto", help="Decoder of the data blocks : NumPy wire decoder (numpy), generated protobuf classes (pb2, or accelerated : only on the C++ / upb protobuf runtime), or the fastest of them on the first blocks (auto, default).")
+parser.add_argument("--csv-layout", choices=csv_export.LAYOUTS, default=csv_export.LAYOUT_BLOCK, help="Layout of the CSV dump (-d) : per-block header lines followed by one value per line (block, default), or one row per block with one column per bin (wide).")
+parser.add_argument("--mat-consolidated", action="store_true", help="With -m 0, write every block to one mat file (name of the input file with .mat appended) : a bins x blocks data matrix plus cnt, timestamp, start_freq, end_freq and reading_kind vectors, instead of one mat file per block.")
+parser.add_argument("--mat-compress", action="store_true", help="With --mat-consolidated, compress the mat file.")
+parser.add_argument("--pipeline", type=int, nargs='?', const=1, help="Read (and inflate), decode, process and write the data blocks on separate threads connected by bounded queues, with PIPELINE decoding threads (1 if not given), and print the utilization of each stage at the end. Not used with -x or -j (their readers are used instead).")
+parser.add_argument("--pipeline-depth", type=int, default=pipeline.DEFAULT_DEPTH, help="With --pipeline, maximum number of data blocks read ahead of the processing loop, and of writes queued per output file (default : " + str(pipeline.DEFAULT_DEPTH) + ").")
+block_filter.add_filter_arguments(parser)
 args=parser.parse_args()
 
-#open file.
-f = open(args.path,"rb");
-
 #make a CSV file if necessary.
 if args.dump_csv >= 0:
-	f_write = open(args.path+".csv","w");
+	f_write = csv_export.PsdCsvWriter(args.path+".csv",args.csv_layout);
 else:
 	f_write = "";
 
-#Attempt decompression. If fails, assume decompressed data and just push that into the Protobuf decoder.
-f_str = f.read()
-f.close()
-try:
-	decompress_out = decompress (f_str)
-	f_str = decompress_out
-except Exception:
-	pass
-	
-#Parse.
-scan_file_read = psdFile_pb2.ScanFile()
-scan_file_read.ParseFromString(f_str)
+#make a consolidated mat file if necessary.
+if args.dump_mat == 0 and args.mat_consolidated:
+	mat_writer = mat_export.PsdMatWriter(args.path+".mat",args.mat_compress);
+else:
+	mat_writer = "";
+
+#Open the file. The format (compressed or not) is detected from the leading bytes; compressed files are inflated chunk by chunk while reading.
+f_stream, input_format = stream_decompress.open_data_stream(args.path)
+print "Input format : " + input_format
+
+#Block filters (--since, --until, --freq-min, --freq-max, --reading-kind), checked on the block metadata before the data points are decoded.
+data_filter = block_filter.filter_from_args(args)
+
+#Parse, one data block at a time (blocks are parsed while being processed, not all at once).
+decoder = decode_backends.get_backend(args.backend)
+scan_file_read = wire_format.ScanFileReader(f_stream, data_filter, decoder.parse_psd)
+summary_records = None
+
+#With the block index, only read the selected blocks (unless every block was requested with 0) that match the filters.
+selected_blocks = [n for n in (args.plot_psd, args.dump_csv, args.dump_mat) if n is not None and n >= 0]
+if args.index and not args.summary_only and (len(selected_blocks) > 0 and 0 not in selected_blocks or data_filter is not None):
+	index = block_index.load_or_build_index(args.path, block_index.KIND_PSD, args.index_dir)
+	print "Block index : " + str(len(index)) + " blocks (" + block_index.describe_location(index, args.path) + ")"
+	summary_records = index.records
+	if data_filter is not None:
+		matching_blocks = data_filter.select(index.records)
+		summary_records = index.records[np.array(matching_blocks, np.int64) - 1]
+		if len(selected_blocks) > 0 and 0 not in selected_blocks:
+			matching_blocks = [n for n in matching_blocks if n in selected_blocks]
+		selected_blocks = matching_blocks
+	checkpoints = None
+	if args.checkpoints and input_format == stream_decompress.FORMAT_RAW_DEFLATE:
+		checkpoints = deflate_index.load_or_build_checkpoints(args.path, cache_dir=args.index_dir)
+		print "Checkpoint index : " + str(len(checkpoints)) + " checkpoints (" + block_index.describe_location(checkpoints, args.path) + ")"
+	scan_file_read = block_index.IndexedFile(args.path, index, selected_blocks, checkpoints=checkpoints, parse_block=decoder.parse_psd)
+elif args.jobs > 1 and not args.summary_only:
+	#Decode the data blocks on several worker processes (the file is still read sequentially by this process).
+	scan_file_read = parallel_decode.ParallelFileReader(scan_file_read, args.jobs, backend=args.backend)
+
+#Read, decode and write on their own threads, connected by bounded queues (see pipeline.py); blocks are still processed in file order.
+stages = None
+if args.pipeline and not args.summary_only and isinstance(scan_file_read, wire_format.ScanFileReader):
+	stages = pipeline.Pipeline(args.pipeline_depth)
+	scan_file_read = stages.reader(scan_file_read, decoder.parse_psd, args.pipeline)
+	if f_write:
+		f_write = stages.writer(f_write, "csv")
+	if mat_writer:
+		mat_writer = stages.writer(mat_writer, "mat")
 
 #process.
-print_file_summary(scan_file_read,args.plot_psd,args.dump_csv,args.dump_mat)
+if args.summary_only:
+	print_summary_only(scan_file_read)
+else:
+	print_file_summary(scan_file_read,args.plot_psd,args.dump_csv,args.dump_mat,summary_records)
+if stages is not None:
+	stages.drain()
+f_stream.close()
+if f_stream.stats is not None:
+	print "Decompression : " + f_stream.stats.summary()
+print "Input format counts : " + stream_decompress.format_counts_summary()		#files opened through each decoding path (raw deflate / zlib / gzip / protobuf)
+if not args.summary_only:
+	if isinstance(scan_file_read, parallel_decode.ParallelFileReader):
+		print "Decoding backend : " + args.backend + " (in the worker processes)"
+	else:
+		print "Decoding backend : " + decoder.describe()
+if stages is not None:
+	report = stages.report()
+	print "Pipeline : " + report[0]
+	for line in report[1:]:
+		print "\t " + line
 
 #close the csv dump file.
 if args.dump_csv >= 0:
 	f_write.close()
+
+#write the consolidated mat file.
+if mat_writer:
+	mat_writer.close()
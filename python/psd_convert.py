@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+
+#Vectorized conversion of CityScape PSD data points to decibels.
+#PSD values are stored as Q7 fixed-point numbers (signed int16, 7 fractional bits), with
+#Short.MIN_VALUE (-32768) used as the NaN sentinel.
+#See https://en.wikipedia.org/wiki/Q_(number_format) for Q format.
+
+#Usage (library) :
+#	db = psd_convert.q7_to_decibel(data_block.OutputDataPoints)		#one block
+#	psd_convert.q7_to_decibel(stacked_blocks, out=db_matrix)		#2-D (blocks x bins) stack, written into db_matrix
+#Requirements: Python 2.7 with NumPy.
+
+import numpy as np
+
+#Scale of the Q7 fixed-point format (value = raw / 2^7).
+Q7_SCALE = 1.0 / (1 << 7)
+
+#Raw value used as NaN (Short.MIN_VALUE).
+NAN_SENTINEL = -32768
+
+#Converts Q7 fixed-point PSD data to dB, in one vectorized pass (plus one pass for the NaN sentinel).
+#input : int array of PSD data (one block, or a 2-D stack of blocks), output buffer (optional, float32 / float64,
+#        same shape), output dtype (if out is not given), boolean scratch buffer for the NaN mask (optional, same shape).
+#output : float array of PSD data in dB (= out if it was given). -32768 is converted to NaN.
+def q7_to_decibel(ary, out=None, dtype=np.float64, mask=None):
+	ary = np.asarray(ary)
+	if out is None:
+		out = np.empty(ary.shape, dtype)
+	np.multiply(ary, Q7_SCALE, out=out)
+	if mask is None:
+		mask = ary == NAN_SENTINEL
+	else:
+		np.equal(ary, NAN_SENTINEL, out=mask)
+	np.copyto(out, np.nan, where=mask)
+	return out
+
+#Converts blocks to dB one after another, reusing the same output and scratch buffers while the block size
+#does not change, so converting a whole file makes no per-block allocations.
+#Note : the array returned by convert() is overwritten by the next call (copy it to keep it).
+class Q7Converter:
+
+	def __init__(self, dtype=np.float64):
+		self.dtype = np.dtype(dtype)
+		self._out = None
+		self._mask = None
+
+	#input : int array of PSD data (one block or a 2-D stack of blocks)
+	#output : float array of PSD data in dB (internal buffer).
+	def convert(self, ary):
+		ary = np.asarray(ary)
+		if self._out is None or self._out.shape != ary.shape:
+			self._out = np.empty(ary.shape, self.dtype)
+			self._mask = np.empty(ary.shape, np.bool_)
+		return q7_to_decibel(ary, self._out, mask=self._mask)
+
+#Converts a sequence of blocks into the rows of a caller-provided 2-D array.
+#input : iterable of int arrays (one per block, all of length out.shape[1]), output array (blocks x bins, float32 / float64).
+#output : number of rows written.
+def convert_blocks(blocks, out):
+	mask = np.empty(out.shape[1], np.bool_)
+	rows = 0
+	for ary in blocks:
+		q7_to_decibel(ary, out[rows], mask=mask)
+		rows += 1
+	return rows
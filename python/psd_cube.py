@@ -0,0 +1,296 @@
+#!/usr/bin/env python
+
+#Columnar in-memory representation of a CityScape PSD scan file.
+#A PsdCube holds the PSD values of all data blocks in one contiguous 2-D array (blocks x bins), next to
+#one numpy column per block attribute (timestamp as datetime64, start / stop frequency, ReadingKind, block number).
+#It is built in a single streaming pass over the file (the arrays are allocated once if a block index gives the
+#number of blocks, otherwise grown and trimmed in place); slicing by time (on a chronological file) and by frequency
+#returns views of the arrays, not copies.
+#The values are stored as the raw Q7 fixed-point int16 of the file (2 bytes per value instead of 8 in float64 dB);
+#float32 dB values are computed on access, for the slice accessed only, optionally with a small LRU cache of
+#converted slices (cache_size).
+#split_by_reading_kind() routes the blocks of an aggregated file (Average, Minimum, Maximum, ... interleaved) to
+#one PsdCube per ReadingKind in the same single pass.
+
+#Usage (library) :
+#	cube = psd_cube.PsdCube.from_file(path)
+#	evening = cube.time_slice("2015-08-19T18:00", "2015-08-19T21:00").freq_slice(470e6, 698e6)
+#	evening.decibel(), evening.timestamps, evening.frequencies()
+#	week_max_hold = np.nanmax(psd_cube.split_file_by_reading_kind(path)[2].decibel(), axis=0)		#2 : Maximum
+#Requirements: Python 2.7 with Protoc Python bindings and NumPy.
+
+import collections
+import numpy as np
+import psd_convert
+import stream_decompress
+import wire_format
+
+#Resolution of the timestamp column.
+TIMESTAMP_DTYPE = "datetime64[us]"
+
+#dtype of the dB values computed on access.
+DECIBEL_DTYPE = np.float32
+
+#Number of rows allocated first when the number of blocks is not known in advance (doubled in place when full,
+#and the unused rows released in place at the end, see _CubeBuilder).
+INITIAL_CAPACITY = 256
+
+#Convert POSIX timestamps (seconds) to datetime64.
+def to_datetime64(seconds):
+	return np.round(np.asarray(seconds, np.float64) * 1e6).astype(np.int64).view(TIMESTAMP_DTYPE)
+
+#Convert a time bound (datetime64, ISO 8601 string, or POSIX timestamp in seconds) to datetime64.
+def _as_datetime64(value):
+	if isinstance(value, (int, long, float, np.number)) and not isinstance(value, np.datetime64):
+		return to_datetime64(value)
+	return np.datetime64(value).astype(TIMESTAMP_DTYPE)
+
+#LRU cache of the dB conversions of PsdCube slices, shared by a cube and the views taken from it.
+#Entries are keyed by the memory region of the int16 slice (address, shape, strides), and returned read-only.
+class DecibelCache:
+
+	#input : maximum number of converted slices kept (0 : no caching).
+	def __init__(self, size=0):
+		self.size = size
+		self.entries = collections.OrderedDict()
+		self.hits = 0
+		self.misses = 0
+
+	#output : dB values of an int16 slice (float32), converted or from the cache.
+	def convert(self, values):
+		if self.size <= 0:
+			return psd_convert.q7_to_decibel(values, dtype=DECIBEL_DTYPE)
+		key = (values.__array_interface__["data"][0], values.shape, values.strides)
+		decibel = self.entries.pop(key, None)
+		if decibel is None:
+			self.misses += 1
+			decibel = psd_convert.q7_to_decibel(values, dtype=DECIBEL_DTYPE)
+			decibel.setflags(write=False)
+			if len(self.entries) >= self.size:
+				self.entries.popitem(last=False)
+		else:
+			self.hits += 1
+		self.entries[key] = decibel
+		return decibel
+
+	def clear(self):
+		self.entries.clear()
+
+#PSD data of a scan file, as a (blocks x bins) array plus per-block columns.
+#All blocks must have the same number of bins.
+class PsdCube:
+
+	#input : 2-D array of raw PSD values (int16 Q7, blocks x bins), then one 1-D column per block : timestamps (datetime64),
+	#        StartFrequencyHz, StopFrequencyHz, Reading_Kind, block numbers (1-based, in the file); Config (optional),
+	#        DecibelCache (optional, none by default).
+	def __init__(self, values, timestamps, start_freq, stop_freq, reading_kind, block_numbers, config=None, cache=None):
+		self.values = values
+		self.timestamps = timestamps
+		self.start_freq = start_freq
+		self.stop_freq = stop_freq
+		self.reading_kind = reading_kind
+		self.block_numbers = block_numbers
+		self.Config = config
+		self.cache = cache or DecibelCache()
+
+	def __len__(self):
+		return len(self.values)
+
+	#Number of frequency bins.
+	@property
+	def bins(self):
+		return self.values.shape[1]
+
+	#PSD values in dB (float32, blocks x bins; NaN for missing values), converted now (or taken from the cache).
+	#Slice the cube first to convert only the part needed.
+	def decibel(self):
+		return self.cache.convert(self.values)
+
+	#Same as decibel().
+	@property
+	def data(self):
+		return self.decibel()
+
+	#Select blocks (rows). Slices return views; index arrays / boolean masks return copies.
+	def __getitem__(self, rows):
+		if isinstance(rows, (int, long, np.integer)):
+			rows = slice(rows, rows + 1 if rows != -1 else None)
+		values = self.values[rows]
+		cache = self.cache
+		if not np.may_share_memory(values, self.values):
+			#a copy : its cache entries cannot be told apart from those of other copies at the same address.
+			cache = DecibelCache(self.cache.size)
+		return PsdCube(values, self.timestamps[rows], self.start_freq[rows], self.stop_freq[rows], self.reading_kind[rows], self.block_numbers[rows], self.Config, cache)
+
+	#Check whether every block covers the same frequency range (needed for a common frequency axis).
+	def uniform_frequencies(self):
+		return len(self) == 0 or ((self.start_freq == self.start_freq[0]).all() and (self.stop_freq == self.stop_freq[0]).all())
+
+	#Frequency of each bin (Hz), common to all blocks.
+	def frequencies(self):
+		if len(self) == 0:
+			return np.zeros(self.bins)
+		if not self.uniform_frequencies():
+			raise ValueError("The blocks do not cover the same frequency range; there is no common frequency axis.")
+		return np.linspace(self.start_freq[0], self.stop_freq[0], num=self.bins)
+
+	#Blocks with a timestamp in [since, until] (datetime64, ISO 8601 strings or POSIX timestamps; None : unbounded).
+	#On a chronological cube (the usual case) the result is a view; otherwise the matching rows are copied.
+	def time_slice(self, since=None, until=None):
+		timestamps = self.timestamps
+		if len(timestamps) < 2 or (timestamps[1:] >= timestamps[:-1]).all():
+			first = 0
+			last = len(timestamps)
+			if since is not None:
+				first = np.searchsorted(timestamps, _as_datetime64(since), "left")
+			if until is not None:
+				last = np.searchsorted(timestamps, _as_datetime64(until), "right")
+			return self[first:max(first, last)]
+		mask = np.ones(len(timestamps), np.bool_)
+		if since is not None:
+			mask &= timestamps >= _as_datetime64(since)
+		if until is not None:
+			mask &= timestamps <= _as_datetime64(until)
+		return self[mask]
+
+	#Bins with a frequency in [freq_min, freq_max] (Hz; None : unbounded), as a view.
+	#The start / stop frequency columns of the result are those of the first / last bin kept.
+	def freq_slice(self, freq_min=None, freq_max=None):
+		freqs = self.frequencies()
+		first = 0
+		last = len(freqs)
+		if freq_min is not None:
+			first = np.searchsorted(freqs, freq_min, "left")
+		if freq_max is not None:
+			last = np.searchsorted(freqs, freq_max, "right")
+		last = max(first, last)
+		start_freq = np.full(len(self), freqs[first] if first < len(freqs) else np.nan)
+		stop_freq = np.full(len(self), freqs[last - 1] if last > first else np.nan)
+		return PsdCube(self.values[:, first:last], self.timestamps, start_freq, stop_freq, self.reading_kind, self.block_numbers, self.Config, self.cache)
+
+	#Blocks of the given ReadingKind(s) (copies, since the kinds are usually interleaved).
+	def select_reading_kind(self, *reading_kinds):
+		return self[np.in1d(self.reading_kind, reading_kinds)]
+
+	#Build a cube from the data blocks of a reader, in one pass.
+	#input : wire_format.ScanFileReader (or any reader with Config and SpectralPsdData), number of blocks if known
+	#        (the array is then allocated once; otherwise its capacity is doubled when it is full),
+	#        number of converted slices to cache (see DecibelCache).
+	#output : PsdCube
+	@staticmethod
+	def from_reader(reader, block_count=None, cache_size=0):
+		builder = _CubeBuilder(block_count)
+		for data_block in reader.SpectralPsdData:
+			builder.append(data_block)
+		return builder.finish(reader.Config, cache_size)
+
+	#Build a cube from a PSD scan file (compressed or not).
+	#input : path, BlockIndex of the file (optional; its point counts are checked and the array is allocated once),
+	#        block filter (optional, see block_filter.py), number of converted slices to cache (see DecibelCache).
+	#output : PsdCube
+	@staticmethod
+	def from_file(path, index=None, block_filter=None, cache_size=0):
+		block_count = None
+		if index is not None:
+			block_count = _index_counts(path, index, block_filter, False)
+		f_stream, input_format = stream_decompress.open_data_stream(path)
+		try:
+			return PsdCube.from_reader(wire_format.ScanFileReader(f_stream, block_filter), block_count, cache_size)
+		finally:
+			f_stream.close()
+
+#Block counts of a file per ReadingKind, from its block index (after a block filter, if any).
+#Also checks that the blocks of each kind have the same number of bins.
+#input : path (for error messages), BlockIndex, BlockFilter (or None), split by ReadingKind (otherwise, one count).
+#output : {ReadingKind : number of blocks} if by_kind, else number of blocks.
+def _index_counts(path, index, block_filter, by_kind):
+	records = index.records
+	if block_filter is not None:
+		records = records[np.array(block_filter.select(records), np.int64) - 1]
+	groups = {None : records}
+	if by_kind:
+		groups = dict((int(reading_kind), records[records["reading_kind"] == reading_kind]) for reading_kind in np.unique(records["reading_kind"]))
+	for group in groups.values():
+		if len(group) > 0 and (group["point_count"] != group["point_count"][0]).any():
+			raise ValueError("The blocks of " + path + " do not all have the same number of bins; a PsdCube needs the same number of bins in every block.")
+	if by_kind:
+		return dict((reading_kind, len(group)) for reading_kind, group in groups.items())
+	return len(records)
+
+#Split the data blocks of a reader by ReadingKind, in one pass : each block is appended to the cube of its kind.
+#input : wire_format.ScanFileReader (or any reader with Config and SpectralPsdData),
+#        {ReadingKind : number of blocks} if known (the arrays are then allocated once),
+#        number of converted slices to cache (per cube, see DecibelCache).
+#output : OrderedDict {ReadingKind : PsdCube}, by ReadingKind value; the blocks of each kind may have their own bin count.
+def split_by_reading_kind(reader, block_counts=None, cache_size=0):
+	builders = {}
+	for data_block in reader.SpectralPsdData:
+		reading_kind = data_block.Reading_Kind
+		builder = builders.get(reading_kind)
+		if builder is None:
+			builder = builders[reading_kind] = _CubeBuilder((block_counts or {}).get(reading_kind))
+		builder.append(data_block)
+	return collections.OrderedDict((reading_kind, builders[reading_kind].finish(reader.Config, cache_size)) for reading_kind in sorted(builders))
+
+#Split a PSD scan file (compressed or not) by ReadingKind, in one pass.
+#input : path, BlockIndex of the file (optional; gives the block count of each kind, so each array is allocated once),
+#        block filter (optional, see block_filter.py), number of converted slices to cache (per cube, see DecibelCache).
+#output : OrderedDict {ReadingKind : PsdCube}
+def split_file_by_reading_kind(path, index=None, block_filter=None, cache_size=0):
+	block_counts = None
+	if index is not None:
+		block_counts = _index_counts(path, index, block_filter, True)
+	f_stream, input_format = stream_decompress.open_data_stream(path)
+	try:
+		return split_by_reading_kind(wire_format.ScanFileReader(f_stream, block_filter), block_counts, cache_size)
+	finally:
+		f_stream.close()
+
+#Accumulates data blocks into the arrays of a PsdCube.
+class _CubeBuilder:
+
+	#input : number of blocks if known (the arrays are then allocated once; otherwise their capacity is doubled when full).
+	#The arrays are only referenced by the builder until finish(), so they are grown and trimmed in place
+	#(ndarray.resize : a realloc(), which moves the data only if the memory after the array is taken).
+	def __init__(self, block_count=None):
+		self.capacity = block_count or INITIAL_CAPACITY
+		self.values = None
+		self.columns = None
+		self.rows = 0
+
+	def append(self, data_block):
+		points = data_block.OutputDataPoints
+		if self.values is None:
+			self.values = np.empty((self.capacity, len(points)), wire_format.PSD_DTYPE)
+			self.columns = np.empty(self.capacity, _COLUMNS_DTYPE)
+		elif len(points) != self.values.shape[1]:
+			raise ValueError("Block %d has %d bins instead of %d; a PsdCube needs the same number of bins in every block." % (getattr(data_block, "block_number", self.rows + 1), len(points), self.values.shape[1]))
+		if self.rows == len(self.values):
+			self.values.resize((2 * self.rows, self.values.shape[1]), refcheck=False)
+			self.columns.resize(2 * self.rows, refcheck=False)
+		self.values[self.rows] = points
+		self.columns[self.rows] = (wire_format.timestamp_seconds(data_block.Time_stamp), data_block.StartFrequencyHz, data_block.StopFrequencyHz, data_block.Reading_Kind, getattr(data_block, "block_number", self.rows + 1))
+		self.rows += 1
+
+	#input : Config, number of converted slices to cache.
+	#output : PsdCube
+	def finish(self, config, cache_size=0):
+		values = self.values
+		columns = self.columns
+		if values is None:
+			values = np.empty((0, 0), wire_format.PSD_DTYPE)
+			columns = np.empty(0, _COLUMNS_DTYPE)
+		elif self.rows < len(values):
+			#release the unused capacity.
+			values.resize((self.rows, values.shape[1]), refcheck=False)
+			columns.resize(self.rows, refcheck=False)
+		return PsdCube(values, to_datetime64(columns["timestamp"]), columns["start_freq"], columns["stop_freq"], columns["reading_kind"], columns["block_number"], config, DecibelCache(cache_size))
+
+#Per-block columns, gathered in one record array while building.
+_COLUMNS_DTYPE = np.dtype([
+	("timestamp", np.float64),
+	("start_freq", np.float64),
+	("stop_freq", np.float64),
+	("reading_kind", np.int8),
+	("block_number", np.int64),
+])
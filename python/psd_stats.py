@@ -0,0 +1,255 @@
+#!/usr/bin/env python
+
+#Streaming per-bin statistics of CityScape PSD data : count, mean, variance (Welford / Chan et al. updates, in
+#float64), minimum and maximum of the dB values of each frequency bin, kept separately for each ReadingKind.
+#NaN values (missing data) are left out of the statistics of their bin.
+#Partial statistics (e.g. of different files, or computed by different worker processes) merge associatively,
+#and the state can be saved to / loaded from disk (.npz), so long-term station statistics can be updated
+#incrementally, one file at a time.
+
+#Usage (library) :
+#	stats = psd_stats.aggregate_files(paths, workers=4)
+#	stats.merge(psd_stats.PsdStatistics.load("station.npz")).save("station.npz")
+#	average = stats.get(0).average()			#0 : Average
+#Usage (CLI) : python psd_stats.py station.npz file1.dsox file2.dsox ... [-j 4]
+#	(adds the files to the statistics saved in station.npz, creating it if needed; files already in it are skipped,
+#	a file being identified by its absolute path, size and modification time, see source_key())
+#Requirements: Python 2.7 with Protoc Python bindings and NumPy.
+
+import argparse
+import collections
+import multiprocessing
+import os.path
+import numpy as np
+import block_filter
+import file_summary
+import psd_convert
+import stream_decompress
+import wire_format
+
+#Statistics of the dB values of each frequency bin, over any number of blocks (all with the same bins).
+class BinStatistics:
+
+	#input : number of bins (0 : set by the first update), StartFrequencyHz / StopFrequencyHz of the blocks (optional).
+	def __init__(self, bins=0, start_freq=np.nan, stop_freq=np.nan):
+		self.start_freq = start_freq
+		self.stop_freq = stop_freq
+		self.count = np.zeros(bins, np.int64)				#number of (non-NaN) values
+		self.mean = np.zeros(bins, np.float64)				#running mean (0 where count is 0)
+		self.m2 = np.zeros(bins, np.float64)				#sum of squared deviations from the mean
+		self.min = np.full(bins, np.inf)
+		self.max = np.full(bins, -np.inf)
+
+	@property
+	def bins(self):
+		return len(self.count)
+
+	#Account for a batch of statistics of the same bins (Chan et al. pairwise update).
+	#input : count, mean, sum of squared deviations, minimum and maximum of each bin in the batch.
+	def _combine(self, count, mean, m2, minimum, maximum):
+		if self.bins == 0:
+			self.__init__(len(count), self.start_freq, self.stop_freq)
+		elif len(count) != self.bins:
+			raise ValueError("Cannot combine statistics of %d bins with statistics of %d bins." % (self.bins, len(count)))
+		total = self.count + count
+		weight = count / np.maximum(total, 1).astype(np.float64)		#share of the batch in the combined count
+		delta = mean - self.mean
+		self.m2 += m2 + delta * delta * self.count * weight
+		self.mean += delta * weight
+		self.count = total
+		np.fmin(self.min, minimum, out=self.min)
+		np.fmax(self.max, maximum, out=self.max)
+
+	#Add blocks of dB values.
+	#input : float array, one block (bins) or a stack of blocks (blocks x bins).
+	def update(self, db_data):
+		db_data = np.atleast_2d(np.asarray(db_data, np.float64))
+		valid = ~np.isnan(db_data)
+		count = valid.sum(axis=0)
+		values = np.where(valid, db_data, 0.0)
+		mean = values.sum(axis=0) / np.maximum(count, 1)
+		deviation = np.where(valid, db_data - mean, 0.0)
+		with np.errstate(invalid="ignore"):
+			minimum = np.fmin.reduce(db_data, axis=0)
+			maximum = np.fmax.reduce(db_data, axis=0)
+		self._combine(count, mean, (deviation * deviation).sum(axis=0), minimum, maximum)
+
+	#Add the statistics of another BinStatistics (same bins and frequencies).
+	#output : self
+	def merge(self, other):
+		if other.bins == 0:
+			return self
+		if self.bins != 0 and not (np.array_equal(self.start_freq, other.start_freq) and np.array_equal(self.stop_freq, other.stop_freq)):
+			raise ValueError("Cannot merge statistics of different frequency ranges (%s - %s Hz, %s - %s Hz)." % (self.start_freq, self.stop_freq, other.start_freq, other.stop_freq))
+		if self.bins == 0:
+			self.start_freq = other.start_freq
+			self.stop_freq = other.stop_freq
+		self._combine(other.count, other.mean, other.m2, other.min, other.max)
+		return self
+
+	#Mean of each bin (NaN where there is no value).
+	def average(self):
+		return np.where(self.count > 0, self.mean, np.nan)
+
+	#Variance of each bin (ddof : delta degrees of freedom, 1 for the sample variance; NaN where count <= ddof).
+	def variance(self, ddof=0):
+		with np.errstate(invalid="ignore", divide="ignore"):
+			return np.where(self.count > ddof, self.m2 / (self.count - ddof), np.nan)
+
+	def std(self, ddof=0):
+		return np.sqrt(self.variance(ddof))
+
+	#Frequency of each bin (Hz).
+	def frequencies(self):
+		return np.linspace(self.start_freq, self.stop_freq, num=self.bins)
+
+#Per-ReadingKind BinStatistics of PSD data, and the files they were computed from.
+class PsdStatistics:
+
+	def __init__(self):
+		self.kinds = {}				#ReadingKind -> BinStatistics
+		self.sources = []			#source_key() of the aggregated files
+
+	#Statistics of a ReadingKind (an empty BinStatistics of "bins" bins if there was no block of that kind).
+	def get(self, reading_kind, bins=0):
+		if reading_kind in self.kinds:
+			return self.kinds[reading_kind]
+		return BinStatistics(bins)
+
+	def _kind(self, reading_kind, start_freq, stop_freq):
+		stats = self.kinds.get(reading_kind)
+		if stats is None:
+			stats = self.kinds[reading_kind] = BinStatistics(0, start_freq, stop_freq)
+		elif stats.start_freq != start_freq or stats.stop_freq != stop_freq:
+			raise ValueError("ReadingKind %d : blocks of different frequency ranges (%s - %s Hz, %s - %s Hz)." % (reading_kind, stats.start_freq, stats.stop_freq, start_freq, stop_freq))
+		return stats
+
+	#Add one data block.
+	#input : PsdDataBlock (or SpectralPsdDataBlock), its dB values (converted from OutputDataPoints if not given).
+	def add_block(self, data_block, db_data=None):
+		if db_data is None:
+			db_data = psd_convert.q7_to_decibel(data_block.OutputDataPoints)
+		self._kind(data_block.Reading_Kind, data_block.StartFrequencyHz, data_block.StopFrequencyHz).update(db_data)
+
+	#Add the blocks of a PsdCube (psd_cube.py), one vectorized update per ReadingKind.
+	def add_cube(self, cube):
+		for reading_kind in np.unique(cube.reading_kind):
+			blocks = cube.select_reading_kind(reading_kind)
+			if not blocks.uniform_frequencies():
+				raise ValueError("ReadingKind %d : blocks of different frequency ranges." % reading_kind)
+			self._kind(int(reading_kind), blocks.start_freq[0], blocks.stop_freq[0]).update(blocks.decibel())
+
+	#Add the statistics of another PsdStatistics.
+	#output : self
+	def merge(self, other):
+		for reading_kind, stats in other.kinds.items():
+			if reading_kind in self.kinds:
+				self.kinds[reading_kind].merge(stats)
+			else:
+				self.kinds[reading_kind] = BinStatistics().merge(stats)
+		self.sources.extend(other.sources)
+		return self
+
+	#Save the statistics (.npz).
+	def save(self, path):
+		arrays = {"reading_kinds" : np.array(sorted(self.kinds), np.int64), "sources" : np.array(self.sources, dtype=object)}
+		for reading_kind, stats in self.kinds.items():
+			prefix = "kind%d_" % reading_kind
+			arrays[prefix + "freq"] = np.array([stats.start_freq, stats.stop_freq])
+			for name in ("count", "mean", "m2", "min", "max"):
+				arrays[prefix + name] = getattr(stats, name)
+		with open(path, "wb") as f:
+			np.savez(f, **arrays)
+
+	#Load statistics saved by save().
+	#output : PsdStatistics
+	@staticmethod
+	def load(path):
+		arrays = np.load(path, allow_pickle=True)
+		statistics = PsdStatistics()
+		statistics.sources = list(arrays["sources"])
+		for reading_kind in arrays["reading_kinds"]:
+			prefix = "kind%d_" % reading_kind
+			start_freq, stop_freq = arrays[prefix + "freq"]
+			stats = BinStatistics(0, start_freq, stop_freq)
+			for name in ("count", "mean", "m2", "min", "max"):
+				setattr(stats, name, arrays[prefix + name])
+			statistics.kinds[int(reading_kind)] = stats
+		return statistics
+
+#Identity of a source file in PsdStatistics.sources : absolute path, size and modification time (as the source of
+#a columnar_store.py manifest), so that files of the same name in different directories, or a file rewritten since
+#it was aggregated, are not taken for one another.
+#input : path
+#output : string
+def source_key(path):
+	return "%s (%d bytes, mtime %r)" % (os.path.abspath(path), os.path.getsize(path), os.path.getmtime(path))
+
+#Statistics of one PSD scan file (compressed or not).
+#input : path, block filter (optional, see block_filter.py).
+#output : PsdStatistics
+def aggregate_file(path, data_filter=None):
+	statistics = PsdStatistics()
+	converter = psd_convert.Q7Converter()
+	f_stream, input_format = stream_decompress.open_data_stream(path)
+	try:
+		for data_block in wire_format.ScanFileReader(f_stream, data_filter).SpectralPsdData:
+			statistics.add_block(data_block, converter.convert(data_block.OutputDataPoints))
+	finally:
+		f_stream.close()
+	statistics.sources.append(source_key(path))
+	return statistics
+
+def _aggregate_task(task):
+	return aggregate_file(*task)
+
+#Statistics of several PSD scan files, computed in parallel (one file per task) and merged.
+#input : paths, number of worker processes (1 : no pool), block filter (optional).
+#output : PsdStatistics
+def aggregate_files(paths, workers=1, data_filter=None):
+	tasks = [(path, data_filter) for path in paths]
+	if workers > 1 and len(tasks) > 1:
+		pool = multiprocessing.Pool(min(workers, len(tasks)))
+		try:
+			partials = pool.map(_aggregate_task, tasks)
+		finally:
+			pool.close()
+			pool.join()
+	else:
+		partials = [_aggregate_task(task) for task in tasks]
+	statistics = PsdStatistics()
+	for partial in partials:
+		statistics.merge(partial)
+	return statistics
+
+#--------------------------------------------------
+# Main routine (int main() equivalent)
+#--------------------------------------------------
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser()
+	parser.add_argument("state", help="statistics file (.npz), created if it does not exist")
+	parser.add_argument("paths", nargs="+", help="PSD scan files to add")
+	parser.add_argument("-j", "--jobs", type=int, default=1, help="number of worker processes (one file per process)")
+	block_filter.add_filter_arguments(parser)
+	args = parser.parse_args()
+
+	statistics = PsdStatistics()
+	if os.path.exists(args.state):
+		statistics = PsdStatistics.load(args.state)
+	paths = []
+	keys = set(statistics.sources)
+	for path in args.paths:
+		key = source_key(path)
+		if key in keys:
+			print "Skipped (already in " + args.state + ") : " + path
+		else:
+			keys.add(key)
+			paths.append(path)
+	statistics.merge(aggregate_files(paths, args.jobs, block_filter.filter_from_args(args)))
+	statistics.save(args.state)
+
+	print "Files : " + str(len(statistics.sources))
+	for reading_kind in sorted(statistics.kinds):
+		stats = statistics.kinds[reading_kind]
+		print "%s : %d bins, %.3f - %.3f MHz, %d values per bin (max)" % (file_summary.READING_KIND_NAMES.get(reading_kind, "?????????"), stats.bins, stats.start_freq / 1e6, stats.stop_freq / 1e6, stats.count.max())
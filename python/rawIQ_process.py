@@ -13,26 +13,33 @@
 
 import sys
 import argparse
+import block_filter
+import block_index
+import cfile_export
+import csv_export
+import decode_backends
+import deflate_index
+import file_summary
+import mat_export
+import parallel_decode
+import pipeline
 import rawIQ_pb2
+import sigmf_export
 import os.path
 import time
 import matplotlib.pyplot as plt
 import numpy as np
 import scipy.io as sio
-import zlib
+import stream_decompress
+import wire_format
 
 from scipy import signal
-from operator import add
-
-#Decompress (before parsing)
-def decompress (dat):
-	return zlib.decompress(dat,-15)
 
 #Print out the "config" section of the data file and call "print_data_block_summary"
 #to print out the summarized version of the RAW IQ snapshot blocks.
-#input: rawIQ_pb2.RawIqFile()
+#input: rawIQ_pb2.RawIqFile() or wire_format.RawIqFileReader(), block index records to summarize (-x, see print_data_block_summary)
 #output: none (directly prints out to stdout)
-def print_rawIQ_summary(rawIQ_read,raw_plot,psd_plot,dump_csv,f_write_csv,dump_mat,f_write_cfile,dump_cfile):
+def print_rawIQ_summary(rawIQ_read,raw_plot,psd_plot,dump_csv,f_write_csv,dump_mat,f_write_mat,f_write_cfile,dump_cfile,f_write_sigmf,dump_sigmf,complex_dtype,summary_records=None):
 
 	#Print out station configurations
 	print "\n \n \n \n -----------------CONFIG BLOCK-----------------"
@@ -43,13 +50,15 @@ def print_rawIQ_summary(rawIQ_read,raw_plot,psd_plot,dump_csv,f_write_csv,dump_m
 	
 	#Print out summary of the snapshot data blocks.
 	print "--------------DATA BLOCK SUMMARY--------------"
-	print_data_block_summary(rawIQ_read,raw_plot,psd_plot,dump_csv,f_write_csv,dump_mat,f_write_cfile,dump_cfile)
+	print_data_block_summary(rawIQ_read,raw_plot,psd_plot,dump_csv,f_write_csv,dump_mat,f_write_mat,f_write_cfile,dump_cfile,f_write_sigmf,dump_sigmf,complex_dtype,summary_records)
 	print "------------DATA BLOCK SUMMARY END------------ \n "
 
 #Print out summary of the data blocks.
-#input: rawIQ_pb2.RawIqFile()
+#input: rawIQ_pb2.RawIqFile() or wire_format.RawIqFileReader(),
+#       block index records to summarize (with -x, only the selected snapshots are read : the final summary is then computed
+#       from the index records of every snapshot matching the filters instead of from the snapshots read).
 #output: none (directly prints out to stdout)
-def print_data_block_summary(rawIQ_read,raw_plot,psd_plot,dump_csv,f_write_csv,dump_mat,f_write_cfile,dump_cfile):
+def print_data_block_summary(rawIQ_read,raw_plot,psd_plot,dump_csv,f_write_csv,dump_mat,f_write_mat,f_write_cfile,dump_cfile,f_write_sigmf,dump_sigmf,complex_dtype,summary_records=None):
 	cnt = 0							#total data blocks within a file.
 	data_cnt_sum = 0				#total data points within a file. (# blocks * data points per block)
 	min_time = 9223372036854775807 #earliest timestamp observed. (initialized to int64_max)
@@ -59,8 +68,8 @@ def print_data_block_summary(rawIQ_read,raw_plot,psd_plot,dump_csv,f_write_csv,d
 	
 	#for each block
 	for data_block in rawIQ_read.SpectralIqData:
-		#count up
-		cnt = cnt + 1
+		#count up (the readers number the snapshots as they appear in the file, so skipped snapshots keep their numbers.)
+		cnt = getattr(data_block, "block_number", cnt + 1)
 
 		#print out block information
 		#(comment out to reduce amount of information displayed.)
@@ -72,9 +81,9 @@ def print_data_block_summary(rawIQ_read,raw_plot,psd_plot,dump_csv,f_write_csv,d
 		print "\t NmeaGpggaLocation : " + data_block.NmeaGpggaLocation
 		print "\t Data count : " + str(len(data_block.DataPoints)/2)
 
-		data_block_i = data_block.DataPoints[::2]
-		data_block_q = [x*1j for x in data_block.DataPoints[1::2]]		
-		data_block_complex = map(add, data_block_i, data_block_q)
+		#I + jQ, built once in one vectorized pass and used by every output below : a complex128 view of the interleaved DataPoints
+		#(no copy, no per-sample Python objects), or a complex64 array of half the size (--complex64).
+		data_block_complex = data_block.complex_samples(complex_dtype)
 		
 		#plot RAW IQ
 		if raw_plot == cnt or raw_plot == 0:
@@ -93,12 +102,11 @@ def print_data_block_summary(rawIQ_read,raw_plot,psd_plot,dump_csv,f_write_csv,d
 			#http://docs.scipy.org/doc/scipy/reference/generated/scipy.signal.periodogram.html
 			f, psd = signal.periodogram(data_block_complex,(data_block.StopFrequencyHz - data_block.StartFrequencyHz))
 			
-			#calculate dB
-			psd_bel = np.log10(psd)
-			psd_decibel = [x * 10 for x in psd_bel]
+			#calculate dB (vectorized)
+			psd_decibel = 10 * np.log10(psd)
 
-			#frequency calculation
-			f_offsetted = [(x + data_block.CenterFrequencyHz)/(1e6) for x in f]
+			#frequency calculation (vectorized)
+			f_offsetted = (f + data_block.CenterFrequencyHz)/(1e6)
 
 			#plot
 			plt.plot(f_offsetted[1:], psd_decibel[1:])
@@ -108,37 +116,20 @@ def print_data_block_summary(rawIQ_read,raw_plot,psd_plot,dump_csv,f_write_csv,d
 			plt.ylabel('PSD (dBm/Bin if Calibrated Sensor, dBFS/Bin if not)')
 			plt.show()
 		
-		#dump to CSV
+		#dump to CSV (metadata of the snapshot, then the I/Q samples, formatted in bulk : see csv_export.py)
 		if dump_csv == cnt or dump_csv == 0:
-			#dump metadata of the snapshot
-			f_write_csv.write("Block," + str(cnt) + "\n")
-			f_write_csv.write("timestamp," + time.ctime(data_block.Time_stamp.value/10000000  + time.altzone) + "\n")	#Python automatically adjusts the timezone, but that is not desirable. So, roll-back by adding back the time offset  "time.altzone". 
-			f_write_csv.write("Start Freq," + str((data_block.StartFrequencyHz)/1e6) + "MHz" + "\n")
-			f_write_csv.write("Stop Freq," + str((data_block.StopFrequencyHz)/1e6) + "MHz" + "\n")
-			f_write_csv.write("Center Freq," + str((data_block.CenterFrequencyHz)/1e6) + "MHz" + "\n")
-			f_write_csv.write("NmeaGpggaLocation," + data_block.NmeaGpggaLocation + "\n")
-			f_write_csv.write("Data count," + str(len(data_block.DataPoints)/2) + "\n")
-			
-			#dump the main IQ data
-			#TODO : moar efficient implementation wanted.
-			#f_write.write("------DATA STARTS HERE------ \n")
-			#f_write.write("\n".join(str(x) for x in data_block_complex))				
-			f_write_csv.write("I,Q \n")
-			re = np.real(data_block_complex)
-			im = np.imag(data_block_complex)
-			for i in xrange(0,len(data_block.DataPoints)/2):
-				f_write_csv.write(str(re[i])+","+str(im[i])+"\n")
-
-			#add an extra line at the end of the block.
-			f_write_csv.write("\n")
-
-		#f_write_cfile,dump_cfile
-		#dump to cfile
+			f_write_csv.write_block(cnt, time.ctime(data_block.Time_stamp.value/10000000  + time.altzone), data_block, data_block_complex)	#Python automatically adjusts the timezone, but that is not desirable. So, roll-back by adding back the time offset  "time.altzone". 
+
+		#dump to cfile (converted in chunks straight from the interleaved values of the samples, see cfile_export.py)
 		if dump_cfile == cnt or dump_cfile == 0:
-			data_754single = np.array(data_block.DataPoints).astype(np.dtype(np.float32))
-			data_754single.tofile(f_write_cfile,"",)
-		#dump to mat
-		if dump_mat == cnt or dump_mat == 0:
+			f_write_cfile.write(wire_format.iq_values(data_block_complex))
+		#dump to SigMF (same samples as the cfile, plus one capture and annotation per snapshot, see sigmf_export.py)
+		if dump_sigmf == cnt or dump_sigmf == 0:
+			f_write_sigmf.write_block(cnt, data_block, data_block_complex)
+		#dump to mat : one file for every snapshot (--mat-consolidated), or one file per snapshot.
+		if dump_mat == 0 and f_write_mat:
+			f_write_mat.add_block(cnt, data_block.Time_stamp.value/10000000  + time.altzone, data_block, data_block_complex)
+		elif dump_mat == cnt or dump_mat == 0:
 			sio.savemat(str(cnt)+'.mat',{'cnt':cnt,'timestamp':data_block.Time_stamp.value/10000000  + time.altzone,'freq':data_block.CenterFrequencyHz,'data':data_block_complex})
 	
 		#update min/max timestamp, frequency values.
@@ -152,6 +143,18 @@ def print_data_block_summary(rawIQ_read,raw_plot,psd_plot,dump_csv,f_write_csv,d
 	
 	#Done with the loop; now print out the overall summary.
 	print "\n---------SUMMARY---------------\n"
+	if summary_records is not None:
+		print "(from the block index : " + str(len(summary_records)) + " snapshots matching the filters, not only the snapshots read)"
+		min_time = 9223372036854775807
+		max_time = -1
+		min_freq = float("inf")
+		max_freq = -1
+		if len(summary_records) > 0:
+			min_time = int(round(summary_records["timestamp"].min() * 10000000))		#index timestamps are in seconds
+			max_time = int(round(summary_records["timestamp"].max() * 10000000))
+			min_freq = summary_records["start_freq"].min()
+			max_freq = summary_records["stop_freq"].max()
+		data_cnt_sum = int(summary_records["point_count"].sum())
 	print "min_time : " + time.ctime(min_time/10000000 + time.altzone) 
 	print "max_time : " + time.ctime(max_time/10000000  + time.altzone) 
 	print "min starting freq : " +  str((min_freq)/1e6) + "MHz"
@@ -160,6 +163,23 @@ def print_data_block_summary(rawIQ_read,raw_plot,psd_plot,dump_csv,f_write_csv,d
 	print "Total IQ Data points (in bytes): " + str(data_cnt_sum * 8 *2) + "Bytes (" + str((data_cnt_sum * 8 *2)/(1024.0*1024)) + "MiB)"
 	print "\n-------------------------------\n"
 
+#Print out the "config" section of the data file and a metadata-only summary of the data blocks
+#(data points are skipped at the wire level, see file_summary.py).
+#input: wire_format reader (ScanFileReader / RawIqFileReader)
+#output: none (directly prints out to stdout)
+def print_summary_only(data):
+
+	#Print out station configurations
+	print "\n \n \n \n -----------------CONFIG BLOCK-----------------"
+	print str(data.Config).replace("\\n","\n\t").replace("\\r","").replace("\\t","\t")
+	print "---------------CONFIG BLOCK END---------------\n \n \n \n"
+
+	#Print out the summary.
+	print "\n---------SUMMARY---------------\n"
+	for line in file_summary.format_summary(file_summary.summarize(data)):
+		print line
+	print "\n-------------------------------\n"
+
 #--------------------------------------------------
 # Main routine (int main() equivalent)
 #--------------------------------------------------
@@ -172,44 +192,134 @@ parser.add_argument("-p", "--plot-psd", type=int, nargs='?', const=-1, help="Plo
 parser.add_argument("-d", "--dump-csv", type=int, nargs='?', const=-1, help="Dumps (DUMP_CSV)th snapshot data to a CSV file. Name of the generated snapshot file is equal to the name of the input file with .csv appended at the end. Dumps out every snapshots if setted zero.")
 parser.add_argument("-m", "--dump-mat", type=int, nargs='?', const=-1, help="Dumps (DUMP_MAT)th snapshot data to a mat file. Dumps out every snapshots if setted zero.")
 parser.add_argument("-g", "--dump-cfile", type=int, nargs='?', const=-1, help="Dumps (DUMP_CFILE)th snapshot data to a GNURadio-compatible cfile. Aggregates and dumps out every snapshots if setted zero.")
+parser.add_argument("--dump-sigmf", type=int, nargs='?', const=-1, help="Dumps (DUMP_SIGMF)th snapshot data to a SigMF recording (name of the input file with .sigmf-data and .sigmf-meta appended) : the samples (see --cfile-format) and, per snapshot, its center frequency, time, frequency range and location. Aggregates and dumps out every snapshots if setted zero.")
+parser.add_argument("-s", "--summary-only", action="store_true", help="Only print the config block and a summary (time / frequency range, data point count). Data points are skipped, not decoded.")
+parser.add_argument("-x", "--index", action="store_true", help="Use a block offset index (PATH.idx, built on first use) to read only the snapshots selected by -r/-p/-d/-m/-g/--dump-sigmf, instead of every snapshot before them.")
+parser.add_argument("--index-dir", help="With -x (and -z), directory where the index files are written when the directory of the input file cannot be written (by default, the indexes are then only kept in memory for this run).")
+parser.add_argument("-z", "--checkpoints", action="store_true", help="With -x, on raw deflate input : also use a deflate checkpoint index (PATH.zidx, built on first use) to start inflating close to the selected snapshots instead of at the start of the file.")
+parser.add_argument("-j", "--jobs", type=int, help="Decode the snapshots with JOBS worker processes. The snapshots are still processed in file order.")
+parser.add_argument("-b", "--backend", choices=decode_backends.BACKEND_CHOICES, default="auto", help="Decoder of the snapshots : NumPy wire decoder (numpy), generated protobuf classes (pb2, or accelerated : only on the C++ / upb protobuf runtime), or the fastest of them on the first blocks (auto, default).")
+parser.add_argument("--complex64", action="store_true", help="Build the complex samples of each snapshot as complex64 (single precision, half the memory) instead of complex128; the plots and every dump (-d/-m/-g/--dump-sigmf) then use single-precision values.")
+parser.add_argument("--csv-precision", type=int, default=csv_export.DEFAULT_IQ_PRECISION, help="Number of significant digits of the I/Q values in the CSV dump (-d) (default : " + str(csv_export.DEFAULT_IQ_PRECISION) + ", a relative error below 5e-9).")
+parser.add_argument("--csv-exact", action="store_true", help="Write the exact I/Q values in the CSV dump (-d) : the shortest text that reads each value back, as older versions wrote them (about 3 times slower than --csv-precision).")
+parser.add_argument("--cfile-format", choices=cfile_export.FORMATS, default=cfile_export.FORMAT_FC32, help="Sample format of the cfile (-g) and of the SigMF recording (--dump-sigmf) : interleaved float32 (fc32, default), or interleaved int16 (sc16, a quarter of the size; see --cfile-scale).")
+parser.add_argument("--cfile-scale", type=float, help="With --cfile-format sc16, factor applied to the I/Q values before rounding them to int16. By default, computed from the first snapshot written (6 dB of headroom); printed at the end, with a warning and the scale factor to use if a later snapshot was clipped.")
+parser.add_argument("--mat-consolidated", action="store_true", help="With -m 0, write every snapshot to one mat file (name of the input file with .mat appended) : a samples x snapshots data matrix plus cnt, timestamp and freq vectors, instead of one mat file per snapshot.")
+parser.add_argument("--mat-compress", action="store_true", help="With --mat-consolidated, compress the mat file.")
+parser.add_argument("--pipeline", type=int, nargs='?', const=1, help="Read (and inflate), decode, process and write the snapshots on separate threads connected by bounded queues, with PIPELINE decoding threads (1 if not given), and print the utilization of each stage at the end. Not used with -x or -j (their readers are used instead).")
+parser.add_argument("--pipeline-depth", type=int, default=pipeline.DEFAULT_DEPTH, help="With --pipeline, maximum number of snapshots read ahead of the processing loop, and of writes queued per output file (default : " + str(pipeline.DEFAULT_DEPTH) + ").")
+block_filter.add_filter_arguments(parser, reading_kind=False)
 
 args=parser.parse_args()
 
-#open file.
-f = open(args.path,"rb");
-
+#dtype of the complex samples.
+complex_dtype = wire_format.IQ_COMPLEX64_DTYPE if args.complex64 else wire_format.IQ_COMPLEX_DTYPE
 
 #make a CSV file if necessary.
 if args.dump_csv >= 0:
-	f_write_csv = open(args.path+".csv","w");
+	f_write_csv = csv_export.IqCsvWriter(args.path+".csv",None if args.csv_exact else args.csv_precision);
 else:
 	f_write_csv = "";
 
+#make a consolidated mat file if necessary.
+if args.dump_mat == 0 and args.mat_consolidated:
+	f_write_mat = mat_export.IqMatWriter(args.path+".mat",args.mat_compress);
+else:
+	f_write_mat = "";
+
 #make a cfile if necessary.
 if args.dump_cfile >= 0:
-	f_write_cfile = open(args.path+".cfile","wb");
+	f_write_cfile = cfile_export.CfileWriter(args.path+".cfile",args.cfile_format,args.cfile_scale);
 else:
 	f_write_cfile = "";
 
-#Attempt decompression. If fails, assume decompressed data and just push that into the Protobuf decoder.
-f_str = f.read()
-f.close()
-try:
-	decompress_out = decompress (f_str)
-	f_str = decompress_out
-except Exception:
-	pass
+#Open the file. The format (compressed or not) is detected from the leading bytes; compressed files are inflated chunk by chunk while reading.
+f_stream, input_format = stream_decompress.open_data_stream(args.path, use_mmap=True)
+print "Input format : " + input_format
 
+#Block filters (--since, --until, --freq-min, --freq-max), checked on the block metadata before the data points are decoded.
+data_filter = block_filter.filter_from_args(args)
 
-#read and close file.
-rawIQ_read = rawIQ_pb2.RawIqFile()
-rawIQ_read.ParseFromString(f_str)
+#Parse, one snapshot at a time (DataPoints of each snapshot are numpy views of the stream data; uncompressed files are memory-mapped).
+decoder = decode_backends.get_backend(args.backend)
+rawIQ_read = wire_format.RawIqFileReader(f_stream, data_filter, decoder.parse_iq)
+summary_records = None
+
+#With the block index, only read the selected snapshots (unless every snapshot was requested with 0) that match the filters.
+selected_blocks = [n for n in (args.plot_raw, args.plot_psd, args.dump_csv, args.dump_mat, args.dump_cfile, args.dump_sigmf) if n is not None and n >= 0]
+if args.index and not args.summary_only and (len(selected_blocks) > 0 and 0 not in selected_blocks or data_filter is not None):
+	index = block_index.load_or_build_index(args.path, block_index.KIND_IQ, args.index_dir)
+	print "Block index : " + str(len(index)) + " blocks (" + block_index.describe_location(index, args.path) + ")"
+	summary_records = index.records
+	if data_filter is not None:
+		matching_blocks = data_filter.select(index.records)
+		summary_records = index.records[np.array(matching_blocks, np.int64) - 1]
+		if len(selected_blocks) > 0 and 0 not in selected_blocks:
+			matching_blocks = [n for n in matching_blocks if n in selected_blocks]
+		selected_blocks = matching_blocks
+	checkpoints = None
+	if args.checkpoints and input_format == stream_decompress.FORMAT_RAW_DEFLATE:
+		checkpoints = deflate_index.load_or_build_checkpoints(args.path, cache_dir=args.index_dir)
+		print "Checkpoint index : " + str(len(checkpoints)) + " checkpoints (" + block_index.describe_location(checkpoints, args.path) + ")"
+	rawIQ_read = block_index.IndexedFile(args.path, index, selected_blocks, use_mmap=True, checkpoints=checkpoints, parse_block=decoder.parse_iq)
+elif args.jobs > 1 and not args.summary_only:
+	#Decode the snapshots on several worker processes (the file is still read sequentially by this process).
+	rawIQ_read = parallel_decode.ParallelFileReader(rawIQ_read, args.jobs, backend=args.backend)
+
+#make a SigMF recording if necessary (its metadata includes the station config).
+if args.dump_sigmf >= 0:
+	f_write_sigmf = sigmf_export.SigmfWriter(args.path,rawIQ_read.Config,args.cfile_format,args.cfile_scale);
+else:
+	f_write_sigmf = "";
+
+#Read, decode and write on their own threads, connected by bounded queues (see pipeline.py); snapshots are still processed in file order.
+stages = None
+if args.pipeline and not args.summary_only and isinstance(rawIQ_read, wire_format.RawIqFileReader):
+	stages = pipeline.Pipeline(args.pipeline_depth)
+	rawIQ_read = stages.reader(rawIQ_read, decoder.parse_iq, args.pipeline)
+	if f_write_csv:
+		f_write_csv = stages.writer(f_write_csv, "csv")
+	if f_write_mat:
+		f_write_mat = stages.writer(f_write_mat, "mat")
+	if f_write_cfile:
+		f_write_cfile = stages.writer(f_write_cfile, "cfile")
+	if f_write_sigmf:
+		f_write_sigmf = stages.writer(f_write_sigmf, "sigmf")
 
 #process.
-print_rawIQ_summary(rawIQ_read,args.plot_raw,args.plot_psd,args.dump_csv,f_write_csv,args.dump_mat,f_write_cfile,args.dump_cfile)
+if args.summary_only:
+	print_summary_only(rawIQ_read)
+else:
+	print_rawIQ_summary(rawIQ_read,args.plot_raw,args.plot_psd,args.dump_csv,f_write_csv,args.dump_mat,f_write_mat,f_write_cfile,args.dump_cfile,f_write_sigmf,args.dump_sigmf,complex_dtype,summary_records)
+if stages is not None:
+	stages.drain()		#(queued writes may hold views of the memory-mapped file)
+f_stream.close()
+if f_stream.stats is not None:
+	print "Decompression : " + f_stream.stats.summary()
+print "Input format counts : " + stream_decompress.format_counts_summary()		#files opened through each decoding path (raw deflate / zlib / gzip / protobuf)
+if not args.summary_only:
+	if isinstance(rawIQ_read, parallel_decode.ParallelFileReader):
+		print "Decoding backend : " + args.backend + " (in the worker processes)"
+	else:
+		print "Decoding backend : " + decoder.describe()
+if stages is not None:
+	report = stages.report()
+	print "Pipeline : " + report[0]
+	for line in report[1:]:
+		print "\t " + line
 
 #close the dump file.
 if args.dump_csv >= 0:
 	f_write_csv.close()
 if args.dump_cfile >= 0:
 	f_write_cfile.close()
+	print "cfile : " + f_write_cfile.describe()
+	if f_write_cfile.warning() is not None:
+		print "Warning : cfile : " + f_write_cfile.warning() + " (--cfile-scale)"
+if args.dump_sigmf >= 0:
+	f_write_sigmf.close()
+	print "SigMF : " + f_write_sigmf.describe()
+	if f_write_sigmf.warning() is not None:
+		print "Warning : SigMF : " + f_write_sigmf.warning() + " (--cfile-scale)"
+if f_write_mat:
+	f_write_mat.close()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+
+#SigMF (Signal Metadata Format, https://github.com/sigmf/SigMF) export of RAW IQ snapshots (rawIQ_process.py --dump-sigmf).
+#Writes a recording made of :
+#	BASE.sigmf-data : the samples of every snapshot, one after another, streamed through cfile_export.CfileWriter
+#	                  (cf32_le, or ci16_le with a scale factor).
+#	BASE.sigmf-meta : JSON metadata, written when the recording is closed :
+#	                  global      : datatype, sample rate (EffectiveSamplingRateHz of the station config, or the
+#	                                bandwidth of the first snapshot), hardware and station description, geolocation.
+#	                  captures    : one per snapshot : first sample, center frequency, UTC time of the snapshot.
+#	                  annotations : one per snapshot : its samples, frequency range, block number, NMEA GPGGA location.
+#Downstream SDR tools can then seek to a snapshot from the metadata alone.
+
+#Usage (library) :
+#	recording = sigmf_export.SigmfWriter(path, reader.Config)
+#	for data_block in reader.SpectralIqData : recording.write_block(data_block.block_number, data_block)
+#	recording.close()
+#Requirements: Python 2.7 with NumPy.
+
+import json
+import os
+import time
+import cfile_export
+import wire_format
+
+SIGMF_VERSION = "1.0.0"
+DATA_SUFFIX = ".sigmf-data"
+META_SUFFIX = ".sigmf-meta"
+
+#SigMF datatype of each cfile_export format.
+DATATYPES = {cfile_export.FORMAT_FC32 : "cf32_le", cfile_export.FORMAT_SC16 : "ci16_le"}
+
+#Namespace of the CityScape-specific fields (block number, NMEA location, sc16 scale factor and clipped values).
+EXTENSION = "cityscape"
+
+#ISO 8601 UTC time of a POSIX timestamp, as SigMF expects it.
+def _datetime(timestamp):
+	seconds = int(timestamp // 1)
+	return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(seconds)) + ".%06dZ" % int(round((timestamp - seconds) * 1e6) % 1000000)
+
+#SigMF recording of RAW IQ snapshots.
+class SigmfWriter:
+
+	#input : base path (BASE.sigmf-data / BASE.sigmf-meta are written), Config (ConfigDataBlock, or None),
+	#        sample format (cfile_export.FORMATS), sc16 scale factor (None : computed, see cfile_export.py).
+	def __init__(self, base_path, config=None, sample_format=cfile_export.FORMAT_FC32, scale=None):
+		self.base_path = base_path
+		self.config = config
+		self.sample_format = sample_format
+		self.data = cfile_export.CfileWriter(base_path + DATA_SUFFIX, sample_format, scale)
+		self.captures = []
+		self.annotations = []
+		self.first_bandwidth = None
+
+	#Append one snapshot.
+	#input : block number, IqDataBlock (or SpectralIqDataBlock),
+	#        complex samples of the snapshot (optional, IqDataBlock.complex_samples(); DataPoints by default).
+	def write_block(self, block_number, data_block, samples=None):
+		sample_start = self.data.samples
+		if samples is None:
+			self.data.write(data_block.DataPoints)
+		else:
+			self.data.write(wire_format.iq_values(samples))
+		if self.first_bandwidth is None:
+			self.first_bandwidth = data_block.StopFrequencyHz - data_block.StartFrequencyHz
+		self.captures.append({
+			"core:sample_start" : sample_start,
+			"core:frequency" : data_block.CenterFrequencyHz,
+			"core:datetime" : _datetime(wire_format.timestamp_seconds(data_block.Time_stamp)),
+		})
+		self.annotations.append({
+			"core:sample_start" : sample_start,
+			"core:sample_count" : self.data.samples - sample_start,
+			"core:freq_lower_edge" : data_block.StartFrequencyHz,
+			"core:freq_upper_edge" : data_block.StopFrequencyHz,
+			"core:label" : "Block " + str(block_number),
+			EXTENSION + ":block_number" : block_number,
+			EXTENSION + ":nmea_gpgga" : data_block.NmeaGpggaLocation,
+		})
+
+	#global object of the metadata.
+	def _global(self):
+		fields = {
+			"core:datatype" : DATATYPES[self.sample_format],
+			"core:version" : SIGMF_VERSION,
+			"core:recorder" : "CityScape rawIQ_process.py",
+			"core:extensions" : [{"name" : EXTENSION, "version" : "1.0.0", "optional" : True}],
+		}
+		sample_rate = self.first_bandwidth
+		station = None
+		if self.config is not None:
+			if self.config.HardwareConfiguration:
+				fields["core:hw"] = self.config.HardwareConfiguration
+			station = self.config.EndToEndConfiguration
+			sensors = [sensor for sensor in station.RFSensorConfigurations if sensor.EffectiveSamplingRateHz > 0]
+			if sensors:
+				sample_rate = sensors[0].EffectiveSamplingRateHz
+		if sample_rate:
+			fields["core:sample_rate"] = sample_rate
+		if station is not None:
+			description = [text for text in (station.Name, station.MeasurementStationId, station.Description, station.Location) if text]
+			if description:
+				fields["core:description"] = ", ".join(description)
+			if station.HasField("Latitude") and station.HasField("Longitude"):
+				fields["core:geolocation"] = {"type" : "Point", "coordinates" : [station.Longitude, station.Latitude]}
+		if self.sample_format == cfile_export.FORMAT_SC16:
+			fields[EXTENSION + ":scale"] = self.data.scale		#sample value = stored value / scale
+			fields[EXTENSION + ":clipped"] = self.data.clipped		#values clipped to full scale (see warning())
+		return fields
+
+	#Close the data file and write the metadata.
+	def close(self):
+		self.data.close()
+		meta = {"global" : self._global(), "captures" : self.captures, "annotations" : self.annotations}
+		temp_path = self.base_path + META_SUFFIX + ".tmp"
+		with open(temp_path, "w") as f:
+			json.dump(meta, f, indent=1, sort_keys=True)
+		if os.path.exists(self.base_path + META_SUFFIX):
+			os.remove(self.base_path + META_SUFFIX)
+		os.rename(temp_path, self.base_path + META_SUFFIX)
+
+	#Warning about clipped sc16 values (None if no value was clipped, see cfile_export.CfileWriter.warning()).
+	def warning(self):
+		return self.data.warning()
+
+	#One-line description of the recording.
+	def describe(self):
+		return self.base_path + DATA_SUFFIX + " / " + META_SUFFIX + " (" + str(len(self.captures)) + " captures, " + self.data.describe() + ")"
@@ -0,0 +1,442 @@
+#!/usr/bin/env python
+
+#Streaming decompression of *.dsox / *.dsor files generated by Microsoft Spectrum Observatory.
+#The files are raw deflate streams (no zlib / gzip header). Instead of reading the whole file and
+#inflating it with a single zlib.decompress() call, the functions below read fixed-size chunks and
+#hand out decompressed chunks, so only about one chunk of compressed data and a few chunks of
+#decompressed data are held in memory at any time.
+
+#The input format (raw deflate, zlib, gzip or bare protobuf) is detected from the leading bytes
+#and the file extension only (see sniff_format()), so an uncompressed file is never run through
+#the inflater just to find out that it is not compressed.
+
+#Usage (library) :
+#	reader, fmt = stream_decompress.open_data_stream(path)
+#	header = reader.read(16)
+#or
+#	for chunk in stream_decompress.iter_decompress(open(path,"rb")): ...
+#Requirements: Python 2.7 (zlib is part of the standard library).
+
+import collections
+import hashlib
+import mmap
+import os.path
+import time
+import zlib
+
+#Size of the compressed chunks read from the input file (bytes).
+DEFAULT_CHUNK_SIZE = 1 << 20
+
+#Upper bound of a single decompressed chunk (bytes). Deflate can reach ~1000:1 on constant data,
+#so the output of one input chunk must be capped as well to keep the memory bounded.
+DEFAULT_MAX_OUTPUT = 4 << 20
+
+#zlib window bits for raw deflate (.dsox / .dsor).
+RAW_DEFLATE_WBITS = -15
+
+#Input formats recognized by sniff_format(), and the zlib window bits used to inflate them.
+FORMAT_RAW_DEFLATE = "raw deflate"
+FORMAT_ZLIB = "zlib"
+FORMAT_GZIP = "gzip"
+FORMAT_PROTOBUF = "protobuf"
+FORMAT_WBITS = {FORMAT_RAW_DEFLATE : RAW_DEFLATE_WBITS, FORMAT_ZLIB : 15, FORMAT_GZIP : 16 + 15}
+
+#Number of leading bytes looked at by sniff_format().
+SNIFF_SIZE = 1 << 16
+
+#How often each input format has been detected and dispatched by open_data_stream() (format -> count).
+FORMAT_COUNTS = collections.Counter()
+
+#Byte counters and timing of a decompression run.
+#Used to report the throughput (MB/s of compressed input and decompressed output).
+class ThroughputStats:
+
+	def __init__(self):
+		self.bytes_in = 0
+		self.bytes_out = 0
+		self.start_time = time.time()
+		self.end_time = None
+
+	#Mark the end of the run.
+	def stop(self):
+		self.end_time = time.time()
+
+	#Wall-clock time of the run (in seconds). Uses the current time if the run is still in progress.
+	def elapsed(self):
+		end_time = self.end_time
+		if end_time is None:
+			end_time = time.time()
+		return max(end_time - self.start_time, 1e-9)
+
+	#Compressed input throughput, in MB/s.
+	def mb_in_per_sec(self):
+		return self.bytes_in / 1e6 / self.elapsed()
+
+	#Decompressed output throughput, in MB/s.
+	def mb_out_per_sec(self):
+		return self.bytes_out / 1e6 / self.elapsed()
+
+	#One-line human-readable summary.
+	def summary(self):
+		return "%.1fMB in, %.1fMB out, %.2fs (%.1fMB/s in, %.1fMB/s out)" % (self.bytes_in / 1e6, self.bytes_out / 1e6, self.elapsed(), self.mb_in_per_sec(), self.mb_out_per_sec())
+
+#Decompress a file object chunk by chunk.
+#input : file object opened in binary mode, compressed chunk size, max. decompressed chunk size,
+#        zlib window bits (raw deflate by default), ThroughputStats (optional, updated in place).
+#output : generator of decompressed chunks (str / bytes).
+#Raises zlib.error if the input ends before the end of the deflate stream (truncated or corrupt file), as zlib.decompress() does.
+def iter_decompress(f, chunk_size=DEFAULT_CHUNK_SIZE, max_output=DEFAULT_MAX_OUTPUT, wbits=RAW_DEFLATE_WBITS, stats=None):
+	inflater = zlib.decompressobj(wbits)
+
+	while True:
+		chunk = f.read(chunk_size)
+		if not chunk:
+			break
+		if stats is not None:
+			stats.bytes_in += len(chunk)
+
+		#Inflate the chunk, max_output bytes at a time.
+		while chunk:
+			out = inflater.decompress(chunk, max_output)
+			chunk = inflater.unconsumed_tail
+			if out:
+				if stats is not None:
+					stats.bytes_out += len(out)
+				yield out
+
+		#End of the deflate stream (anything after it is ignored, as zlib.decompress() does).
+		if inflater.unused_data:
+			break
+
+	#End of the input : check that the deflate stream has ended. Python 2 decompress objects have no "eof"
+	#attribute, but once the stream has ended, any further input is left in unused_data.
+	if not inflater.unused_data:
+		try:
+			inflater.decompress(b"\0", 1)
+		except zlib.error:
+			pass
+		if not inflater.unused_data:
+			raise zlib.error("Error -5 while decompressing data: incomplete or truncated stream")
+
+	out = inflater.flush()
+	if out:
+		if stats is not None:
+			stats.bytes_out += len(out)
+		yield out
+
+	if stats is not None:
+		stats.stop()
+
+#Decompress a file into another file, without holding either of them in memory.
+#input : input path, output path, compressed chunk size.
+#output : ThroughputStats of the run.
+#On a truncated or corrupt input, the partial output file is removed and zlib.error is raised.
+def decompress_file(in_path, out_path, chunk_size=DEFAULT_CHUNK_SIZE):
+	stats = ThroughputStats()
+	f_in = open(in_path, "rb")
+	f_out = open(out_path, "wb")
+	try:
+		for out in iter_decompress(f_in, chunk_size, stats=stats):
+			f_out.write(out)
+	except zlib.error:
+		f_out.close()
+		os.remove(out_path)
+		raise
+	finally:
+		f_in.close()
+		f_out.close()
+	return stats
+
+#Read-only file-like view of the decompressed data.
+#Lets the protobuf readers pull decompressed bytes on demand (read / skip / tell) without
+#inflating the whole file first.
+#start_offset is the position reported by tell() for the first decompressed byte (streams resumed mid-file, see deflate_index.py).
+class InflateReader:
+
+	def __init__(self, f, chunk_size=DEFAULT_CHUNK_SIZE, max_output=DEFAULT_MAX_OUTPUT, wbits=RAW_DEFLATE_WBITS, start_offset=0):
+		self.f = f
+		self.stats = ThroughputStats()
+		self._chunks = iter_decompress(f, chunk_size, max_output, wbits, self.stats)
+		self._buf = b""
+		self._pos = 0
+		self._offset = start_offset
+
+	#Fetch the next decompressed chunk into the buffer. Returns False at the end of the stream.
+	def _fill(self):
+		for chunk in self._chunks:
+			self._buf = chunk
+			self._pos = 0
+			return True
+		self._buf = b""
+		self._pos = 0
+		return False
+
+	#Read up to "size" decompressed bytes (everything that is left if size < 0).
+	def read(self, size=-1):
+		parts = []
+		remaining = size
+		while size < 0 or remaining > 0:
+			if self._pos >= len(self._buf) and not self._fill():
+				break
+			end = len(self._buf)
+			if size >= 0:
+				end = min(end, self._pos + remaining)
+				remaining = remaining - (end - self._pos)
+			parts.append(self._buf[self._pos:end])
+			self._pos = end
+
+		data = b"".join(parts)
+		self._offset += len(data)
+		return data
+
+	#Discard the next "size" decompressed bytes. Returns the number of bytes actually skipped.
+	def skip(self, size):
+		skipped = 0
+		while skipped < size:
+			if self._pos >= len(self._buf) and not self._fill():
+				break
+			step = min(len(self._buf) - self._pos, size - skipped)
+			self._pos += step
+			skipped += step
+		self._offset += skipped
+		return skipped
+
+	#Position in the decompressed stream.
+	def tell(self):
+		return self._offset
+
+	#Move forward to the given position of the decompressed stream (compressed streams cannot seek backwards).
+	def seek(self, offset):
+		if offset < self._offset:
+			raise ValueError("Cannot seek backwards in a compressed stream.")
+		self.skip(offset - self._offset)
+
+	def close(self):
+		self.f.close()
+
+#Same interface as InflateReader, for input files that are not compressed.
+#skip() seeks instead of reading.
+class FileReader:
+
+	def __init__(self, f):
+		self.f = f
+		self.stats = None
+
+	def read(self, size=-1):
+		return self.f.read(size)
+
+	def skip(self, size):
+		start = self.f.tell()
+		self.f.seek(0, os.SEEK_END)
+		end = self.f.tell()
+		self.f.seek(min(start + size, end))
+		return self.f.tell() - start
+
+	def tell(self):
+		return self.f.tell()
+
+	def seek(self, offset):
+		self.f.seek(offset)
+
+	def close(self):
+		self.f.close()
+
+#Zero-copy view of "size" bytes of a buffer (mmap, bytes, ...) starting at "offset".
+try:
+	buffer_view = buffer	#Python 2
+except NameError:
+	def buffer_view(obj, offset, size):
+		return memoryview(obj)[offset:offset + size]
+
+#Same interface as FileReader, over a read-only memory map of an uncompressed file.
+#read_view() returns zero-copy views of the mapped file, so large packed fields (e.g. RAW IQ DataPoints)
+#can be wrapped with numpy.frombuffer() without being copied out of the page cache.
+#The views must not outlive the reader : copy the data points that are kept after close(). close() does not unmap
+#the file itself (on Python 2, mmap.close() unmaps it even while views still point into it); it drops the reader's
+#reference, and the mapping is released once the last view is gone.
+class MmapReader:
+
+	def __init__(self, f):
+		self.f = f
+		self.stats = None
+		self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		self._offset = 0
+
+	def read(self, size=-1):
+		end = len(self.map)
+		if size >= 0:
+			end = min(end, self._offset + size)
+		data = self.map[self._offset:end]
+		self._offset = max(end, self._offset)
+		return data
+
+	#Like read(), but returns a view of the mapped file instead of a copy.
+	def read_view(self, size):
+		size = max(0, min(size, len(self.map) - self._offset))
+		view = buffer_view(self.map, self._offset, size)
+		self._offset += size
+		return view
+
+	def skip(self, size):
+		start = self._offset
+		self._offset = min(self._offset + size, len(self.map))
+		return self._offset - start
+
+	def tell(self):
+		return self._offset
+
+	def seek(self, offset):
+		self._offset = min(offset, len(self.map))
+
+	def close(self):
+		self.map = None		#(views returned by read_view() hold their own reference to the map)
+		self.f.close()
+
+#Decode a base-128 varint at buf[pos] (buf : bytearray).
+#output : (value, position after the varint), or (None, pos) if the varint is truncated or too long.
+def _peek_varint(buf, pos):
+	value = 0
+	shift = 0
+	while pos < len(buf) and shift < 64:
+		b = buf[pos]
+		pos += 1
+		value |= (b & 0x7f) << shift
+		if not b & 0x80:
+			return value, pos
+		shift += 7
+	return None, pos
+
+#Check whether the data starts like a ScanFile / RawIqFile : a sequence of length-delimited field 1
+#(Config) or field 2 (data block) entries whose lengths fit within the file.
+#input : leading bytes of the data (str / bytes), total size of the data (None if unknown).
+#output : True / False
+def _looks_like_protobuf(head, total_size=None):
+	buf = bytearray(head)
+	pos = 0
+	fields = 0
+	while pos < len(buf):
+		tag, pos = _peek_varint(buf, pos)
+		if tag not in (0x0a, 0x12):		#(field 1 or field 2) << 3 | wire type 2 (length-delimited)
+			return False
+		length, pos = _peek_varint(buf, pos)
+		if length is None:
+			break
+		if total_size is not None and pos + length > total_size:
+			return False
+		fields += 1
+		pos += length
+	return fields > 0
+
+#Check whether the leading bytes inflate (with the given window bits) into something that looks like protobuf.
+#Only inflates a bounded amount of data, so the check is cheap regardless of the file size.
+def _inflates_to_protobuf(head, wbits):
+	try:
+		out = zlib.decompressobj(wbits).decompress(head, SNIFF_SIZE)
+	except zlib.error:
+		return False
+	return len(out) > 0 and _looks_like_protobuf(out)
+
+#Detect the format of an input file from its leading bytes and its extension.
+#.dsox / .dsor files are raw deflate streams, .uncompressed files are bare ScanFile / RawIqFile protobuf.
+#Raw deflate has no header, and a bare protobuf file starts with 0x0a or 0x12, which are also valid
+#deflate block headers; these cases are told apart by a bounded trial inflate of the leading bytes and
+#by checking the protobuf framing, with the extension used as a tie-breaker.
+#input : leading bytes (up to SNIFF_SIZE), file path (optional), total file size (optional).
+#output : one of FORMAT_RAW_DEFLATE, FORMAT_ZLIB, FORMAT_GZIP, FORMAT_PROTOBUF.
+def sniff_format(head, path=None, total_size=None):
+	if len(head) == 0:
+		raise ValueError("Empty input file.")
+	ext = ""
+	if path is not None:
+		ext = os.path.splitext(path)[1].lower()
+
+	buf = bytearray(head[:2])
+	if buf[0] == 0x1f and len(buf) > 1 and buf[1] == 0x8b:
+		return FORMAT_GZIP
+	if len(buf) > 1 and (buf[0] & 0x0f) == 8 and (buf[0] >> 4) <= 7 and ((buf[0] << 8) | buf[1]) % 31 == 0:
+		if _inflates_to_protobuf(head, FORMAT_WBITS[FORMAT_ZLIB]):
+			return FORMAT_ZLIB
+
+	is_protobuf = _looks_like_protobuf(head, total_size)
+	is_deflate = _inflates_to_protobuf(head, RAW_DEFLATE_WBITS)
+	if is_protobuf and is_deflate:
+		if ext in (".dsox", ".dsor"):
+			return FORMAT_RAW_DEFLATE
+		return FORMAT_PROTOBUF
+	if is_protobuf:
+		return FORMAT_PROTOBUF
+	if is_deflate:
+		return FORMAT_RAW_DEFLATE
+	raise ValueError("Unrecognized input format (not a raw deflate, zlib, gzip or protobuf file).")
+
+#Open an input file and return a reader of its (decompressed) protobuf data.
+#The format is detected by sniff_format() and counted in FORMAT_COUNTS.
+#input : path of the input file, compressed chunk size, use_mmap (memory-map uncompressed files).
+#output : (InflateReader, FileReader or MmapReader, format)
+def open_data_stream(path, chunk_size=DEFAULT_CHUNK_SIZE, use_mmap=False):
+	f = open(path, "rb")
+	try:
+		head = f.read(SNIFF_SIZE)
+		fmt = sniff_format(head, path, os.path.getsize(path))
+		f.seek(0)
+	except Exception:
+		f.close()
+		raise
+	FORMAT_COUNTS[fmt] += 1
+
+	if fmt == FORMAT_PROTOBUF:
+		if use_mmap:
+			return MmapReader(f), fmt
+		return FileReader(f), fmt
+	return InflateReader(f, chunk_size, wbits=FORMAT_WBITS[fmt]), fmt
+
+#Human-readable summary of FORMAT_COUNTS.
+def format_counts_summary():
+	return ", ".join("%s : %d" % (fmt, FORMAT_COUNTS[fmt]) for fmt in sorted(FORMAT_COUNTS))
+
+#Path of a sidecar file of a data file (block index, checkpoint index) : next to the data file, or in a cache
+#directory (for data files in directories that cannot be written; the name then includes a hash of the absolute
+#path of the data file, so that data files of the same name in different directories do not share a sidecar).
+#input : path of the data file, suffix of the sidecar (e.g. ".idx"), cache directory (optional).
+#output : path of the sidecar file
+def sidecar_path(path, suffix, cache_dir=None):
+	if cache_dir is None:
+		return path + suffix
+	digest = hashlib.sha1(os.path.abspath(path)).hexdigest()[:16]
+	return os.path.join(cache_dir, os.path.basename(path) + "." + digest + suffix)
+
+#Load a sidecar file of a data file, or build it and save it : next to the data file if possible, otherwise in the
+#cache directory (if given), otherwise nowhere (read-only directory : the built sidecar is then only kept in memory).
+#A sidecar that cannot be read (truncated, or not a sidecar) is rebuilt.
+#input : path of the data file, suffix of the sidecar, cache directory (or None),
+#        load function (sidecar path -> sidecar), check function (sidecar -> True if it matches the data file),
+#        build function (no argument -> sidecar), save function (sidecar, sidecar path).
+#output : sidecar, with its "path" attribute set to the file it was loaded from or saved to (None : in memory only).
+def load_or_build_sidecar(path, suffix, cache_dir, load, is_current, build, save):
+	paths = [sidecar_path(path, suffix)]
+	if cache_dir is not None:
+		paths.append(sidecar_path(path, suffix, cache_dir))
+	for candidate in paths:
+		if os.path.isfile(candidate):
+			try:
+				sidecar = load(candidate)
+			except ValueError:
+				continue
+			if is_current(sidecar):
+				sidecar.path = candidate
+				return sidecar
+	sidecar = build()
+	sidecar.path = None
+	for candidate in paths:
+		try:
+			save(sidecar, candidate)
+		except (IOError, OSError):
+			#remove what was written of it, if anything.
+			try:
+				os.remove(candidate)
+			except OSError:
+				pass
+			continue
+		sidecar.path = candidate
+		break
+	return sidecar
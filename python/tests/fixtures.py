@@ -0,0 +1,98 @@
+#Small CityScape test files, built with the psdFile_pb2 / rawIQ_pb2 classes (the reference encoders), and helpers
+#shared by the tests.
+#Each test module imports this module first : it puts the python directory (the modules under test) on sys.path.
+
+import gzip
+import os
+import shutil
+import sys
+import tempfile
+import zlib
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import psdFile_pb2
+import rawIQ_pb2
+
+#Build a ScanFile : blocks of each ReadingKind in turn (0, 1, 2, ...), random Q7 values plus the NaN sentinel
+#(-32768) and the largest value.
+#input : number of blocks, number of bins, random seed, number of ReadingKinds.
+#output : psdFile_pb2.ScanFile
+def scan_file(blocks=30, bins=64, seed=1, reading_kinds=3):
+	rng = np.random.RandomState(seed)
+	scan = psdFile_pb2.ScanFile()
+	scan.Config.HardwareConfiguration = "UHD"
+	scan.Config.Time_stamp.value = 1000
+	station = scan.Config.EndToEndConfiguration
+	station.Name = "Station"
+	station.Latitude = 47.6
+	station.Longitude = -122.3
+	for i in range(blocks):
+		data_block = scan.SpectralPsdData.add()
+		data_block.Time_stamp.value = 24000000 + i // reading_kinds
+		data_block.Time_stamp.scale = psdFile_pb2.Timestamp.MINUTES
+		data_block.StartFrequencyHz = 470e6
+		data_block.StopFrequencyHz = 698e6
+		data_block.Reading_Kind = i % reading_kinds
+		values = rng.randint(-16000, -8000, bins)
+		values[1] = -32768
+		values[2] = 32767
+		data_block.OutputDataPoints.extend(int(v) for v in values)
+		data_block.NmeaGpggaLocation = "$GPGGA,%d" % i
+	return scan
+
+#Build a RawIqFile : snapshots of random (float64) I/Q values.
+#input : number of snapshots, number of samples per snapshot, random seed.
+#output : rawIQ_pb2.RawIqFile
+def raw_iq_file(blocks=5, samples=1000, seed=1):
+	rng = np.random.RandomState(seed)
+	raw_iq = rawIQ_pb2.RawIqFile()
+	raw_iq.Config.HardwareConfiguration = "UHD"
+	station = raw_iq.Config.EndToEndConfiguration
+	station.Name = "Station"
+	sensor = station.RFSensorConfigurations.add()
+	sensor.EffectiveSamplingRateHz = 2e7
+	for i in range(blocks):
+		data_block = raw_iq.SpectralIqData.add()
+		data_block.Time_stamp.value = 14900000000000000 + i * 10000000
+		data_block.Time_stamp.scale = psdFile_pb2.Timestamp.TICKS
+		data_block.StartFrequencyHz = 100e6 + i * 1e6
+		data_block.StopFrequencyHz = 120e6 + i * 1e6
+		data_block.CenterFrequencyHz = 110e6 + i * 1e6
+		data_block.DataPoints.extend(rng.randn(2 * samples).tolist())
+		data_block.NmeaGpggaLocation = "$GPGGA,%d" % i
+	return raw_iq
+
+#Compress data as raw deflate (.dsox / .dsor), zlib or gzip.
+#input : data, wbits (-15 : raw deflate, 15 : zlib, 31 : gzip), compression level.
+#output : compressed data
+def compress(data, wbits=-15, level=6):
+	compressor = zlib.compressobj(level, zlib.DEFLATED, wbits)
+	return compressor.compress(data) + compressor.flush()
+
+#Temporary directory of a test case : created by setUp(), removed with its files by tearDown().
+class TempDirMixin(object):
+
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	#Write a file in the temporary directory.
+	#output : path of the file
+	def write_file(self, name, data):
+		path = os.path.join(self.directory, name)
+		with open(path, "wb") as f:
+			f.write(data)
+		return path
+
+	#Write a file in the temporary directory with the gzip module.
+	#output : path of the file
+	def write_gzip(self, name, data):
+		path = os.path.join(self.directory, name)
+		f = gzip.open(path, "wb")
+		f.write(data)
+		f.close()
+		return path
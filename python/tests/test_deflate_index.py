@@ -0,0 +1,64 @@
+#Tests of deflate_index.py : decompression resumed at the checkpoints, against zlib.decompress() of the whole file.
+
+import os
+import unittest
+import zlib
+import numpy as np
+import deflate_index
+import fixtures
+
+#Distance between checkpoints of the tests (bytes of decompressed output) : many checkpoints in a small file.
+SPAN = 1 << 15
+
+@unittest.skipUnless(deflate_index.libz_available(), "libz shared library not found")
+class CheckpointIndexTest(fixtures.TempDirMixin, unittest.TestCase):
+
+	def setUp(self):
+		fixtures.TempDirMixin.setUp(self)
+		self.data = fixtures.scan_file(blocks=300, bins=512).SerializeToString()
+
+	#Check reads resumed at every checkpoint and at random offsets.
+	def _check_reads(self, path, index):
+		compressed = open(path, "rb").read()
+		self.assertEqual(zlib.decompress(compressed, -15), self.data)
+		offsets = [point.out for point in index.points]
+		offsets += list(np.random.RandomState(4).randint(0, len(self.data), 20))
+		offsets += [len(self.data) - 10]
+		for offset in offsets:
+			reader = deflate_index.open_at(path, index, offset)
+			try:
+				self.assertEqual(reader.tell(), offset)
+				self.assertEqual(reader.read(5000), self.data[offset:offset + 5000])
+			finally:
+				reader.close()
+
+	def test_resume_at_checkpoints(self):
+		#levels 1 and 9 : (mostly) dynamic Huffman blocks ending at any bit; level 0 : stored blocks.
+		for level in (0, 1, 9):
+			path = self.write_file("scan%d.dsox" % level, fixtures.compress(self.data, level=level))
+			index = deflate_index.build_checkpoints(path, SPAN)
+			self.assertTrue(len(index) > 4)
+			self.assertEqual(index.points[0].out, 0)
+			for point in index.points[1:]:
+				self.assertEqual(len(point.window), deflate_index.WINDOW_SIZE)
+			self._check_reads(path, index)
+
+	def test_save_and_load(self):
+		path = self.write_file("scan.dsox", fixtures.compress(self.data))
+		index = deflate_index.load_or_build_checkpoints(path, SPAN)
+		self.assertEqual(index.path, deflate_index.checkpoint_path(path))
+		self.assertTrue(os.path.exists(index.path))
+		loaded = deflate_index.load_or_build_checkpoints(path, SPAN)
+		self.assertEqual([(p.out, p.inp, p.bits, p.window) for p in loaded.points], [(p.out, p.inp, p.bits, p.window) for p in index.points])
+		self._check_reads(path, loaded)
+
+	def test_truncated_index_is_rebuilt(self):
+		path = self.write_file("scan.dsox", fixtures.compress(self.data))
+		with open(deflate_index.checkpoint_path(path), "wb") as f:
+			f.write(b"not an index")
+		index = deflate_index.load_or_build_checkpoints(path, SPAN)
+		self.assertTrue(len(index) > 4)
+		self._check_reads(path, index)
+
+if __name__ == "__main__":
+	unittest.main()
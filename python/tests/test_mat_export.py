@@ -0,0 +1,79 @@
+#Tests of mat_export.py : consolidated MAT files read back with scipy.io.loadmat().
+
+import os
+import unittest
+import numpy as np
+import fixtures
+import mat_export
+import psd_convert
+import wire_format
+
+try:
+	import scipy.io
+except ImportError:
+	scipy = None
+
+@unittest.skipUnless(scipy is not None, "SciPy not installed")
+class ConsolidatedMatWriterTest(fixtures.TempDirMixin, unittest.TestCase):
+
+	def test_psd(self):
+		scan = fixtures.scan_file(blocks=12, bins=100)
+		for compress in (False, True):
+			path = os.path.join(self.directory, "scan.mat")
+			mat_writer = mat_export.PsdMatWriter(path, compress)
+			for number, data_block in enumerate(scan.SpectralPsdData, 1):
+				db_data = psd_convert.q7_to_decibel(np.array(data_block.OutputDataPoints, np.int16))
+				mat_writer.add_block(number, data_block.Time_stamp.value * 60, data_block, db_data)
+			mat_writer.close()
+
+			mat = scipy.io.loadmat(path)
+			self.assertEqual(mat["data"].shape, (100, 12))
+			self.assertEqual(mat["data"].dtype, np.float32)
+			for number, data_block in enumerate(scan.SpectralPsdData):
+				db_data = psd_convert.q7_to_decibel(np.array(data_block.OutputDataPoints, np.int16))
+				np.testing.assert_array_equal(mat["data"][:, number], db_data.astype(np.float32))
+			np.testing.assert_array_equal(mat["cnt"], [range(1, 13)])
+			np.testing.assert_array_equal(mat["timestamp"], [[data_block.Time_stamp.value * 60 for data_block in scan.SpectralPsdData]])
+			np.testing.assert_array_equal(mat["start_freq"], [[470e6] * 12])
+			np.testing.assert_array_equal(mat["end_freq"], [[698e6] * 12])
+			np.testing.assert_array_equal(mat["reading_kind"], [[data_block.Reading_Kind for data_block in scan.SpectralPsdData]])
+			#(the spool files are removed)
+			self.assertEqual(os.listdir(self.directory), ["scan.mat"])
+
+	def test_iq(self):
+		raw_iq = fixtures.raw_iq_file(blocks=4, samples=300)
+		for complex_dtype in (wire_format.IQ_COMPLEX_DTYPE, wire_format.IQ_COMPLEX64_DTYPE):
+			for compress in (False, True):
+				path = os.path.join(self.directory, "iq.mat")
+				mat_writer = mat_export.IqMatWriter(path, compress)
+				expected = []
+				for number, data_block in enumerate(raw_iq.SpectralIqData, 1):
+					samples = wire_format.IqDataBlock(data_block, np.array(data_block.DataPoints)).complex_samples(complex_dtype)
+					expected.append(samples)
+					mat_writer.add_block(number, number * 10.0, data_block, samples)
+				mat_writer.close()
+
+				mat = scipy.io.loadmat(path)
+				self.assertEqual(mat["data"].dtype, complex_dtype)
+				np.testing.assert_array_equal(mat["data"], np.array(expected).T)
+				np.testing.assert_array_equal(mat["cnt"], [range(1, 5)])
+				np.testing.assert_array_equal(mat["timestamp"], [[10.0, 20.0, 30.0, 40.0]])
+				np.testing.assert_array_equal(mat["freq"], [[data_block.CenterFrequencyHz for data_block in raw_iq.SpectralIqData]])
+
+	def test_variable_size_limit(self):
+		#the 4 GB limit (lowered here) is checked as the blocks are added, not when the file is written.
+		limit = mat_export._MAX_ELEMENT_SIZE
+		mat_export._MAX_ELEMENT_SIZE = 10000
+		try:
+			mat_writer = mat_export.PsdMatWriter(os.path.join(self.directory, "scan.mat"))
+			data_block = fixtures.scan_file(blocks=1).SpectralPsdData[0]
+			with self.assertRaises(ValueError):
+				for number in range(1, 100):
+					mat_writer.add_block(number, 0, data_block, np.zeros(1000, np.float32))
+			self.assertTrue(number > 1)
+			mat_writer.close()
+		finally:
+			mat_export._MAX_ELEMENT_SIZE = limit
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,86 @@
+#Tests of psd_stats.py : streaming / merged / saved statistics against NumPy statistics of all the dB values at once.
+
+import os
+import unittest
+import warnings
+import numpy as np
+import fixtures
+import psd_convert
+import psd_cube
+import psd_stats
+
+#dB values of the blocks of each ReadingKind, decoded by psdFile_pb2 (blocks x bins).
+def _decibel_by_kind(scan):
+	values = {}
+	for data_block in scan.SpectralPsdData:
+		values.setdefault(data_block.Reading_Kind, []).append(psd_convert.q7_to_decibel(np.array(data_block.OutputDataPoints, np.int16)))
+	return dict((reading_kind, np.array(blocks)) for reading_kind, blocks in values.items())
+
+class PsdStatisticsTest(fixtures.TempDirMixin, unittest.TestCase):
+
+	def setUp(self):
+		fixtures.TempDirMixin.setUp(self)
+		self.scan = fixtures.scan_file(blocks=60, bins=128)
+		self.expected = _decibel_by_kind(self.scan)
+
+	#Check the statistics of each ReadingKind against NumPy (NaN values, the -32768 sentinel, left out).
+	def _check(self, statistics):
+		self.assertEqual(sorted(statistics.kinds), sorted(self.expected))
+		for reading_kind, db_data in self.expected.items():
+			stats = statistics.get(reading_kind)
+			self.assertEqual(stats.start_freq, 470e6)
+			self.assertEqual(stats.stop_freq, 698e6)
+			count = (~np.isnan(db_data)).sum(axis=0)
+			np.testing.assert_array_equal(stats.count, count)
+			with warnings.catch_warnings():
+				warnings.simplefilter("ignore", RuntimeWarning)		#(bins of NaN values only)
+				np.testing.assert_allclose(stats.average(), np.nanmean(db_data, axis=0), rtol=1e-12)
+				np.testing.assert_allclose(stats.variance(), np.nanvar(db_data, axis=0), rtol=1e-9)
+				np.testing.assert_allclose(stats.std(1), np.nanstd(db_data, axis=0, ddof=1), rtol=1e-9)
+				#(the minimum / maximum of a bin without values stay at +inf / -inf)
+				np.testing.assert_array_equal(stats.min, np.where(count > 0, np.nanmin(db_data, axis=0), np.inf))
+				np.testing.assert_array_equal(stats.max, np.where(count > 0, np.nanmax(db_data, axis=0), -np.inf))
+
+	def test_single_pass(self):
+		statistics = psd_stats.PsdStatistics()
+		for data_block in self.scan.SpectralPsdData:
+			statistics.add_block(data_block)
+		self._check(statistics)
+		self.assertTrue(np.isnan(statistics.get(0).average()[1]))		#bin of NaN values only
+
+	def test_merge(self):
+		#statistics of the blocks in uneven parts, merged, equal the statistics of all the blocks.
+		parts = [psd_stats.PsdStatistics() for i in range(3)]
+		for number, data_block in enumerate(self.scan.SpectralPsdData):
+			parts[0 if number < 5 else 1 if number < 40 else 2].add_block(data_block)
+		statistics = psd_stats.PsdStatistics()
+		for part in parts:
+			statistics.merge(part)
+		self._check(statistics)
+
+	def test_cube(self):
+		path = self.write_file("scan.uncompressed", self.scan.SerializeToString())
+		statistics = psd_stats.PsdStatistics()
+		statistics.add_cube(psd_cube.PsdCube.from_file(path))
+		self._check(statistics)
+
+	def test_save_and_load(self):
+		path = self.write_file("scan.dsox", fixtures.compress(self.scan.SerializeToString()))
+		statistics = psd_stats.aggregate_file(path)
+		self._check(statistics)
+		state = os.path.join(self.directory, "station.npz")
+		statistics.save(state)
+		loaded = psd_stats.PsdStatistics.load(state)
+		self._check(loaded)
+		self.assertEqual(loaded.sources, [psd_stats.source_key(path)])
+
+	def test_frequency_range_mismatch(self):
+		statistics = psd_stats.PsdStatistics()
+		data_block = self.scan.SpectralPsdData[0]
+		statistics.add_block(data_block)
+		data_block.StopFrequencyHz = 600e6
+		with self.assertRaises(ValueError):
+			statistics.add_block(data_block)
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,89 @@
+#Tests of stream_decompress.py : chunked decompression against zlib.decompress(), truncated streams, format sniffing.
+
+import io
+import os
+import unittest
+import zlib
+import fixtures
+import stream_decompress
+
+class IterDecompressTest(fixtures.TempDirMixin, unittest.TestCase):
+
+	def setUp(self):
+		fixtures.TempDirMixin.setUp(self)
+		self.data = fixtures.scan_file(blocks=60, bins=512).SerializeToString()
+
+	def test_matches_zlib_decompress(self):
+		for wbits in (-15, 15, 31):
+			compressed = fixtures.compress(self.data, wbits)
+			self.assertEqual(zlib.decompress(compressed, wbits), self.data)
+			#small compressed and decompressed chunks, so that both loops run many times.
+			chunks = list(stream_decompress.iter_decompress(io.BytesIO(compressed), 1000, 4096, wbits))
+			self.assertEqual(b"".join(chunks), self.data)
+			self.assertTrue(max(len(chunk) for chunk in chunks) <= 4096)
+
+	def test_trailing_data_is_ignored(self):
+		compressed = fixtures.compress(self.data) + b"trailing bytes"
+		self.assertEqual(b"".join(stream_decompress.iter_decompress(io.BytesIO(compressed), 1000)), self.data)
+
+	def test_truncated_stream_raises(self):
+		compressed = fixtures.compress(self.data)
+		for size in (len(compressed) // 2, len(compressed) - 1):
+			with self.assertRaises(zlib.error):
+				b"".join(stream_decompress.iter_decompress(io.BytesIO(compressed[:size]), 1000))
+
+	def test_decompress_file_removes_partial_output(self):
+		compressed = fixtures.compress(self.data)
+		in_path = self.write_file("scan.dsox", compressed[:len(compressed) // 2])
+		out_path = os.path.join(self.directory, "scan.uncompressed")
+		with self.assertRaises(zlib.error):
+			stream_decompress.decompress_file(in_path, out_path, 1000)
+		self.assertFalse(os.path.exists(out_path))
+
+		in_path = self.write_file("scan.dsox", compressed)
+		stats = stream_decompress.decompress_file(in_path, out_path, 1000)
+		with open(out_path, "rb") as f:
+			self.assertEqual(f.read(), self.data)
+		self.assertEqual(stats.bytes_out, len(self.data))
+
+class InflateReaderTest(unittest.TestCase):
+
+	def test_read_skip_seek(self):
+		data = fixtures.raw_iq_file(blocks=3).SerializeToString()
+		reader = stream_decompress.InflateReader(io.BytesIO(fixtures.compress(data)), 1000, 4096)
+		self.assertEqual(reader.read(10), data[:10])
+		self.assertEqual(reader.skip(5000), 5000)
+		self.assertEqual(reader.tell(), 5010)
+		reader.seek(9000)
+		self.assertEqual(reader.read(7000), data[9000:16000])
+		with self.assertRaises(ValueError):
+			reader.seek(100)
+		self.assertEqual(reader.read(), data[16000:])
+		self.assertEqual(reader.read(1), b"")
+
+class SniffFormatTest(fixtures.TempDirMixin, unittest.TestCase):
+
+	def test_formats(self):
+		data = fixtures.scan_file().SerializeToString()
+		paths = {
+			stream_decompress.FORMAT_PROTOBUF : self.write_file("scan.uncompressed", data),
+			stream_decompress.FORMAT_RAW_DEFLATE : self.write_file("scan.dsox", fixtures.compress(data)),
+			stream_decompress.FORMAT_ZLIB : self.write_file("scan.zlib", fixtures.compress(data, 15)),
+			stream_decompress.FORMAT_GZIP : self.write_gzip("scan.gz", data),
+		}
+		for fmt, path in paths.items():
+			f_stream, input_format = stream_decompress.open_data_stream(path)
+			try:
+				self.assertEqual(input_format, fmt)
+				self.assertEqual(f_stream.read(), data)
+			finally:
+				f_stream.close()
+
+	def test_unrecognized_input(self):
+		with self.assertRaises(ValueError):
+			stream_decompress.sniff_format(b"")
+		with self.assertRaises(ValueError):
+			stream_decompress.sniff_format(b"\xff\xff\xff\xff not a data file")
+
+if __name__ == "__main__":
+	unittest.main()
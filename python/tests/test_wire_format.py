@@ -0,0 +1,121 @@
+#Tests of wire_format.py : streaming readers and the vectorized decoders, against the psdFile_pb2 / rawIQ_pb2 classes.
+
+import io
+import unittest
+import numpy as np
+import fixtures
+import psdFile_pb2
+import rawIQ_pb2
+import stream_decompress
+import wire_format
+
+#Reader of serialized data : plain, or inflated from raw deflate.
+def _stream(data, compressed=False):
+	if compressed:
+		return stream_decompress.InflateReader(io.BytesIO(fixtures.compress(data)), 1000, 4096)
+	return stream_decompress.FileReader(io.BytesIO(data))
+
+#Fields of a data block other than its data points.
+def _metadata(data_block, data_field):
+	meta = type(data_block)()
+	meta.CopyFrom(data_block)
+	meta.ClearField(data_field)
+	return meta
+
+class ScanFileReaderTest(unittest.TestCase):
+
+	def test_matches_pb2(self):
+		scan = fixtures.scan_file(blocks=20, bins=300)
+		data = scan.SerializeToString()
+		for compressed in (False, True):
+			reader = wire_format.ScanFileReader(_stream(data, compressed))
+			self.assertEqual(reader.Config, scan.Config)
+			data_blocks = list(reader.SpectralPsdData)
+			self.assertEqual(len(data_blocks), len(scan.SpectralPsdData))
+			for number, (data_block, expected) in enumerate(zip(data_blocks, scan.SpectralPsdData), 1):
+				self.assertEqual(data_block.block_number, number)
+				self.assertEqual(data_block.meta, _metadata(expected, "OutputDataPoints"))
+				self.assertEqual(data_block.OutputDataPoints.dtype, wire_format.PSD_DTYPE)
+				np.testing.assert_array_equal(data_block.OutputDataPoints, expected.OutputDataPoints)
+
+	def test_config_after_blocks(self):
+		#Config is a top-level field like the others : it may come after the data blocks.
+		scan = fixtures.scan_file(blocks=3)
+		blocks_only = psdFile_pb2.ScanFile()
+		blocks_only.SpectralPsdData.extend(scan.SpectralPsdData)
+		config_only = psdFile_pb2.ScanFile()
+		config_only.Config.CopyFrom(scan.Config)
+		reader = wire_format.ScanFileReader(_stream(blocks_only.SerializeToString() + config_only.SerializeToString()))
+		self.assertEqual(len(list(reader.SpectralPsdData)), 3)
+		self.assertEqual(reader.Config, scan.Config)
+
+class RawIqFileReaderTest(unittest.TestCase):
+
+	def test_matches_pb2(self):
+		raw_iq = fixtures.raw_iq_file(blocks=4, samples=500)
+		data = raw_iq.SerializeToString()
+		for compressed in (False, True):
+			reader = wire_format.RawIqFileReader(_stream(data, compressed))
+			self.assertEqual(reader.Config, raw_iq.Config)
+			data_blocks = list(reader.SpectralIqData)
+			self.assertEqual(len(data_blocks), len(raw_iq.SpectralIqData))
+			for data_block, expected in zip(data_blocks, raw_iq.SpectralIqData):
+				self.assertEqual(data_block.meta, _metadata(expected, "DataPoints"))
+				np.testing.assert_array_equal(data_block.DataPoints, expected.DataPoints)
+				samples = data_block.complex_samples()
+				np.testing.assert_array_equal(samples.real, expected.DataPoints[0::2])
+				np.testing.assert_array_equal(samples.imag, expected.DataPoints[1::2])
+				np.testing.assert_array_equal(wire_format.iq_values(samples), data_block.DataPoints)
+				samples64 = data_block.complex_samples(wire_format.IQ_COMPLEX64_DTYPE)
+				np.testing.assert_array_equal(samples64, samples.astype(np.complex64))
+
+	def test_odd_data_point_count(self):
+		data_block = wire_format.IqDataBlock(rawIQ_pb2.SpectralIqDataBlock(), np.zeros(3))
+		with self.assertRaises(ValueError):
+			data_block.complex_samples()
+
+class DecodePackedSint32Test(unittest.TestCase):
+
+	#Decode the packed OutputDataPoints of a block serialized by psdFile_pb2.
+	def _decode(self, values):
+		data_block = psdFile_pb2.SpectralPsdDataBlock()
+		data_block.OutputDataPoints.extend(int(v) for v in values)
+		payload = data_block.SerializeToString()
+		meta_bytes, data_ranges = wire_format.split_block(payload, wire_format.FIELD_PSD_DATA_POINTS)
+		self.assertEqual(len(data_ranges), 1)
+		start, end, wire_type = data_ranges[0]
+		return wire_format.decode_packed_sint32(payload, start, end)
+
+	def test_uniform_length(self):
+		#same varint length for every value (fast path) : 1, 2 and 3 bytes.
+		for low, high in ((-64, 64), (-8192, -64), (8192, 1 << 20)):
+			values = np.random.RandomState(2).randint(low, high, 1000)
+			np.testing.assert_array_equal(self._decode(values), values)
+
+	def test_mixed_lengths(self):
+		rng = np.random.RandomState(3)
+		values = np.concatenate([rng.randint(-2 ** 31, 2 ** 31 - 1, 500), rng.randint(-100, 100, 500)])
+		values = np.concatenate([values, [0, -1, 1, -2 ** 31, 2 ** 31 - 1, -32768, 32767]])
+		rng.shuffle(values)
+		np.testing.assert_array_equal(self._decode(values), values)
+
+	def test_empty_and_truncated(self):
+		self.assertEqual(len(wire_format.decode_packed_sint32(b"")), 0)
+		with self.assertRaises(ValueError):
+			wire_format.decode_packed_sint32(b"\x02\x81")
+
+class VarintTest(unittest.TestCase):
+
+	def test_round_trip(self):
+		buf = b"".join(wire_format.encode_varint(v) for v in (0, 1, 127, 128, 300, 2 ** 32, 2 ** 63 - 1))
+		pos = 0
+		values = []
+		while pos < len(buf):
+			value, pos = wire_format.decode_varint(buf, pos)
+			values.append(value)
+		self.assertEqual(values, [0, 1, 127, 128, 300, 2 ** 32, 2 ** 63 - 1])
+		with self.assertRaises(ValueError):
+			wire_format.decode_varint(b"\x80\x80", 0)
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,621 @@
+#!/usr/bin/env python
+
+#Incremental (streaming) protobuf wire-format readers for CityScape PSD scan files (ScanFile) and
+#RAW IQ files (RawIqFile).
+#Both file types are a single top-level message with one Config field (field 1) and a repeated
+#data block field (field 2). Instead of parsing the whole file with ParseFromString(), the readers
+#below walk the top-level fields one by one and parse each data block only when it is requested,
+#so the peak memory is about one data block and processing starts right after the first block has been read.
+#Data blocks are split at the wire level: the packed data points (OutputDataPoints / DataPoints) are
+#decoded into NumPy arrays straight from the block bytes, and only the small metadata fields go
+#through the protobuf runtime.
+
+#Usage (library) :
+#	reader, fmt = stream_decompress.open_data_stream(path)
+#	scan_file = wire_format.ScanFileReader(reader)
+#	print scan_file.Config
+#	for data_block in scan_file.SpectralPsdData: ...	#data_block.OutputDataPoints is a numpy array
+#or
+#	for data_block in wire_format.RawIqFileReader(reader).SpectralIqData: ...	#data_block.DataPoints is a numpy array
+#Requirements: Python 2.7 with Protoc Python bindings and NumPy. psdFile_pb2.py and rawIQ_pb2.py must be present in the same directory.
+
+#See: https://developers.google.com/protocol-buffers/docs/encoding
+
+import numpy as np
+import psdFile_pb2
+import rawIQ_pb2
+
+#Protobuf wire types.
+WIRETYPE_VARINT = 0
+WIRETYPE_FIXED64 = 1
+WIRETYPE_LENGTH_DELIMITED = 2
+WIRETYPE_FIXED32 = 5
+
+#Top-level field numbers shared by ScanFile and RawIqFile.
+FIELD_CONFIG = 1
+FIELD_DATA_BLOCK = 2
+
+#Field numbers of the packed data points in SpectralPsdDataBlock and SpectralIqDataBlock.
+FIELD_PSD_DATA_POINTS = 5
+FIELD_IQ_DATA_POINTS = 4
+
+#dtype of the decoded PSD data points (Q7 fixed-point values are int16 on the station side).
+PSD_DTYPE = np.dtype(np.int16)
+
+#Wire dtype of packed doubles (little-endian IEEE754 double), and of I/Q pairs of them.
+IQ_WIRE_DTYPE = np.dtype("<f8")
+IQ_COMPLEX_DTYPE = np.dtype("<c16")
+
+#Single-precision I/Q pairs (half the memory of IQ_COMPLEX_DTYPE), see IqDataBlock.complex_samples().
+IQ_COMPLEX64_DTYPE = np.dtype("<c8")
+IQ_COMPLEX_DTYPES = [IQ_COMPLEX_DTYPE, IQ_COMPLEX64_DTYPE]
+
+#Byte value at buf[pos] (buf : str / bytes / memoryview), as an integer.
+if bytes is str:	#Python 2
+	def _byte(buf, pos):
+		return ord(buf[pos])
+else:
+	def _byte(buf, pos):
+		return buf[pos]
+
+#Timestamp.TimeSpanScale -> seconds per unit (see psdFile.proto / rawIQ.proto).
+TIMESCALE_SECONDS = {0 : 86400, 1 : 3600, 2 : 60, 3 : 1, 4 : 1.0/1000, 5 : 1.0/10000000}
+
+#Convert a Timestamp message into a POSIX timestamp (seconds).
+def timestamp_seconds(time_stamp):
+	if time_stamp.scale not in TIMESCALE_SECONDS:
+		raise Exception('Unexpected timestamp scale.')
+	return time_stamp.value * TIMESCALE_SECONDS[time_stamp.scale]
+
+#Read a base-128 varint from a stream.
+#input : stream with a read() method (file, stream_decompress.InflateReader, ...)
+#output : (integer value, number of bytes read), or (None, 0) if the stream ended before the first byte.
+def read_varint_counted(stream):
+	value = 0
+	shift = 0
+	while True:
+		b = stream.read(1)
+		if not b:
+			if shift == 0:
+				return None, 0
+			raise ValueError("Truncated varint.")
+		b = ord(b)
+		value |= (b & 0x7f) << shift
+		if not b & 0x80:
+			return value, shift // 7 + 1
+		shift += 7
+		if shift >= 64:
+			raise ValueError("Malformed varint.")
+
+#Read a base-128 varint from a stream.
+#output : integer value, or None if the stream ended before the first byte.
+def read_varint(stream):
+	return read_varint_counted(stream)[0]
+
+#Encode a non-negative integer as a base-128 varint.
+def encode_varint(value):
+	out = bytearray()
+	while value > 0x7f:
+		out.append((value & 0x7f) | 0x80)
+		value >>= 7
+	out.append(value)
+	return bytes(out)
+
+#Copy of a (small) slice of a buffer as bytes (slices of memoryviews are views).
+def _as_bytes(part):
+	if isinstance(part, memoryview):
+		return part.tobytes()
+	return part
+
+#Decode a base-128 varint at buf[pos].
+#output : (value, position after the varint)
+def decode_varint(buf, pos):
+	value = 0
+	shift = 0
+	while True:
+		if pos >= len(buf):
+			raise ValueError("Truncated varint.")
+		b = _byte(buf, pos)
+		pos += 1
+		value |= (b & 0x7f) << shift
+		if not b & 0x80:
+			return value, pos
+		shift += 7
+		if shift >= 64:
+			raise ValueError("Malformed varint.")
+
+#Walk the fields of a serialized message.
+#input : serialized message
+#output : generator of (field start, tag, value start, field end)
+def iter_fields(payload):
+	pos = 0
+	while pos < len(payload):
+		field_start = pos
+		tag, pos = decode_varint(payload, pos)
+		wire_type = tag & 0x07
+		if wire_type == WIRETYPE_VARINT:
+			value_start = pos
+			_, pos = decode_varint(payload, pos)
+		elif wire_type == WIRETYPE_FIXED64:
+			value_start = pos
+			pos += 8
+		elif wire_type == WIRETYPE_LENGTH_DELIMITED:
+			length, value_start = decode_varint(payload, pos)
+			pos = value_start + length
+		elif wire_type == WIRETYPE_FIXED32:
+			value_start = pos
+			pos += 4
+		else:
+			raise ValueError("Unsupported wire type : " + str(wire_type))
+		if pos > len(payload):
+			raise ValueError("Truncated data block.")
+		yield field_start, tag, value_start, pos
+
+#Field numbers present in a serialized message.
+#output : set of field numbers
+def field_numbers(payload):
+	return set(tag >> 3 for field_start, tag, value_start, end in iter_fields(payload))
+
+#Split a serialized data block into its metadata fields and one (packed) data field, without copying the data.
+#input : serialized message, field number of the data field.
+#output : (serialized message without the data field, list of (start, end, wire type) of the data field values)
+def split_block(payload, data_field):
+	meta_parts = []
+	data_ranges = []
+	for field_start, tag, value_start, end in iter_fields(payload):
+		if tag >> 3 == data_field:
+			data_ranges.append((value_start, end, tag & 0x07))
+		else:
+			meta_parts.append(_as_bytes(payload[field_start:end]))
+	return b"".join(meta_parts), data_ranges
+
+#NumPy view of the values of a packed (or unpacked) fixed-size data field.
+#A single packed value (the usual case) is returned as a view of the payload (no copy).
+#input : payload, data ranges from split_block(), wire dtype of the values.
+#output : 1-D numpy array (read-only if it is a view).
+def fixed_field_array(payload, data_ranges, dtype):
+	arrays = [np.frombuffer(payload, dtype, (end - start) // dtype.itemsize, start) for start, end, wire_type in data_ranges]
+	if len(arrays) == 1:
+		return arrays[0]
+	if len(arrays) == 0:
+		return np.zeros(0, dtype)
+	return np.concatenate(arrays)
+
+#Decode a packed repeated sint32 field (zigzag-encoded varints) with a few vectorized passes.
+#Fast path : when every varint has the same length (e.g. all Q7 PSD values below -64dB take 3 bytes),
+#the bytes are simply reshaped into (count, length) and combined column by column.
+#Otherwise the values are assembled from at most 5 byte columns selected by the varint lengths.
+#input : buffer (str / bytes / memoryview / mmap), start and end position of the packed values, output dtype.
+#output : 1-D numpy array of the decoded values.
+def decode_packed_sint32(buf, start=0, end=None, dtype=np.int32):
+	if end is None:
+		end = len(buf)
+	raw = np.frombuffer(buf, np.uint8, end - start, start)
+	if raw.size == 0:
+		return np.zeros(0, dtype)
+	if raw[-1] & 0x80:
+		raise ValueError("Truncated packed varint field.")
+
+	#the last byte of every varint has its MSB cleared.
+	last = np.flatnonzero(raw < 0x80)
+	count = last.size
+	septets = (raw & 0x7f).astype(np.uint32)
+
+	length = raw.size // count
+	if length <= 5 and raw.size == count * length and (raw[length - 1::length] < 0x80).all():
+		#uniform varint length (fast path) : every row of "length" bytes ends with a terminating byte,
+		#and there are exactly "count" terminating bytes, so each row is one varint.
+		columns = septets.reshape(count, length)
+		values = columns[:, 0].copy()
+		for k in range(1, length):
+			values |= columns[:, k] << (7 * k)
+	else:
+		first = np.empty(count, np.intp)
+		first[0] = 0
+		first[1:] = last[:-1] + 1
+		lengths = last - first + 1
+		if lengths.max() > 5:
+			raise ValueError("Malformed sint32 varint (more than 5 bytes).")
+		values = septets[first]
+		for k in range(1, int(lengths.max())):
+			sel = np.flatnonzero(lengths > k)
+			values[sel] |= septets[first[sel] + k] << (7 * k)
+
+	#zigzag decoding : (n >> 1) ^ -(n & 1), computed in uint32 and reinterpreted as int32.
+	values = (values >> 1) ^ (np.uint32(0) - (values & 1))
+	return values.view(np.int32).astype(dtype, copy=False)
+
+#Read exactly "size" bytes from a stream.
+def read_exact(stream, size):
+	data = stream.read(size)
+	if len(data) != size:
+		raise ValueError("Truncated data (expected %d bytes, got %d)." % (size, len(data)))
+	return data
+
+#Skip exactly "size" bytes of a stream (uses the stream's skip() if it has one).
+def skip_exact(stream, size):
+	if hasattr(stream, "skip"):
+		skipped = stream.skip(size)
+	else:
+		skipped = len(stream.read(size))
+	if skipped != size:
+		raise ValueError("Truncated data (expected %d bytes, got %d)." % (size, skipped))
+
+#Skip the value of a field whose tag has already been read.
+#input : stream, wire type of the field.
+def skip_field(stream, wire_type):
+	if wire_type == WIRETYPE_VARINT:
+		read_varint(stream)
+	elif wire_type == WIRETYPE_FIXED64:
+		skip_exact(stream, 8)
+	elif wire_type == WIRETYPE_LENGTH_DELIMITED:
+		skip_exact(stream, read_varint(stream))
+	elif wire_type == WIRETYPE_FIXED32:
+		skip_exact(stream, 4)
+	else:
+		raise ValueError("Unsupported wire type : " + str(wire_type))
+
+#Read the value of a field whose tag has already been read, in its wire encoding (including the length prefix).
+#input : stream, wire type of the field.
+#output : encoded value (bytes)
+def read_field_value(stream, wire_type):
+	if wire_type == WIRETYPE_VARINT:
+		value = read_varint(stream)
+		if value is None:
+			raise ValueError("Truncated varint.")
+		return encode_varint(value)
+	elif wire_type == WIRETYPE_FIXED64:
+		return read_exact(stream, 8)
+	elif wire_type == WIRETYPE_LENGTH_DELIMITED:
+		length = read_varint(stream)
+		return encode_varint(length) + read_exact(stream, length)
+	elif wire_type == WIRETYPE_FIXED32:
+		return read_exact(stream, 4)
+	raise ValueError("Unsupported wire type : " + str(wire_type))
+
+#Count the values of a packed varint field (one terminating byte per value) without decoding them.
+#The field is still read from the stream, in chunks.
+#input : stream positioned at the packed values, size of the packed values (bytes).
+#output : number of values.
+def count_packed_varints(stream, size):
+	count = 0
+	while size > 0:
+		chunk = read_exact(stream, min(size, 1 << 20))
+		count += int(np.count_nonzero(np.frombuffer(chunk, np.uint8) < 0x80))
+		size -= len(chunk)
+	return count
+
+#Count the values of a packed double field from its size; the values are skipped, not read.
+def count_packed_doubles(stream, size):
+	skip_exact(stream, size)
+	return size // IQ_WIRE_DTYPE.itemsize
+
+#Skip a packed field without counting its values (always returns 0).
+def skip_packed_values(stream, size):
+	skip_exact(stream, size)
+	return 0
+
+#Metadata of one data block, read by ProtoFileReader.iter_block_metadata() without decoding its data points.
+class BlockMetadata:
+
+	def __init__(self, offset, length, meta, data_offset, data_length, value_count):
+		self.offset = offset				#offset of the serialized block in the decompressed stream
+		self.length = length				#length of the serialized block (bytes)
+		self.meta = meta					#block message without its data points (Time_stamp, frequencies, ...)
+		self.data_offset = data_offset		#offset of the packed data points (None if the block has none)
+		self.data_length = data_length		#length of the packed data points (bytes)
+		self.value_count = value_count		#number of values in the packed data points
+
+#Read the fields of one data block from a stream, except its data points (which are skipped, or only counted).
+#input : stream positioned at the start of the serialized block, block length, field number of the data points,
+#        function counting the packed values (count_packed_varints / count_packed_doubles).
+#output : (serialized block without the data points, data offset, data length, number of values)
+def read_block_meta(stream, length, data_field, count_values):
+	meta_parts = []
+	data_offset = None
+	data_length = 0
+	value_count = 0
+	pos = 0
+	while pos < length:
+		tag, size = read_varint_counted(stream)
+		if tag is None:
+			raise ValueError("Truncated data block.")
+		pos += size
+		wire_type = tag & 0x07
+		if tag >> 3 == data_field and wire_type == WIRETYPE_LENGTH_DELIMITED:
+			data_size, size = read_varint_counted(stream)
+			pos += size
+			if data_offset is None and hasattr(stream, "tell"):
+				data_offset = stream.tell()
+			value_count += count_values(stream, data_size)
+			data_length += data_size
+			pos += data_size
+		elif tag >> 3 == data_field:
+			#unpacked data point
+			value = read_field_value(stream, wire_type)
+			value_count += 1
+			pos += len(value)
+		else:
+			value = read_field_value(stream, wire_type)
+			meta_parts.append(encode_varint(tag) + value)
+			pos += len(value)
+	if pos != length:
+		raise ValueError("Malformed data block (field overruns the block).")
+	return b"".join(meta_parts), data_offset, data_length, value_count
+
+#Read the fields of one data block that come before its data points (Time_stamp, frequencies, Reading_Kind in the
+#files written by the stations), so that a block filter can be checked before the rest of the block is read.
+#input : stream positioned at the start of the serialized block, block length, field number of the data points.
+#output : (bytes read, including the tag of the data field if it was reached; length of the leading fields in them)
+def read_block_head(stream, length, data_field):
+	parts = []
+	pos = 0
+	while pos < length:
+		tag, size = read_varint_counted(stream)
+		if tag is None:
+			raise ValueError("Truncated data block.")
+		if tag >> 3 == data_field:
+			head = b"".join(parts)
+			return head + encode_varint(tag), len(head)
+		value = read_field_value(stream, tag & 0x07)
+		parts.append(encode_varint(tag) + value)
+		pos += size + len(value)
+	head = b"".join(parts)
+	return head, len(head)
+
+#Walks the top-level fields of a ScanFile / RawIqFile stream.
+#Config is parsed as soon as it is encountered (it is the first field of the files written by the stations);
+#data blocks are parsed one at a time while iterating.
+#With a block filter (see block_filter.py), the data blocks that do not match it are skipped : only the fields
+#before their data points are read.
+class ProtoFileReader(object):
+
+	#input : stream with a read() method, protobuf class of the Config field, protobuf class of the data blocks,
+	#        field number of the packed data points, function counting them (see read_block_meta()),
+	#        block filter (optional, object with a "fields" set of field numbers and a match(meta) method).
+	def __init__(self, stream, config_class, block_class, data_field, count_values, block_filter=None):
+		self.stream = stream
+		self.Config = config_class()
+		self.block_class = block_class
+		self.data_field = data_field
+		self.count_values = count_values
+		self.config_offset = None	#offset and length of the serialized Config in the decompressed stream.
+		self.config_length = 0
+		self.block_filter = block_filter
+		self.blocks_seen = 0		#number of data blocks encountered so far (matching the filter or not)
+		self._pending = None
+
+		#read Config right away if it comes first, so that it is available before the first data block.
+		header = self._next_header()
+		if header is not None and header[0] == FIELD_CONFIG and header[1] == WIRETYPE_LENGTH_DELIMITED:
+			self._read_config(read_varint(self.stream))
+		else:
+			self._pending = header
+
+	#Read (merge) a serialized Config of the given length.
+	def _read_config(self, length):
+		if hasattr(self.stream, "tell"):
+			self.config_offset = self.stream.tell()
+		self.config_length = length
+		self.Config.MergeFromString(read_exact(self.stream, length))
+
+	#Read the next top-level field tag.
+	#output : (field number, wire type), or None at the end of the stream.
+	def _next_header(self):
+		if self._pending is not None:
+			header = self._pending
+			self._pending = None
+			return header
+		tag = read_varint(self.stream)
+		if tag is None:
+			return None
+		return tag >> 3, tag & 0x07
+
+	#Read a data block that matches the block filter; skip it otherwise.
+	#input : block length, block offset in the decompressed stream (None if the stream cannot tell).
+	#output : payload bytes, or None if the block does not match.
+	def _read_filtered_block(self, length, offset):
+		head, meta_length = read_block_head(self.stream, length, self.data_field)
+		meta = self.block_class()
+		meta.ParseFromString(head[:meta_length])
+		if len(head) < length and not self.block_filter.fields.issubset(field_numbers(head[:meta_length])):
+			#some filtered field comes after the data points : read the whole block to check it.
+			payload = head + read_exact(self.stream, length - len(head))
+			meta.ParseFromString(split_block(payload, self.data_field)[0])
+			if self.block_filter.match(meta):
+				return payload
+			return None
+		if not self.block_filter.match(meta):
+			skip_exact(self.stream, length - len(head))
+			return None
+		if hasattr(self.stream, "read_view") and offset is not None:
+			self.stream.seek(offset)
+			return self.stream.read_view(length)
+		return head + read_exact(self.stream, length - len(head))
+
+	#Iterate over the serialized data blocks (those matching the block filter, if there is one).
+	#output : generator of (offset of the block payload in the decompressed stream, or None if the stream cannot tell; payload bytes)
+	def iter_block_payloads(self):
+		while True:
+			header = self._next_header()
+			if header is None:
+				return
+			field_number, wire_type = header
+			if wire_type != WIRETYPE_LENGTH_DELIMITED:
+				skip_field(self.stream, wire_type)
+				continue
+			length = read_varint(self.stream)
+			if field_number == FIELD_DATA_BLOCK:
+				self.blocks_seen += 1
+				offset = None
+				if hasattr(self.stream, "tell"):
+					offset = self.stream.tell()
+				if self.block_filter is not None:
+					payload = self._read_filtered_block(length, offset)
+					if payload is not None:
+						yield offset, payload
+				elif hasattr(self.stream, "read_view"):
+					#memory-mapped input : hand out a view of the block instead of a copy.
+					payload = self.stream.read_view(length)
+					if len(payload) != length:
+						raise ValueError("Truncated data (expected %d bytes, got %d)." % (length, len(payload)))
+					yield offset, payload
+				else:
+					yield offset, read_exact(self.stream, length)
+			elif field_number == FIELD_CONFIG:
+				#a Config field that does not come first; merged like ParseFromString() would.
+				self._read_config(length)
+			else:
+				skip_exact(self.stream, length)
+
+	#Iterate over the metadata of the data blocks (those matching the block filter, if there is one); the data points are skipped at the wire level
+	#(using their length prefix) or, for packed varints, only counted.
+	#input : function counting the packed values (optional, the reader's default is used if not given;
+	#        skip_packed_values skips them without counting).
+	#output : generator of BlockMetadata
+	def iter_block_metadata(self, count_values=None):
+		if count_values is None:
+			count_values = self.count_values
+		while True:
+			header = self._next_header()
+			if header is None:
+				return
+			field_number, wire_type = header
+			if wire_type != WIRETYPE_LENGTH_DELIMITED:
+				skip_field(self.stream, wire_type)
+				continue
+			length = read_varint(self.stream)
+			if field_number == FIELD_DATA_BLOCK:
+				self.blocks_seen += 1
+				offset = None
+				if hasattr(self.stream, "tell"):
+					offset = self.stream.tell()
+				meta_bytes, data_offset, data_length, value_count = read_block_meta(self.stream, length, self.data_field, count_values)
+				meta = self.block_class()
+				meta.ParseFromString(meta_bytes)
+				if self.block_filter is not None and not self.block_filter.match(meta):
+					continue
+				yield BlockMetadata(offset, length, meta, data_offset, data_length, value_count)
+			elif field_number == FIELD_CONFIG:
+				self._read_config(length)
+			else:
+				skip_exact(self.stream, length)
+
+	#Iterate over the data blocks, parsed one at a time.
+	#output : generator of block_class messages.
+	def iter_blocks(self):
+		for offset, payload in self.iter_block_payloads():
+			data_block = self.block_class()
+			data_block.ParseFromString(payload)
+			yield data_block
+
+	def __iter__(self):
+		return self.iter_blocks()
+
+#SpectralPsdDataBlock with its OutputDataPoints as a numpy int16 array (raw Q7 fixed-point values).
+#Every other field is read from the psdFile_pb2.SpectralPsdDataBlock "meta", which holds everything except OutputDataPoints.
+class PsdDataBlock(object):
+
+	def __init__(self, meta, data_points):
+		self.meta = meta
+		self.OutputDataPoints = data_points
+
+	def __getattr__(self, name):
+		return getattr(self.meta, name)
+
+#Parse a serialized SpectralPsdDataBlock.
+#input : serialized SpectralPsdDataBlock.
+#output : PsdDataBlock
+def parse_psd_block(payload):
+	meta_bytes, data_ranges = split_block(payload, FIELD_PSD_DATA_POINTS)
+	meta = psdFile_pb2.SpectralPsdDataBlock()
+	meta.ParseFromString(meta_bytes)
+	#(an unpacked value is a single varint, which decodes the same way as a packed field of one value)
+	arrays = [decode_packed_sint32(payload, start, end, PSD_DTYPE) for start, end, wire_type in data_ranges]
+	if len(arrays) == 1:
+		data_points = arrays[0]
+	elif len(arrays) == 0:
+		data_points = np.zeros(0, PSD_DTYPE)
+	else:
+		data_points = np.concatenate(arrays)
+	return PsdDataBlock(meta, data_points)
+
+#Streaming equivalent of psdFile_pb2.ScanFile.
+#Exposes "Config" and "SpectralPsdData" like the parsed message, but SpectralPsdData can only be iterated once.
+#The data blocks are PsdDataBlock objects, read one block at a time, with their 1-based "block_number".
+#parse_block decodes one serialized block (parse_psd_block by default; see decode_backends.py for the alternatives).
+class ScanFileReader(ProtoFileReader):
+
+	def __init__(self, stream, block_filter=None, parse_block=parse_psd_block):
+		ProtoFileReader.__init__(self, stream, psdFile_pb2.ConfigDataBlock, psdFile_pb2.SpectralPsdDataBlock, FIELD_PSD_DATA_POINTS, count_packed_varints, block_filter)
+		self.parse_block = parse_block
+
+	def iter_blocks(self):
+		for offset, payload in self.iter_block_payloads():
+			data_block = self.parse_block(payload)
+			data_block.block_number = self.blocks_seen
+			yield data_block
+
+	@property
+	def SpectralPsdData(self):
+		return self.iter_blocks()
+
+#SpectralIqDataBlock with its DataPoints as a numpy float64 array (I and Q interleaved, as on the wire).
+#The array is a view of the block bytes (or of the memory-mapped file), not a copy.
+#Every other field (Time_stamp, StartFrequencyHz, CenterFrequencyHz, ...) is read from the
+#rawIQ_pb2.SpectralIqDataBlock "meta", which holds everything except DataPoints.
+class IqDataBlock(object):
+
+	def __init__(self, meta, data_points):
+		self.meta = meta
+		self.DataPoints = data_points
+
+	def __getattr__(self, name):
+		return getattr(self.meta, name)
+
+	#I/Q pairs of DataPoints as complex values (I + jQ) : complex128, as a view of DataPoints (no copy), or
+	#complex64 (IQ_COMPLEX64_DTYPE), converted in one vectorized pass into a new array of half the size.
+	def complex_samples(self, dtype=IQ_COMPLEX_DTYPE):
+		if len(self.DataPoints) % 2 != 0:
+			raise ValueError("Odd number of IQ data points : " + str(len(self.DataPoints)))
+		samples = self.DataPoints.view(IQ_COMPLEX_DTYPE)
+		if np.dtype(dtype) == IQ_COMPLEX_DTYPE:
+			return samples
+		if np.dtype(dtype) not in IQ_COMPLEX_DTYPES:
+			raise ValueError("Unsupported complex dtype : " + str(dtype))
+		return samples.astype(dtype)
+
+#Interleaved I/Q values (I0, Q0, I1, Q1, ...) of complex samples, as a view (float64 for complex128, float32 for complex64).
+#input : complex array (IqDataBlock.complex_samples())
+#output : float array, twice as long
+def iq_values(samples):
+	return samples.view(samples.real.dtype)
+
+#Parse a serialized SpectralIqDataBlock.
+#input : serialized SpectralIqDataBlock.
+#output : IqDataBlock
+def parse_iq_block(payload):
+	meta_bytes, data_ranges = split_block(payload, FIELD_IQ_DATA_POINTS)
+	meta = rawIQ_pb2.SpectralIqDataBlock()
+	meta.ParseFromString(meta_bytes)
+	return IqDataBlock(meta, fixed_field_array(payload, data_ranges, IQ_WIRE_DTYPE))
+
+#Streaming equivalent of rawIQ_pb2.RawIqFile.
+#Exposes "Config" and "SpectralIqData" like the parsed message (SpectralIqData can only be iterated once).
+#The data blocks are IqDataBlock objects, read one snapshot at a time.
+#parse_block decodes one serialized block (parse_iq_block by default; see decode_backends.py for the alternatives).
+class RawIqFileReader(ProtoFileReader):
+
+	def __init__(self, stream, block_filter=None, parse_block=parse_iq_block):
+		ProtoFileReader.__init__(self, stream, rawIQ_pb2.ConfigDataBlock, rawIQ_pb2.SpectralIqDataBlock, FIELD_IQ_DATA_POINTS, count_packed_doubles, block_filter)
+		self.parse_block = parse_block
+
+	def iter_blocks(self):
+		for offset, payload in self.iter_block_payloads():
+			data_block = self.parse_block(payload)
+			data_block.block_number = self.blocks_seen
+			yield data_block
+
+	@property
+	def SpectralIqData(self):
+		return self.iter_blocks()